@@ -0,0 +1,116 @@
+"""
+asyncpg data-access layer for the /api/async/* endpoints.
+
+The queries in fast_api_app.py are written for psycopg2 (%s / %(name)s
+placeholders). `pg_query` rewrites them to asyncpg's $1..$n form so the sync
+and async endpoints share the same SQL.
+"""
+
+import asyncio
+import os
+import re
+from functools import lru_cache
+
+import asyncpg
+
+ASYNC_POOL_MIN = int(os.environ.get("ASYNC_DB_POOL_MIN", 2))
+ASYNC_POOL_MAX = int(os.environ.get("ASYNC_DB_POOL_MAX", 20))
+
+_pool = None
+_pool_lock = asyncio.Lock()
+
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+
+
+@lru_cache(maxsize=256)
+def _convert(sql):
+    """(asyncpg sql, ordered param keys) for a psycopg2-style query."""
+    names, positional = [], [0]
+
+    def sub(m):
+        if m.group(0) == "%%":
+            return "%"
+        if m.group(1):  # %(name)s: one $n per distinct name
+            if m.group(1) not in names:
+                names.append(m.group(1))
+            return f"${names.index(m.group(1)) + 1}"
+        positional[0] += 1
+        return f"${positional[0]}"
+
+    converted = _PLACEHOLDER.sub(sub, sql)
+    return converted, tuple(names)
+
+
+def pg_query(sql, params=()):
+    """Convert a psycopg2 query + params (sequence or dict) into asyncpg (sql, args)."""
+    converted, names = _convert(sql)
+    if isinstance(params, dict):
+        return converted, [params[name] for name in names]
+    return converted, list(params)
+
+
+def _connect_kwargs():
+    return dict(
+        host=os.environ.get("DB_HOST", "db"),
+        port=int(os.environ.get("DB_PORT", 5432)),
+        user=os.environ.get("DB_USER", "sbt"),
+        password=os.environ.get("DB_PASSWORD", "41998"),
+        database=os.environ.get("DB_NAME", "defensenews_webscraper"),
+    )
+
+
+async def get_async_pool():
+    """The process-wide asyncpg pool, created on first use."""
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                _pool = await asyncpg.create_pool(
+                    **_connect_kwargs(),
+                    min_size=ASYNC_POOL_MIN,
+                    max_size=ASYNC_POOL_MAX,
+                )
+    return _pool
+
+
+async def close_async_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+async def listen(channel, callback):
+    """
+    Dedicated connection (outside the pool) that calls callback(payload) for
+    every NOTIFY on channel. Close the returned connection to stop listening.
+    """
+    conn = await asyncpg.connect(**_connect_kwargs())
+    await conn.add_listener(channel, lambda _conn, _pid, _channel, payload: callback(payload))
+    return conn
+
+
+async def fetch(conn, sql, params=()):
+    return await conn.fetch(*_args(sql, params))
+
+
+async def fetchrow(conn, sql, params=()):
+    return await conn.fetchrow(*_args(sql, params))
+
+
+async def fetchval(conn, sql, params=()):
+    return await conn.fetchval(*_args(sql, params))
+
+
+async def execute(conn, sql, params=()):
+    return await conn.execute(*_args(sql, params))
+
+
+async def executemany(conn, sql, rows):
+    converted, _ = _convert(sql)
+    return await conn.executemany(converted, [list(row) for row in rows])
+
+
+def _args(sql, params):
+    converted, args = pg_query(sql, params)
+    return (converted, *args)
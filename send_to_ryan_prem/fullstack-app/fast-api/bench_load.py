@@ -0,0 +1,94 @@
+"""
+Load benchmark: sync (/api/...) vs. async (/api/async/...) endpoints.
+
+Start the backend with a single worker so the two modes compete for the same
+resources, e.g.
+    uvicorn fast_api_app:app --port 5000 --workers 1
+then run from the fast-api directory:
+    python bench_load.py --username test_EE_J0_1 --password password
+
+For each endpoint and concurrency level it fires --requests requests from
+that many concurrent clients and reports throughput, latency percentiles and
+errors for both modes.
+"""
+
+import argparse
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# name -> (method, sync path, async path, body)
+ENDPOINTS = {
+    "recommendations": ("POST", "/api/recommendations", "/api/async/recommendations", {"offset": 0, "limit": 20}),
+    "user_mab_stats": ("GET", "/api/user_mab_stats", "/api/async/user_mab_stats", None),
+    "mab_rank_logs": ("GET", "/api/mab_rank_logs", "/api/async/mab_rank_logs", None),
+}
+
+
+def request(base_url, method, path, token=None, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(base_url + path, data=data, method=method)
+    req.add_header("Content-Type", "application/json")
+    if token:
+        req.add_header("Authorization", token)
+    with urllib.request.urlopen(req, timeout=60) as resp:
+        return json.loads(resp.read() or b"null")
+
+
+def login(base_url, username, password):
+    return request(base_url, "POST", "/api/login", body={"username": username, "password": password})["session_token"]
+
+
+def timed_call(base_url, method, path, token, body):
+    start = time.perf_counter()
+    try:
+        request(base_url, method, path, token, body)
+        ok = True
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def run_level(base_url, method, path, token, body, concurrency, n_requests):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        results = list(pool.map(lambda _: timed_call(base_url, method, path, token, body), range(n_requests)))
+        elapsed = time.perf_counter() - start
+    latencies = sorted(lat for lat, ok in results if ok)
+    errors = sum(1 for _, ok in results if not ok)
+    if not latencies:
+        return n_requests / elapsed, float("nan"), float("nan"), errors
+    p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+    return len(latencies) / elapsed, statistics.median(latencies) * 1000, p95 * 1000, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--token", help="existing session token (otherwise --username/--password)")
+    parser.add_argument("--username")
+    parser.add_argument("--password")
+    parser.add_argument("--concurrency", default="1,10,50,100")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint, mode and level")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    args = parser.parse_args()
+
+    token = args.token or login(args.url, args.username, args.password)
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    header = f"{'endpoint':>16} | {'conc':>5} | {'mode':>5} | {'req/s':>8} | {'p50 ms':>8} | {'p95 ms':>8} | {'errors':>6}"
+    print(header)
+    print("-" * len(header))
+    for name in args.endpoints.split(","):
+        method, sync_path, async_path, body = ENDPOINTS[name]
+        for concurrency in levels:
+            for mode, path in (("sync", sync_path), ("async", async_path)):
+                rps, p50, p95, errors = run_level(args.url, method, path, token, body, concurrency, args.requests)
+                print(f"{name:>16} | {concurrency:>5} | {mode:>5} | {rps:>8.1f} | {p50:>8.1f} | {p95:>8.1f} | {errors:>6}")
+
+
+if __name__ == "__main__":
+    main()
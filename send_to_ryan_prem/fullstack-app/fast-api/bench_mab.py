@@ -0,0 +1,59 @@
+"""
+Benchmark: scalar vs. batch vs. top-K Hellinger-UCB ranking, for both UCB solvers.
+
+Run from the fast-api directory:
+    python bench_mab.py
+"""
+
+import random
+import time
+
+from mab import rank_articles_hellinger_ucb, rank_articles_hellinger_ucb_batch, top_k_hellinger_ucb_batch
+
+C_PARAM = .26
+ARM_COUNTS = [1_000, 10_000, 100_000]
+TOP_K = 20  # first page of /api/recommendations
+
+
+def make_stats(n_arms, seed=0):
+    """Random (N, S) per arm; roughly a third of the arms are brand new."""
+    rng = random.Random(seed)
+    stats = {}
+    for article_id in range(n_arms):
+        N = rng.choice([0, rng.randint(1, 200)])
+        S = rng.randint(0, N) if N else 0
+        stats[article_id] = (N, S)
+    return stats
+
+
+def time_call(fn, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    header = (f"{'arms':>8} | {'method':>11} | {'scalar (s)':>10} | {'batch (s)':>10} | {'speedup':>8}"
+              f" | {'top-' + str(TOP_K) + ' (s)':>11}")
+    print(header)
+    print("-" * len(header))
+    for n_arms in ARM_COUNTS:
+        stats = make_stats(n_arms)
+        article_ids = list(stats.keys())
+        N_array = [stats[a][0] for a in article_ids]
+        S_array = [stats[a][1] for a in article_ids]
+        t = max(sum(N_array), 1)
+
+        for method in ("bisection", "closed_form"):
+            scalar = time_call(rank_articles_hellinger_ucb, article_ids, stats, t, C_PARAM, method, repeat=1)
+            batch = time_call(rank_articles_hellinger_ucb_batch, article_ids, N_array, S_array, t, C_PARAM, method)
+            top_k = time_call(top_k_hellinger_ucb_batch, article_ids, N_array, S_array, t, C_PARAM, TOP_K, method)
+            print(f"{n_arms:>8} | {method:>11} | {scalar:>10.4f} | {batch:>10.4f} | {scalar / batch:>7.1f}x"
+                  f" | {top_k:>11.4f}")
+
+
+if __name__ == "__main__":
+    main()
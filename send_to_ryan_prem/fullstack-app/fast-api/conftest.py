@@ -19,6 +19,24 @@ def client():
     with TestClient(app) as test_client:
         yield test_client
 
+@pytest.fixture(autouse=True)
+def clear_session_cache():
+    """Session tokens resolved by one test must not leak into the next."""
+    from fast_api_app import SESSION_CACHE
+    SESSION_CACHE.clear()
+    yield
+    SESSION_CACHE.clear()
+
+@pytest.fixture(autouse=True)
+def clear_reference_cache():
+    """Cached topics/titles/dates from one test must not leak into the next."""
+    from fast_api_app import REFERENCE_CACHE, TITLE_INDEX
+    REFERENCE_CACHE.clear()
+    TITLE_INDEX.clear()
+    yield
+    REFERENCE_CACHE.clear()
+    TITLE_INDEX.clear()
+
 @pytest.fixture
 def mock_db_connection():
     """Mock database connection for testing"""
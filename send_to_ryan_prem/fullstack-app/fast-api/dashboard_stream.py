@@ -0,0 +1,129 @@
+"""
+Shared per-office producers behind the /api/dashboard/stream SSE endpoint.
+
+Every dashboard tab of an office subscribes to the same OfficeFeed. The feed
+has one producer task that re-reads the office's dashboard snapshot (office
+stats and latest rank-log snapshot) only when woken by `notify` (the app
+wires this to Postgres NOTIFY from the interaction and impression writes),
+at most every `min_interval` seconds and at least every `max_interval`
+seconds. Subscribers get the full snapshot once, then only deltas, so
+database load depends on the number of active offices, not open tabs.
+
+A subscriber that falls `queue_size` events behind has its backlog replaced
+by a fresh snapshot instead of blocking the producer.
+"""
+
+import asyncio
+
+
+def diff_snapshots(old, new):
+    """Delta from old to new: changed office stats rows and, if it moved, the new rank-log snapshot."""
+    delta = {}
+    old_stats = {row["url_id"]: row for row in old["office_mab_stats"]}
+    changed = [row for row in new["office_mab_stats"] if old_stats.get(row["url_id"]) != row]
+    if changed:
+        delta["office_mab_stats"] = changed
+    old_ids = [row["mab_rank_log_id"] for row in old["mab_rank_logs"]]
+    if [row["mab_rank_log_id"] for row in new["mab_rank_logs"]] != old_ids:
+        delta["mab_rank_logs"] = new["mab_rank_logs"]
+    return delta
+
+
+class OfficeFeed:
+    def __init__(self):
+        self.snapshot = None
+        self.ready = asyncio.Event()
+        self.wake = asyncio.Event()
+        self.queues = set()
+        self.task = None
+
+
+class DashboardHub:
+    def __init__(self, fetch_snapshot, min_interval=1.0, max_interval=30.0, queue_size=16, keepalive=15.0):
+        self.fetch_snapshot = fetch_snapshot  # async (office_id) -> snapshot dict
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.queue_size = queue_size
+        self.keepalive = keepalive
+        self._feeds = {}  # office_id -> OfficeFeed
+        self._refreshes = 0
+
+    def notify(self, office_id):
+        """Wake the office's producer (no-op when nobody is watching it). Call on the event loop."""
+        feed = self._feeds.get(str(office_id))
+        if feed is not None:
+            feed.wake.set()
+
+    async def subscribe(self, office_id):
+        """
+        Async generator of (event, data) for one client: ("snapshot", full) first,
+        then ("delta", changes); ("keepalive", None) after `keepalive` idle seconds.
+        """
+        office_id = str(office_id)
+        feed = self._feeds.get(office_id)
+        if feed is None:
+            feed = self._feeds[office_id] = OfficeFeed()
+            feed.task = asyncio.create_task(self._produce(office_id, feed))
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        feed.queues.add(queue)
+        try:
+            await feed.ready.wait()
+            yield "snapshot", feed.snapshot
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), self.keepalive)
+                except asyncio.TimeoutError:
+                    yield "keepalive", None
+        finally:
+            feed.queues.discard(queue)
+            if not feed.queues and self._feeds.get(office_id) is feed:
+                del self._feeds[office_id]
+                feed.task.cancel()
+
+    async def _produce(self, office_id, feed):
+        while True:
+            feed.wake.clear()
+            try:
+                snapshot = await self.fetch_snapshot(office_id)
+                self._refreshes += 1
+            except Exception as e:
+                print(f"[ERROR] Dashboard snapshot for office {office_id} failed: {e}")
+                snapshot = None
+            if snapshot is not None:
+                if feed.snapshot is None:
+                    feed.snapshot = snapshot
+                    feed.ready.set()
+                else:
+                    delta = diff_snapshots(feed.snapshot, snapshot)
+                    feed.snapshot = snapshot
+                    if delta:
+                        self._publish(feed, delta)
+            try:
+                await asyncio.wait_for(feed.wake.wait(), self.max_interval)
+            except asyncio.TimeoutError:
+                pass
+            # Coalesce bursts of notifications into one refresh
+            await asyncio.sleep(self.min_interval)
+
+    def _publish(self, feed, delta):
+        for queue in feed.queues:
+            if queue.full():
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(("snapshot", feed.snapshot))
+            else:
+                queue.put_nowait(("delta", delta))
+
+    async def close(self):
+        for feed in list(self._feeds.values()):
+            feed.task.cancel()
+        self._feeds.clear()
+
+    def stats(self):
+        return {
+            "offices": len(self._feeds),
+            "subscribers": sum(len(feed.queues) for feed in self._feeds.values()),
+            "refreshes": self._refreshes,
+            "min_interval": self.min_interval,
+            "max_interval": self.max_interval,
+        }
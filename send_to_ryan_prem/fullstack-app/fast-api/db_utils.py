@@ -1,23 +1,156 @@
-
-
 import os
+import threading
+import time
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+from fastapi import HTTPException
+
+# Pool sizing / health-check settings
+POOL_MIN = int(os.environ.get("DB_POOL_MIN", 1))
+POOL_MAX = int(os.environ.get("DB_POOL_MAX", 20))
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 5))  # seconds to wait for a free connection
+HEALTHCHECK_AFTER = float(os.environ.get("DB_POOL_HEALTHCHECK_SECONDS", 30))  # ping connections idle this long
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(POOL_MAX)
+_last_used = {}  # id(raw connection) -> time it was returned to the pool
+_pool_stats = {"checkouts": 0, "timeouts": 0, "discarded": 0}  # updated under _pool_lock
+
+
+def _count(stat):
+    with _pool_lock:
+        _pool_stats[stat] += 1
+
+
+def _connect_params():
+    return dict(
+        host=os.environ.get("DB_HOST", "db"),
+        port=os.environ.get("DB_PORT", 5432),
+        user=os.environ.get("DB_USER", "sbt"),
+        password=os.environ.get("DB_PASSWORD", "41998"),
+        database=os.environ.get("DB_NAME", "defensenews_webscraper")
+    )
+
+
+def get_pool():
+    """The process-wide ThreadedConnectionPool, created on first use (and again after a fork)."""
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = psycopg2.pool.ThreadedConnectionPool(POOL_MIN, POOL_MAX, **_connect_params())
+            _pool_pid = os.getpid()
+            _last_used.clear()
+    return _pool
+
+
+class PooledConnection:
+    """
+    Wraps a pooled psycopg2 connection. Behaves like the connection itself,
+    except that close() hands it back to the pool instead of disconnecting.
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def close(self):
+        raw, self._raw = self._raw, None
+        if raw is None:
+            return
+        try:
+            broken = bool(raw.closed)
+            if not broken and raw.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                # Never hand out a connection with an open (or aborted) transaction
+                raw.rollback()
+        except psycopg2.Error:
+            broken = True
+        if broken:
+            _count("discarded")
+            _last_used.pop(id(raw), None)
+        else:
+            _last_used[id(raw)] = time.monotonic()
+        try:
+            self._pool.putconn(raw, close=broken)
+        except psycopg2.pool.PoolError:
+            # Pool was closed while this connection was checked out
+            raw.close()
+        finally:
+            _slots.release()
+
+
+def _healthy(raw):
+    """Ping connections that have sat idle long enough to have been dropped server-side."""
+    if raw.closed:
+        return False
+    if time.monotonic() - _last_used.setdefault(id(raw), time.monotonic()) < HEALTHCHECK_AFTER:
+        return True
+    try:
+        with raw.cursor() as cur:
+            cur.execute("SELECT 1")
+        raw.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
 
 def connect_db():
-    host = os.environ.get("DB_HOST", "db")
-    port = os.environ.get("DB_PORT", 5432)
-    user = os.environ.get("DB_USER", "sbt")
-    password = os.environ.get("DB_PASSWORD", "41998")
-    database = os.environ.get("DB_NAME", "defensenews_webscraper")
+    """
+    Borrow a connection from the pool; conn.close() returns it.
+    Returns None if the database is unreachable or no connection frees up within DB_POOL_TIMEOUT.
+    """
+    if not _slots.acquire(timeout=POOL_TIMEOUT):
+        _count("timeouts")
+        print("[ERROR] Database connection failed: pool exhausted")
+        return None
     try:
-        conn = psycopg2.connect(
-            host=host,
-            port=port,
-            user=user,
-            password=password,
-            database=database
-        )
-        return conn
+        pool = get_pool()
+        raw = pool.getconn()
+        while not _healthy(raw):
+            _count("discarded")
+            _last_used.pop(id(raw), None)
+            pool.putconn(raw, close=True)
+            raw = pool.getconn()
+        _count("checkouts")
+        return PooledConnection(pool, raw)
     except Exception as e:
+        _slots.release()
         print("[ERROR] Database connection failed:", e)
         return None
+
+
+def get_db():
+    """FastAPI dependency: a pooled connection for the duration of the request."""
+    conn = connect_db()
+    if conn is None:
+        raise HTTPException(status_code=500, detail="Database connection failed")
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def pool_stats():
+    with _pool_lock:
+        stats = dict(_pool_stats, min=POOL_MIN, max=POOL_MAX)
+    if _pool is not None and _pool_pid == os.getpid():
+        stats["in_use"] = len(_pool._used)
+        stats["idle"] = len(_pool._pool)
+    return stats
+
+
+def close_pool():
+    """Close every pooled connection (app shutdown)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.closeall()
+        _pool = None
+        _last_used.clear()
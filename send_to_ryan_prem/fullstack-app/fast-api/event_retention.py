@@ -0,0 +1,203 @@
+"""
+Partition maintenance and retention for the append-only event tables.
+
+schema_update.sql partitions pulls, impressions, user_article_stats,
+user_interactions and mab_rank_logs by month (`<table>_pYYYYMM`, plus a
+`<table>_default` partition that catches anything outside them). Run this
+daily, e.g. from cron in the fast-api directory:
+    python event_retention.py --retention-months 6
+
+Each run
+- creates the partitions for the current month and the next `months_ahead`,
+  moving any rows the default partition already holds for them;
+- folds every month older than `retention_months` into the daily rollups
+  (daily_article_stats, daily_interactions) and drops its partition, so
+  aggregation queries only ever see a bounded window of raw events;
+- deletes mab_rank_snapshots older than the same cutoff.
+
+Every partition is rolled up and dropped in its own transaction, so an
+interrupted run never counts a month twice.
+"""
+
+import argparse
+import os
+import re
+from datetime import date
+
+import psycopg2
+from psycopg2 import sql
+
+from db_utils import _connect_params
+
+# table -> time column it is partitioned on
+EVENT_TABLES = {
+    "pulls": "created_at",
+    "impressions": "impression_time",
+    "user_article_stats": "created_at",
+    "user_interactions": "interaction_time",
+    "mab_rank_logs": "created_at",
+}
+
+# Daily aggregates kept for expired rows; {source} is a partition (or the default
+# partition) and only rows before %(cutoff)s are folded. Tables without an entry
+# are dropped outright: pulls and impressions are counted by user_article_stats,
+# mab_rank_logs are diagnostics.
+ROLLUPS = {
+    "user_article_stats": """
+        INSERT INTO daily_article_stats (day, office_id, user_id, url_id, impressions, clicks, bookmarks, adds)
+        SELECT created_at::date, office_id, user_id, url_id,
+               SUM(pull_impressions), SUM(pull_clicks), SUM(pull_bookmarks), SUM(pull_adds)
+        FROM {source}
+        WHERE created_at < %(cutoff)s
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (day, office_id, user_id, url_id)
+        DO UPDATE SET impressions = daily_article_stats.impressions + EXCLUDED.impressions,
+                      clicks = daily_article_stats.clicks + EXCLUDED.clicks,
+                      bookmarks = daily_article_stats.bookmarks + EXCLUDED.bookmarks,
+                      adds = daily_article_stats.adds + EXCLUDED.adds;
+    """,
+    "user_interactions": """
+        INSERT INTO daily_interactions (day, user_id, url_id, interaction_type, interactions)
+        SELECT interaction_time::date, user_id, url_id, interaction_type, COUNT(*)
+        FROM {source}
+        WHERE interaction_time < %(cutoff)s
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (day, user_id, url_id, interaction_type)
+        DO UPDATE SET interactions = daily_interactions.interactions + EXCLUDED.interactions;
+    """,
+}
+
+PARTITIONS_QUERY = """
+    SELECT c.relname
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = %s::regclass
+"""
+
+
+def add_months(month, n):
+    """First day of the month n months after `month` (n may be negative)."""
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y%m}"
+
+
+def partition_month(table, name):
+    """Month covered by a `<table>_pYYYYMM` partition, or None for any other name."""
+    match = re.fullmatch(re.escape(table) + r"_p(\d{4})(\d{2})", name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def list_partitions(cur, table):
+    """{month: partition name} of the table's monthly partitions."""
+    cur.execute(PARTITIONS_QUERY, (table,))
+    months = {}
+    for (name,) in cur.fetchall():
+        month = partition_month(table, name)
+        if month is not None:
+            months[month] = name
+    return months
+
+
+def create_partition(cur, table, column, month):
+    """
+    Create and attach the partition for `month`. Rows the default partition
+    already holds for that month are moved into it first (ATTACH would fail).
+    """
+    start, end = month, add_months(month, 1)
+    params = {"start": start, "end": end}
+    part = sql.Identifier(partition_name(table, month))
+    parent = sql.Identifier(table)
+    default = sql.Identifier(f"{table}_default")
+    col = sql.Identifier(column)
+    cur.execute(sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)").format(part, parent))
+    cur.execute(sql.SQL("""
+        WITH moved AS (
+            DELETE FROM {default} WHERE {col} >= %(start)s AND {col} < %(end)s RETURNING *
+        )
+        INSERT INTO {part} SELECT * FROM moved
+    """).format(default=default, col=col, part=part), params)
+    cur.execute(
+        sql.SQL("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (%(start)s) TO (%(end)s)").format(parent, part),
+        params,
+    )
+
+
+def drop_partition(cur, table, name, cutoff):
+    """Fold the partition into the daily rollup (if the table has one), then drop it."""
+    if table in ROLLUPS:
+        cur.execute(sql.SQL(ROLLUPS[table]).format(source=sql.Identifier(name)), {"cutoff": cutoff})
+    cur.execute(sql.SQL("ALTER TABLE {} DETACH PARTITION {}").format(sql.Identifier(table), sql.Identifier(name)))
+    cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+
+
+def expire_default_rows(cur, table, column, cutoff):
+    """Fold and delete expired rows that landed in the default partition."""
+    default = sql.Identifier(f"{table}_default")
+    if table in ROLLUPS:
+        cur.execute(sql.SQL(ROLLUPS[table]).format(source=default), {"cutoff": cutoff})
+    cur.execute(
+        sql.SQL("DELETE FROM {} WHERE {} < %(cutoff)s").format(default, sql.Identifier(column)),
+        {"cutoff": cutoff},
+    )
+    return cur.rowcount
+
+
+def run_maintenance(conn, retention_months=6, months_ahead=3, today=None):
+    """One maintenance pass over every event table; returns what it created and dropped."""
+    current = (today or date.today()).replace(day=1)
+    cutoff = add_months(current, -retention_months)
+    summary = {"cutoff": cutoff.isoformat(), "created": [], "dropped": [], "default_rows_expired": 0}
+    for table, column in EVENT_TABLES.items():
+        with conn.cursor() as cur:
+            existing = list_partitions(cur, table)
+        for n in range(months_ahead + 1):
+            month = add_months(current, n)
+            if month not in existing:
+                with conn.cursor() as cur:
+                    create_partition(cur, table, column, month)
+                conn.commit()
+                summary["created"].append(partition_name(table, month))
+        for month, name in sorted(existing.items()):
+            if add_months(month, 1) <= cutoff:
+                with conn.cursor() as cur:
+                    drop_partition(cur, table, name, cutoff)
+                conn.commit()
+                summary["dropped"].append(name)
+        with conn.cursor() as cur:
+            summary["default_rows_expired"] += expire_default_rows(cur, table, column, cutoff)
+        conn.commit()
+    # Snapshots only index mab_rank_logs, whose old rows are gone now
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM mab_rank_snapshots WHERE created_at < %s", (cutoff,))
+    conn.commit()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--retention-months", type=int,
+                        default=int(os.environ.get("EVENT_RETENTION_MONTHS", 6)),
+                        help="Months of raw events to keep; older months are rolled up daily and dropped")
+    parser.add_argument("--months-ahead", type=int,
+                        default=int(os.environ.get("EVENT_PARTITION_MONTHS_AHEAD", 3)),
+                        help="Future monthly partitions to create ahead of time")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**_connect_params())
+    try:
+        summary = run_maintenance(conn, args.retention_months, args.months_ahead)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    print(f"[INFO] Event retention (cutoff {summary['cutoff']}): created {len(summary['created'])} partitions, "
+          f"dropped {summary['dropped'] or 'none'}, {summary['default_rows_expired']} default-partition rows expired")
+
+
+if __name__ == "__main__":
+    main()
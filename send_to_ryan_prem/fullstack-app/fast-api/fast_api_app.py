@@ -1,14 +1,30 @@
+import asyncio
+import base64
 import math
 import pickle
+import random
+import secrets
 import psycopg2
-from fastapi import FastAPI, HTTPException, Query, Body, Header, Request, APIRouter
+import psycopg2.extras
+from contextlib import asynccontextmanager, contextmanager
+from fastapi import FastAPI, HTTPException, Query, Body, Header, Request, Response, APIRouter, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from bcrypt import hashpw, gensalt, checkpw
 import uuid
 from datetime import datetime, timedelta
-from mab import rank_articles_hellinger_ucb
+from mab import rank_articles_hellinger_ucb_batch, top_k_hellinger_ucb_batch, HellingerUCBCache
+from impression_writer import ImpressionWriter
+from session_cache import SessionCache
+from reference_cache import ReferenceCache
+from title_index import TitleIndex
+from dashboard_stream import DashboardHub
 import traceback
-from db_utils import connect_db
+from db_utils import connect_db, get_db, close_pool, pool_stats
+import async_db
+from async_db import get_async_pool, close_async_pool
+from fastapi.concurrency import run_in_threadpool
 import json
 import os
 import subprocess
@@ -18,8 +34,21 @@ from typing import List, Optional
 
 
 
+@asynccontextmanager
+async def lifespan(app):
+    IMPRESSION_WRITER.start()
+    yield
+    # Flush queued impressions before the process exits, then release pooled connections
+    IMPRESSION_WRITER.stop()
+    await DASHBOARD_HUB.close()
+    if _dashboard_listener is not None:
+        await _dashboard_listener.close()
+    close_pool()
+    await close_async_pool()
+
+
 # Initialize the FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS
 origins = [
@@ -34,26 +63,84 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Enable/Disable Bandit Probability and Rank logging for real-time behavior analytics (Leave "false" until testing or monitoring real time model behavior for a short time (5 min))
+# Enable/Disable Bandit Probability and Rank logging for real-time behavior analytics (each logged ranking is one bulk insert; cap it with MAB_RANK_LOG_TOP_N / MAB_RANK_LOG_SAMPLE_RATE to leave it on)
 LOG_MAB_RANKS = os.environ.get("MAB_RANK_LOG_ENABLED", "false").lower() == "true"
+# Rank-log volume: keep only the top N ranks of each logged ranking (0 = all) and log only this fraction of rankings
+MAB_RANK_LOG_TOP_N = int(os.environ.get("MAB_RANK_LOG_TOP_N", 0))
+MAB_RANK_LOG_SAMPLE_RATE = float(os.environ.get("MAB_RANK_LOG_SAMPLE_RATE", 1.0))
+# Months of raw events event_retention.py keeps; pull lookups never look further back,
+# so they skip the older monthly partitions
+EVENT_RETENTION_MONTHS = int(os.environ.get("EVENT_RETENTION_MONTHS", 6))
 
 # You might also define your MAB constants:
 C_PARAM = .26 # RANGE BETWEEN 0.25 and 0.5 (0.25 is more exploitative, 0.5 is more explorative)
 # COLD_THRESHOLD = 1
 
+# /api/articles/filter with count_mode="estimated": planner estimates at or above this are returned as-is
+ARTICLE_COUNT_ESTIMATE_THRESHOLD = int(os.environ.get("ARTICLE_COUNT_ESTIMATE_THRESHOLD", 10000))
+
+# In-process UCB lookup tables for small (N, S); see HellingerUCBCache in mab.py
+UCB_CACHE = HellingerUCBCache(
+    max_n=int(os.environ.get("MAB_UCB_CACHE_MAX_N", 128)),
+    t_resolution=int(os.environ.get("MAB_UCB_CACHE_T_RESOLUTION", 16)),
+)
+
+# Resolved session tokens, so authenticated requests skip the sessions lookup
+SESSION_CACHE = SessionCache(
+    ttl=float(os.environ.get("SESSION_CACHE_TTL", 60)),
+    max_entries=int(os.environ.get("SESSION_CACHE_MAX_ENTRIES", 10000)),
+)
+
+# Topics, titles and publication dates, reloaded when the scraper bumps catalog_version
+REFERENCE_CACHE = ReferenceCache(
+    check_interval=float(os.environ.get("REFERENCE_CACHE_CHECK_SECONDS", 30)),
+)
+
+# Word-prefix index over article titles for /api/article_titles/search
+TITLE_INDEX = TitleIndex()
+
 def generate_token():
     """Generates a unique session token using UUID."""
     return str(uuid.uuid4())
 
+SESSION_LOOKUP_QUERY = """
+    SELECT users.user_id, sessions.session_id, users.office_id, sessions.expires_at
+    FROM sessions
+    JOIN users ON sessions.user_id = users.user_id
+    WHERE sessions.session_token = %s AND sessions.expires_at > NOW()
+"""
+
+def current_session(authorization: str = Header(None, alias="Authorization")):
+    """
+    FastAPI dependency: resolves the session token to (user_id, session_id, office_id).
+    Served from SESSION_CACHE when possible; otherwise one lookup, then cached
+    until the session expires (or SESSION_CACHE_TTL, whichever is sooner).
+    """
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Session token required")
+    cached = SESSION_CACHE.get(authorization)
+    if cached is not None:
+        return cached
+    conn = connect_db()
+    if conn is None:
+        raise HTTPException(status_code=500, detail="Database connection failed")
+    try:
+        with conn.cursor() as cur:
+            cur.execute(SESSION_LOOKUP_QUERY, (authorization,))
+            sess_row = cur.fetchone()
+    finally:
+        conn.close()
+    if not sess_row:
+        raise HTTPException(status_code=401, detail="Invalid or expired session token")
+    user_id, session_id, office_id, expires_at = sess_row
+    return SESSION_CACHE.put(authorization, (user_id, session_id, office_id), expires_at)
+
 # ------------------------------------------------------------------
 # Signup / Login / Topics Endpoints
 # ------------------------------------------------------------------
 
 @app.get("/api/offices")
-def get_offices():
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+def get_offices(conn=Depends(get_db)):
     try:
         with conn.cursor() as cur:
             cur.execute("SELECT office_id, office_code FROM offices;")
@@ -61,20 +148,15 @@ def get_offices():
             return [{"office_id": row[0], "office_code": row[1]} for row in offices]
     except psycopg2.Error as e:
         raise HTTPException(status_code=400, detail=f"Failed to fetch offices: {e}")
-    finally:
-        conn.close()
 
 
 @app.post("/api/signup", status_code=201)
-def signup(payload: dict = Body(...)):
+def signup(payload: dict = Body(...), conn=Depends(get_db)):
     username = payload.get("username")
     password = payload.get("password")
     office_code = payload.get("office_code")
     if not username or not password or not office_code:
         raise HTTPException(status_code=400, detail="Username, password, and office code are required")
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
     try:
         with conn.cursor() as cur:
             cur.execute("SELECT office_id FROM offices WHERE office_code = %s;", (office_code,))
@@ -94,18 +176,13 @@ def signup(payload: dict = Body(...)):
         return {"message": "User created successfully"}
     except psycopg2.Error as e:
         raise HTTPException(status_code=400, detail=f"Failed to create user: {e}")
-    finally:
-        conn.close()
 
 @app.post("/api/login")
-def login(payload: dict = Body(...)):
+def login(payload: dict = Body(...), conn=Depends(get_db)):
     username = payload.get("username")
     password = payload.get("password")
     if not username or not password:
         raise HTTPException(status_code=400, detail="Username and password are required")
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
     try:
         with conn.cursor() as cur:
             cur.execute("SELECT user_id, password_hash FROM users WHERE username = %s;", (username,))
@@ -131,16 +208,11 @@ def login(payload: dict = Body(...)):
     except psycopg2.Error as e:
         print(f"[ERROR] Database error: {e}")
         raise HTTPException(status_code=500, detail="Database error occurred")
-    finally:
-        conn.close()
 
 @app.post("/api/logout")
-def logout(authorization: str = Header(None, alias="Authorization")):
+def logout(authorization: str = Header(None, alias="Authorization"), conn=Depends(get_db)):
     if not authorization:
         raise HTTPException(status_code=401, detail="Session token required")
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
     try:
         with conn.cursor() as cur:
             cur.execute(
@@ -148,70 +220,149 @@ def logout(authorization: str = Header(None, alias="Authorization")):
                 (authorization,)
             )
         conn.commit()
+        SESSION_CACHE.invalidate(authorization)
         return {"message": "Logged out successfully"}
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail="Failed to log out")
+
+
+
+
+CATALOG_VERSION_QUERY = "SELECT version FROM catalog_version WHERE id = 1"
+
+
+def fetch_catalog_version(cur):
+    cur.execute(CATALOG_VERSION_QUERY)
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def etag_matches(if_none_match, etag):
+    """True if an If-None-Match header lists etag (or is "*")."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+@contextmanager
+def lazy_cursor():
+    """
+    Yields with_cursor(query), which runs query(cur) on a connection borrowed
+    on first use, so cache hits never touch the pool.
+    """
+    conn = None
+
+    def with_cursor(query):
+        nonlocal conn
+        if conn is None:
+            conn = connect_db()
+            if conn is None:
+                raise HTTPException(status_code=500, detail="Database connection failed")
+        with conn.cursor() as cur:
+            return query(cur)
+
+    try:
+        yield with_cursor
     finally:
-        conn.close()
+        if conn is not None:
+            conn.close()
+
+
+def reference_list(name, load, response, if_none_match=None):
+    """
+    Serve the reference list `name` from REFERENCE_CACHE, tagged with an ETag of
+    the catalog version. `load(cur)` queries the list on a miss. Returns the list,
+    or a bare 304 when the client's If-None-Match is still current. A database
+    connection is only borrowed when the version check or the list is due.
+    """
+    with lazy_cursor() as with_cursor:
+        version = REFERENCE_CACHE.version(lambda: with_cursor(fetch_catalog_version))
+        etag = f'"{name}-{version}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        value = REFERENCE_CACHE.get(name, version, lambda: with_cursor(load))
+        response.headers.update(headers)
+        return value
+
 
+def load_topics(cur):
+    cur.execute("SELECT DISTINCT topic FROM unique_topics ORDER BY topic ASC;")
+    return {"topics": [topic[0] for topic in cur.fetchall() if topic[0]]}
 
 
+def load_article_titles(cur):
+    cur.execute("SELECT DISTINCT title FROM urls_content;")
+    return {"titles": [row[0] for row in cur.fetchall() if row[0]]}
+
+
+def load_publication_dates(cur):
+    cur.execute("""
+        SELECT DISTINCT DATE(publication_date) AS publication_date
+        FROM urls_content
+        ORDER BY publication_date DESC;
+    """)
+    # Convert to a list of strings (e.g., "YYYY-MM-DD")
+    return {"dates": [date[0].strftime('%Y-%m-%d') for date in cur.fetchall() if date[0]]}
+
 
 @app.get("/api/topics")
-def get_topics():
-    query = "SELECT DISTINCT topic FROM unique_topics ORDER BY topic ASC;"
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+def get_topics(response: Response, if_none_match: Optional[str] = Header(None, alias="If-None-Match")):
     try:
-        with conn.cursor() as cur:
-            cur.execute(query)
-            topics = cur.fetchall()
-            topic_list = [topic[0] for topic in topics if topic[0]]
-        return {"topics": topic_list}
+        return reference_list("topics", load_topics, response, if_none_match)
     except psycopg2.DatabaseError as e:
         print(f"[ERROR] Failed to retrieve topics: {e}")
         raise HTTPException(status_code=500, detail="Failed to retrieve topics")
-    finally:
-        conn.close()
 
 @app.get("/api/article_titles")
-def get_article_titles():
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+def get_article_titles(response: Response, if_none_match: Optional[str] = Header(None, alias="If-None-Match")):
     try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT DISTINCT title FROM urls_content;")
-            rows = cur.fetchall()
-            titles = [row[0] for row in rows if row[0]]
-        return {"titles": titles}
+        return reference_list("article_titles", load_article_titles, response, if_none_match)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
+
+TITLE_INDEX_QUERY = """
+    SELECT url_id, title, datetime_content_scrape
+    FROM urls_content
+    WHERE title IS NOT NULL AND title <> ''
+"""
+
+
+def load_title_rows(cur, since=None):
+    """(url_id, title, scraped_at) for titles scraped after `since` (every title when None)."""
+    if since is None:
+        cur.execute(TITLE_INDEX_QUERY)
+    else:
+        cur.execute(TITLE_INDEX_QUERY + " AND datetime_content_scrape > %s", (since,))
+    return cur.fetchall()
+
+
+@app.get("/api/article_titles/search")
+def search_article_titles(q: str = "", limit: int = Query(10, ge=1, le=50)):
+    """
+    Autocomplete for article titles: up to `limit` titles in which every word of
+    `q` prefixes a title word. Served from TITLE_INDEX, which picks up newly
+    scraped titles when the catalog version changes.
+    """
+    try:
+        with lazy_cursor() as with_cursor:
+            version = REFERENCE_CACHE.version(lambda: with_cursor(fetch_catalog_version))
+            TITLE_INDEX.refresh(version, lambda since: with_cursor(lambda cur: load_title_rows(cur, since)))
+    except psycopg2.DatabaseError as e:
+        print(f"[ERROR] Failed to refresh title index: {e}")
+        raise HTTPException(status_code=500, detail="Failed to search article titles")
+    return {"titles": TITLE_INDEX.search(q, limit)}
+
 
 @app.get("/api/user_names")
-def get_user_names(authorization: str = Header(None, alias="Authorization")):
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Session token required")
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+def get_user_names(session: tuple = Depends(current_session), conn=Depends(get_db)):
+    _, _, office_id = session
     try:
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT u.office_id 
-                FROM sessions s
-                JOIN users u ON s.user_id = u.user_id
-                WHERE s.session_token = %s AND s.expires_at > NOW();
-            """, (authorization,))
-            row = cur.fetchone()
-            if not row:
-                raise HTTPException(status_code=401, detail="Invalid or expired session token")
-            office_id = row[0]
-
             cur.execute("""
                 SELECT DISTINCT username 
                 FROM users
@@ -222,68 +373,192 @@ def get_user_names(authorization: str = Header(None, alias="Authorization")):
         return {"userNames": userNames}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+# Upserts for the materialized bandit counters (see schema_update.sql)
+BUMP_USER_ARM_COUNTERS = """
+    INSERT INTO bandit_arm_counters (user_id, url_id, n, s)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT (user_id, url_id)
+    DO UPDATE SET n = bandit_arm_counters.n + EXCLUDED.n,
+                  s = bandit_arm_counters.s + EXCLUDED.s;
+"""
+BUMP_OFFICE_ARM_COUNTERS = """
+    INSERT INTO office_arm_counters (office_id, url_id, n, s)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT (office_id, url_id)
+    DO UPDATE SET n = office_arm_counters.n + EXCLUDED.n,
+                  s = office_arm_counters.s + EXCLUDED.s;
+"""
+
+
+def bump_arm_counters(cur, user_id, office_id, url_ids, n=0, s=0):
+    """
+    Add n impressions and s clicks to each url_id's user- and office-level counters.
+    Runs on the caller's cursor so it commits with the rest of the transaction.
+    """
+    cur.executemany(BUMP_USER_ARM_COUNTERS, [(user_id, url_id, n, s) for url_id in url_ids])
+    cur.executemany(BUMP_OFFICE_ARM_COUNTERS, [(office_id, url_id, n, s) for url_id in url_ids])
+
+
+# /api/dashboard/stream producers LISTEN on this channel; the payload is an office_id
+DASHBOARD_CHANNEL = "dashboard_updates"
+NOTIFY_DASHBOARDS_QUERY = f"SELECT pg_notify('{DASHBOARD_CHANNEL}', office_id) FROM unnest(%s::text[]) AS office_id"
+
+
+def notify_dashboards(cur, office_ids):
+    """Tell the offices' dashboard streams to refresh; Postgres delivers it when the caller commits."""
+    cur.execute(NOTIFY_DASHBOARDS_QUERY, (sorted({str(office_id) for office_id in office_ids}),))
+
+
+# Everything a served page writes, as one statement: a pull per article, its
+# user_article_stats row (already holding the impression), the impression
+# itself and the bandit counter increments. The unique keys of the partitioned
+# event tables include their time column, hence the target-less ON CONFLICT.
+LOG_IMPRESSIONS_QUERY = """
+    WITH new_pulls AS (
+        INSERT INTO pulls (
+            user_id, url_id, office_id,
+            filter_topics, filter_date,
+            page_offset, created_at
+        )
+        SELECT %(user_id)s, page.url_id, %(office_id)s,
+               %(topics)s::text[], %(date_min)s,
+               %(page_offset)s, NOW()
+        FROM unnest(%(url_ids)s::int[]) AS page(url_id)
+        RETURNING pull_id, url_id
+    ),
+    new_stats AS (
+        INSERT INTO user_article_stats (
+            office_id, user_id, url_id, pull_id,
+            pull_impressions, pull_clicks,
+            pull_bookmarks, pull_adds
+        )
+        SELECT %(office_id)s, %(user_id)s, url_id, pull_id, 1, 0, 0, 0
+        FROM new_pulls
+        ON CONFLICT DO NOTHING
+    ),
+    new_impressions AS (
+        INSERT INTO impressions (user_id, url_id, session_id, pull_id, office_id, impression_time)
+        SELECT %(user_id)s, url_id, %(session_id)s, pull_id, %(office_id)s, NOW()
+        FROM new_pulls
+        ON CONFLICT DO NOTHING
+    ),
+    user_counters AS (
+        INSERT INTO bandit_arm_counters (user_id, url_id, n, s)
+        SELECT %(user_id)s, url_id, 1, 0
+        FROM new_pulls
+        ON CONFLICT (user_id, url_id)
+        DO UPDATE SET n = bandit_arm_counters.n + 1
+    )
+    INSERT INTO office_arm_counters (office_id, url_id, n, s)
+    SELECT %(office_id)s, url_id, 1, 0
+    FROM new_pulls
+    ON CONFLICT (office_id, url_id)
+    DO UPDATE SET n = office_arm_counters.n + 1;
+"""
+
+
+def impression_page(user_id, article_ids, session_id, office_id, topics=None, date_min=None, page_offset=0):
+    """Parameters of LOG_IMPRESSIONS_QUERY for one served page."""
+    return {
+        "user_id": user_id,
+        "office_id": office_id,
+        "session_id": session_id,
+        "url_ids": list(article_ids),
+        "topics": topics,       # Pass actual topics filter
+        "date_min": date_min,   # Pass actual date filter
+        "page_offset": page_offset,
+    }
+
+
+def write_impression_pages(conn, pages):
+    """Write any number of served pages in one transaction and one round trip."""
+    pages = [page for page in pages if page["url_ids"]]
+    if not pages:
+        return
+    with conn.cursor() as cur:
+        psycopg2.extras.execute_batch(cur, LOG_IMPRESSIONS_QUERY, pages, page_size=len(pages))
+        notify_dashboards(cur, [page["office_id"] for page in pages])
+    conn.commit()
+
+
+def log_impressions(conn, user_id, article_ids, session_id, office_id, topics=None, date_min=None, page_offset=0):
+    """
+    Log the pulls and impressions for one served page of recommendations.
+    - Creates **one pull per article** and logs **one impression per pull_id**.
+    - Inserts the per-pull `user_article_stats` row with `pull_impressions = 1`.
+    - Increments `n` in the user/office bandit counters for each article.
+    All of it is a single round trip regardless of page size.
+    """
+    write_impression_pages(conn, [
+        impression_page(user_id, article_ids, session_id, office_id, topics, date_min, page_offset)
+    ])
+
+
+def _write_impression_batch(pages):
+    """ImpressionWriter callback: persist a batch of pages queued by /api/recommendations."""
+    conn = connect_db()
+    if conn is None:
+        raise RuntimeError("Database connection failed")
+    try:
+        write_impression_pages(conn, pages)
+    except Exception:
+        conn.rollback()
+        raise
     finally:
         conn.close()
 
-def log_impressions(conn, user_id, article_ids, session_id, pull_ids, office_id):
+
+# Background writer that takes impression logging off the /api/recommendations path
+IMPRESSION_WRITER = ImpressionWriter(
+    _write_impression_batch,
+    max_queue=int(os.environ.get("IMPRESSION_QUEUE_MAX", 10000)),
+    batch_size=int(os.environ.get("IMPRESSION_BATCH_SIZE", 200)),
+    flush_interval=float(os.environ.get("IMPRESSION_FLUSH_INTERVAL", 0.05)),
+)
+
+
+def wait_for_queued_pulls(user_id):
     """
-    Log user impressions for the current ranking cycle.
-    - Ensures **one impression per pull_id** is logged.
-    - Updates `user_article_stats.pull_impressions` for each article.
+    Before looking up a user's latest pull: wait until the pages this user has
+    queued on IMPRESSION_WRITER are written (other users' backlog is not
+    waited for). 503 if they are still queued after the timeout, rather than
+    attaching the interaction to an older pull.
     """
-    try:
-        with conn.cursor() as cur:
-            # 1️⃣ Insert impressions, ensuring one per (user, pull_id)
-            insert_query = """
-                INSERT INTO impressions (user_id, url_id, session_id, pull_id, office_id, impression_time)
-                VALUES (%s, %s, %s, %s, %s, NOW())
-                ON CONFLICT (user_id, url_id, session_id, pull_id) DO NOTHING;
-            """
-            impressions_data = [
-                (user_id, article_id, session_id, pull_id, office_id)
-                for article_id, pull_id in zip(article_ids, pull_ids)
-            ]
-            cur.executemany(insert_query, impressions_data)
-
-            # 2️ Increment `pull_impressions` in `user_article_stats`
-            update_query = """
-                UPDATE user_article_stats
-                SET pull_impressions = pull_impressions + 1
-                WHERE office_id = %s AND user_id = %s AND url_id = %s AND pull_id = %s;
-            """
-            update_data = [
-                (office_id, user_id, article_id, pull_id)
-                for article_id, pull_id in zip(article_ids, pull_ids)
-            ]
-            cur.executemany(update_query, update_data)
+    if not IMPRESSION_WRITER.wait_for(user_id):
+        print(f"[WARNING] Impressions for user {user_id} still queued; rejecting the interaction.")
+        raise HTTPException(status_code=503, detail="Recent recommendations are still being recorded; retry shortly")
 
-            conn.commit()
 
-    except Exception as e:
-        print(f"[ERROR] Failed to log impressions: {e}")
-        conn.rollback()
+def settled_session(session: tuple = Depends(current_session)):
+    """
+    current_session for handlers that look up the caller's latest pull, once
+    wait_for_queued_pulls returns. Declare it before conn=Depends(get_db) so
+    the wait never holds a pooled connection.
+    """
+    wait_for_queued_pulls(session[0])
+    return session
 
 
-def fetch_articles(conn, topics=None, date_min=None, articles=None, offset=0, limit=10):
-    print(f"[DEBUG] Fetching articles with filters - topics: {topics}, date_min: {date_min}, articles: {articles}")
-    
-    query = """
-        SELECT uc.*
-        FROM urls_content uc
-        WHERE 1=1
+def build_article_filters(topics=None, date_min=None, articles=None):
+    """
+    Build the WHERE clause shared by every urls_content listing query.
+    Returns (sql, params); sql starts with "WHERE 1=1".
     """
+    query = "WHERE 1=1"
     params = []
-    
+
     if topics and len(topics) > 0:
-        # Use array overlap operator (&&) for topics_array and ILIKE for topics text field
-        topic_conditions = []
+        # One array overlap (&&) for all topics (GIN on topics_array), ORed with an
+        # ILIKE per topic on the topics text field (pg_trgm GIN); see schema_update.sql
+        topic_conditions = ["uc.topics_array && %s::text[]"]
+        params.append(list(topics))
         for topic in topics:
-            topic_conditions.append("uc.topics_array && ARRAY[%s]::text[]")
             topic_conditions.append("uc.topics ILIKE %s")
-            params.extend([topic, f"%{topic}%"])
+            params.append(f"%{topic}%")
         query += " AND (" + " OR ".join(topic_conditions) + ")"
         print(f"[DEBUG] Topic conditions: checking both topics_array and topics field")
-    
+
     if date_min:
         # Convert date_min to timestamp if it's not already
         try:
@@ -294,17 +569,100 @@ def fetch_articles(conn, topics=None, date_min=None, articles=None, offset=0, li
             print(f"[DEBUG] Date filter: {date_min}")
         except Exception as e:
             print(f"[WARNING] Invalid date format: {date_min}, skipping date filter")
-    
+
     if articles and len(articles) > 0:
-        # Use ILIKE for case-insensitive title matching
+        # Use ILIKE for case-insensitive title matching (pg_trgm GIN on title)
         title_conditions = []
         for article in articles:
             title_conditions.append("uc.title ILIKE %s")
             params.append(f"%{article}%")
         query += " AND (" + " OR ".join(title_conditions) + ")"
         print(f"[DEBUG] Title conditions: {title_conditions}")
-    
-    query += " ORDER BY uc.publication_date DESC LIMIT %s OFFSET %s"
+
+    return query, params
+
+
+# Every urls_content column a client may ask for via `fields`
+ARTICLE_COLUMNS = (
+    "url_id", "defensenews_url_id", "datetime_content_scrape", "publication_date", "title",
+    "description", "topics_array", "author", "topics", "content", "url", "url_part_1",
+)
+# What the article cards render; leaves out the scraped `content` body
+ARTICLE_SUMMARY_FIELDS = ("url_id", "publication_date", "title", "description", "topics_array", "topics", "author", "url")
+
+
+def article_columns(fields="summary"):
+    """
+    SELECT list for an article listing. `fields` is "summary" (default), "detail"
+    (every column, including content) or a comma-separated subset of ARTICLE_COLUMNS.
+    url_id and publication_date are always selected (hydration and cursors need them).
+    Raises ValueError for an unknown field.
+    """
+    if not fields or fields == "summary":
+        names = ARTICLE_SUMMARY_FIELDS
+    elif fields == "detail":
+        return "uc.*"
+    else:
+        requested = fields.split(",") if isinstance(fields, str) else list(fields)
+        names = [name.strip() for name in requested if name.strip()]
+        unknown = [name for name in names if name not in ARTICLE_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown article fields: {', '.join(unknown)}")
+        names = [name for name in ("url_id", "publication_date") if name not in names] + names
+    return ", ".join(f"uc.{name}" for name in names)
+
+
+def encode_cursor(article):
+    """Opaque keyset cursor for the position right after `article` (publication_date, url_id)."""
+    published = article.get("publication_date")
+    if isinstance(published, datetime):
+        published = published.isoformat()
+    raw = json.dumps([published, article["url_id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(publication_date or None, url_id) from encode_cursor; raises ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        published, url_id = json.loads(raw)
+        return (datetime.fromisoformat(published) if published else None), int(url_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def next_cursor(page, limit):
+    """Cursor for the page after `page`, or None if it was the last one."""
+    return encode_cursor(page[-1]) if page and len(page) >= limit else None
+
+
+def fetch_articles(conn, topics=None, date_min=None, articles=None, offset=0, limit=10, after=None, fields="summary"):
+    """
+    One page of filtered articles, newest first (ties broken by url_id).
+    Pages either by offset or, when `after` = decode_cursor(...) is given, by keyset:
+    rows strictly after that (publication_date, url_id), which is an index range scan
+    on idx_urls_content_pubdate_url however deep the page is.
+    Only the columns selected by `fields` are fetched (see article_columns).
+    """
+    print(f"[DEBUG] Fetching articles with filters - topics: {topics}, date_min: {date_min}, articles: {articles}")
+
+    where_sql, params = build_article_filters(topics, date_min, articles)
+    if after is not None:
+        after_date, after_id = after
+        if after_date is None:
+            # Still inside the NULL publication_date rows, which sort first under DESC
+            where_sql += " AND (uc.publication_date IS NOT NULL OR uc.url_id < %s)"
+            params.append(after_id)
+        else:
+            where_sql += " AND (uc.publication_date, uc.url_id) < (%s, %s)"
+            params.extend([after_date, after_id])
+        offset = 0
+    query = f"""
+        SELECT {article_columns(fields)}
+        FROM urls_content uc
+        {where_sql}
+        ORDER BY uc.publication_date DESC, uc.url_id DESC LIMIT %s OFFSET %s
+    """
     params.extend([limit, offset])
     
     print(f"[DEBUG] Final query: {query}")
@@ -326,185 +684,270 @@ def fetch_articles(conn, topics=None, date_min=None, articles=None, offset=0, li
         raise e
 
 
+def count_articles(conn, topics=None, date_min=None, articles=None, estimated=False):
+    """
+    Number of urls_content rows matching the filters, without transferring them.
+    With estimated=True the planner's row estimate is returned when it is at least
+    ARTICLE_COUNT_ESTIMATE_THRESHOLD (broad filters, where an exact count would
+    scan most of the table); narrower filters still get an exact count(*).
+    Returns (count, is_estimate).
+    """
+    where_sql, params = build_article_filters(topics, date_min, articles)
+    with conn.cursor() as cur:
+        if estimated:
+            cur.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM urls_content uc {where_sql}", params)
+            plan = cur.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            estimate = int(plan[0]["Plan"]["Plan Rows"])
+            if estimate >= ARTICLE_COUNT_ESTIMATE_THRESHOLD:
+                return estimate, True
+        cur.execute(f"SELECT count(*) FROM urls_content uc {where_sql}", params)
+        return cur.fetchone()[0], False
+
+
+def candidate_stats_query(user_id, topics=None, date_min=None, articles=None):
+    """(sql, params) of the phase 1 candidates + bandit counters query."""
+    where_sql, filter_params = build_article_filters(topics, date_min, articles)
+    query = f"""
+        SELECT uc.url_id,
+               COALESCE(st.total_impressions, 0) AS n,
+               COALESCE(st.total_clicks, 0) AS s
+        FROM urls_content uc
+        LEFT JOIN (
+            SELECT url_id, n AS total_impressions, s AS total_clicks
+            FROM bandit_arm_counters
+            WHERE user_id = %s
+        ) st ON st.url_id = uc.url_id
+        {where_sql}
+        ORDER BY uc.publication_date DESC
+    """
+    return query, [user_id] + filter_params
+
+
+def fetch_candidate_stats(conn, user_id, topics=None, date_min=None, articles=None):
+    """
+    Phase 1 of the recommendations fetch, in one round trip: every url_id matching
+    the filters with the user's bandit counters (N = impressions, S = clicks),
+    newest first (the order ties are ranked in). No article bodies are transferred.
+    Returns a list of (url_id, N, S).
+    """
+    query, params = candidate_stats_query(user_id, topics, date_min, articles)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            rows = [(url_id, int(n), int(s)) for url_id, n, s in cur.fetchall()]
+            print(f"[DEBUG] Found {len(rows)} candidate articles")
+            return rows
+    except Exception as e:
+        print(f"[ERROR] Database error in fetch_candidate_stats: {str(e)}")
+        print(f"[ERROR] Query that failed: {query}")
+        print(f"[ERROR] Parameters used: {params}")
+        raise e
+
+
+def hydrate_articles_query(fields="summary"):
+    return f"SELECT {article_columns(fields)} FROM urls_content uc WHERE uc.url_id = ANY(%s)"
+
+
+def hydrate_articles(conn, url_ids, fields="summary"):
+    """
+    Phase 2 of the recommendations fetch: rows (projected by `fields`) for the
+    given url_ids only, returned in the same order as url_ids.
+    """
+    if not url_ids:
+        return []
+    with conn.cursor() as cur:
+        cur.execute(hydrate_articles_query(fields), (list(url_ids),))
+        columns = [desc[0] for desc in cur.description]
+        rows_by_id = {}
+        for row in cur.fetchall():
+            article = dict(zip(columns, row))
+            rows_by_id[article["url_id"]] = article
+    return [rows_by_id[url_id] for url_id in url_ids if url_id in rows_by_id]
+
+
 
 @app.get("/api/articles")
 def get_articles(
     offset: int = 0,
     limit: int = 20,
     topics: List[str] = Query([]),
-    date_min: Optional[str] = None
+    date_min: Optional[str] = None,
+    cursor: Optional[str] = None,
+    fields: str = "summary",
+    conn=Depends(get_db)
 ):
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+    """
+    Articles newest first. Pass the previous response's `next_cursor` as `cursor`
+    for constant-time deep paging (offset is then ignored). `fields` is "summary"
+    (default, no content body), "detail" or a comma-separated column list.
+    """
     try:
-        articles = fetch_articles(conn, topics, date_min, offset=offset, limit=limit)
-        return {"articles": articles}
+        after = decode_cursor(cursor) if cursor else None
+        article_columns(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        articles = fetch_articles(conn, topics, date_min, offset=offset, limit=limit, after=after, fields=fields)
+        return {"articles": articles, "next_cursor": next_cursor(articles, limit)}
     except Exception as e:
         print(f"[ERROR] {e}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
+
+
+@app.get("/api/articles/{url_id:int}")
+def get_article(url_id: int, conn=Depends(get_db)):
+    """One article with every column, including the scraped content body."""
+    try:
+        articles = hydrate_articles(conn, [url_id], fields="detail")
+    except Exception as e:
+        print(f"[ERROR] {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if not articles:
+        raise HTTPException(status_code=404, detail="Article not found")
+    return articles[0]
+
+
+# One mab_rank_snapshots row per logged ranking; its rank_logs rows share the snapshot_id.
+# Both are written in one transaction, so they also share created_at (NOW()).
+INSERT_MAB_RANK_SNAPSHOT = """
+    INSERT INTO mab_rank_snapshots (office_id, user_id, session_id)
+    VALUES (%s, %s, %s)
+    RETURNING snapshot_id
+"""
+
+MAB_RANK_LOG_COLUMNS = """
+    mab_rank_logs (
+        snapshot_id,
+        office_id, user_id, session_id,
+        url_id, rank_position,
+        impressions_count, clicks_count,
+        ucb_value, time_index_t, c_param,
+        filter_topics, filter_date
+    )
+"""
+
+# asyncpg executemany (pipelined, one statement per row)
+INSERT_MAB_RANK_LOG = f"""
+    INSERT INTO {MAB_RANK_LOG_COLUMNS}
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s::text[], %s)
+"""
+
+# psycopg2 execute_values: a whole ranking in a few multi-row INSERTs
+INSERT_MAB_RANK_LOGS = f"INSERT INTO {MAB_RANK_LOG_COLUMNS} VALUES %s"
+MAB_RANK_LOG_TEMPLATE = "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s::text[], %s)"
+
+
+def sample_mab_rank_log():
+    """Whether this request's ranking is written to mab_rank_logs."""
+    return LOG_MAB_RANKS and random.random() < MAB_RANK_LOG_SAMPLE_RATE
+
+
+def mab_rank_log_rows(snapshot_id, session, ranked_list, stats_dict, t, topics, date_min):
+    """mab_rank_logs rows for one ranking, capped at MAB_RANK_LOG_TOP_N ranks."""
+    user_id, session_id, office_id = session
+    if MAB_RANK_LOG_TOP_N:
+        ranked_list = ranked_list[:MAB_RANK_LOG_TOP_N]
+    rows = []
+    for rank_idx, (u_id, ucb_val) in enumerate(ranked_list):
+        N, S = stats_dict.get(u_id, (0, 0))
+        rows.append((
+            snapshot_id, office_id, user_id, session_id,
+            u_id, rank_idx + 1, N, S,
+            float(ucb_val), t, C_PARAM,
+            topics, date_min
+        ))
+    return rows
+
+
+def rank_candidates(candidates, offset, limit, log_ranks=False):
+    """
+    MAB ranking (vectorized over every candidate article) for /api/recommendations.
+    Returns (ranked_list of (url_id, ucb), stats_dict {url_id: (N, S)}, t).
+    """
+    article_ids = [url_id for (url_id, _, _) in candidates]
+    N_array = [N for (_, N, _) in candidates]
+    S_array = [S for (_, _, S) in candidates]
+    stats_dict = {url_id: (N, S) for (url_id, N, S) in candidates}
+    t = max(sum(N_array), 1)
+    if log_ranks and not MAB_RANK_LOG_TOP_N:
+        # The rank log records every candidate, so rank all of them
+        ranked_ids, ranked_ucbs = rank_articles_hellinger_ucb_batch(
+            article_ids, N_array, S_array, t, c=C_PARAM, cache=UCB_CACHE
+        )
+    else:
+        # Only the arms up to the end of the requested page (or the logged top N) need ordering
+        k = offset + limit
+        if log_ranks:
+            k = max(k, MAB_RANK_LOG_TOP_N)
+        ranked_ids, ranked_ucbs = top_k_hellinger_ucb_batch(
+            article_ids, N_array, S_array, t, c=C_PARAM, k=k, cache=UCB_CACHE
+        )
+    return list(zip(ranked_ids.tolist(), ranked_ucbs.tolist())), stats_dict, t
 
 
 @app.post("/api/recommendations")
-def get_recommendations(data: dict = Body(...), authorization: str = Header(None, alias="Authorization")):
+def get_recommendations(data: dict = Body(...), session: tuple = Depends(current_session), conn=Depends(get_db)):
     print(f"[DEBUG] /recommendations => Received request payload: {data} (type: {type(data)})")
-    
-    session_token = authorization
-    if not session_token:
-        print("[ERROR] /recommendations => No session token provided.")
-        raise HTTPException(status_code=401, detail="Session token required")
-    
+    user_id, session_id, office_id = session
+
     # Pagination
     try:
         offset = int(data.get("offset", 0))
         limit = int(data.get("limit", 20))
     except ValueError as e:
         raise HTTPException(status_code=400, detail="Invalid pagination parameters")
-
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-
+    fields = data.get("fields", "summary")
     try:
-        # Validate session token
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT users.user_id, sessions.session_id, users.office_id
-                FROM sessions
-                JOIN users ON sessions.user_id = users.user_id
-                WHERE sessions.session_token = %s AND sessions.expires_at > NOW()
-            """, (session_token,))
-            sess_row = cur.fetchone()
-            if not sess_row:
-                raise HTTPException(status_code=401, detail="Invalid or expired session token")
-            user_id, session_id, office_id = sess_row
+        article_columns(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
+    try:
         # Get filters from request
         topics = data.get("topics", [])
         date_min = data.get("date_min")
         articles = data.get("articles", [])
 
-        # Fetch articles with filters
-        all_articles = fetch_articles(conn, topics=topics, date_min=date_min, articles=articles, offset=0, limit=999999)
-        total_count = len(all_articles)
+        # Phase 1: candidate url_ids with this user's MAB stats (full rows are hydrated for the page below)
+        candidates = fetch_candidate_stats(conn, user_id, topics=topics, date_min=date_min, articles=articles)
+        total_count = len(candidates)
         if total_count == 0:
             return {"recommendations": [], "total_count": 0}
 
-        # Gather MAB stats using individual user data
-        article_ids = [a["url_id"] for a in all_articles]
-        mab_stats_query = """
-            SELECT url_id,
-                   SUM(pull_impressions) AS total_impressions,
-                   SUM(pull_clicks) AS total_clicks
-            FROM user_article_stats
-            WHERE user_id = %s
-              AND url_id = ANY(%s)
-            GROUP BY url_id;
-        """
-
-        stats_dict = {}
-        total_pulls = 0
-        with conn.cursor() as cur:
-            cur.execute(mab_stats_query, (user_id, list(article_ids)))
-            rows = cur.fetchall()
-            for url_id, impressions, clicks in rows:
-                N = impressions or 0
-                S = clicks or 0
-                stats_dict[url_id] = (N, S)
-                total_pulls += N
-
-        # MAB ranking
-        t = max(total_pulls, 1)
-        ranked_list = rank_articles_hellinger_ucb(article_ids, stats_dict, t, c=C_PARAM)
-        ucb_map = {aid: ucb for (aid, ucb) in ranked_list}
+        # MAB ranking (vectorized over every candidate article)
+        log_ranks = sample_mab_rank_log()
+        ranked_list, stats_dict, t = rank_candidates(candidates, offset, limit, log_ranks=log_ranks)
 
         # (Optional) LOG ephemeral MAB data with filters
-        if LOG_MAB_RANKS:
-            print("[DEBUG] => MAB rank logging is ENABLED; inserting ephemeral data into mab_rank_logs.")
+        if log_ranks:
             with conn.cursor() as cur:
-                for rank_idx, (u_id, ucb_val) in enumerate(ranked_list):
-                    rank_position = rank_idx + 1
-                    N, S = stats_dict.get(u_id, (0, 0))
-                    cur.execute("""
-                        INSERT INTO mab_rank_logs (
-                            office_id, user_id, session_id,
-                            url_id, rank_position,
-                            impressions_count, clicks_count,
-                            ucb_value, time_index_t, c_param,
-                            filter_topics, filter_date
-                        )
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s::text[], %s)
-                    """, (
-                        office_id,
-                        user_id,
-                        session_id,
-                        u_id,
-                        rank_position,
-                        N,
-                        S,
-                        float(ucb_val),
-                        t,
-                        C_PARAM,
-                        topics,    # Pass actual topics filter
-                        date_min   # Pass actual date filter
-                    ))
+                cur.execute(INSERT_MAB_RANK_SNAPSHOT, (office_id, user_id, session_id))
+                snapshot_id = cur.fetchone()[0]
+                rows = mab_rank_log_rows(snapshot_id, session, ranked_list, stats_dict, t, topics, date_min)
+                psycopg2.extras.execute_values(
+                    cur, INSERT_MAB_RANK_LOGS, rows, template=MAB_RANK_LOG_TEMPLATE, page_size=1000
+                )
             conn.commit()
 
-        # Sort articles based on MAB ranking
-        all_articles.sort(key=lambda a: ucb_map.get(a["url_id"], 0.0), reverse=True)
-
-        # Paginate
-        paged_articles = all_articles[offset : offset + limit]
-
-        # Insert pulls and log impressions
-        pull_ids = []
-        with conn.cursor() as cur:
-            for article in paged_articles:
-                cur.execute("""
-                    INSERT INTO pulls (
-                        user_id, url_id, office_id,
-                        filter_topics, filter_date,
-                        page_offset, created_at
-                    )
-                    VALUES (%s, %s, %s, %s::text[], %s, %s, NOW())
-                    RETURNING pull_id;
-                """, (
-                    user_id, article["url_id"], office_id,
-                    topics,    # Pass actual topics filter
-                    date_min,  # Pass actual date filter
-                    offset
-                ))
-                new_pull_id = cur.fetchone()[0]
-                pull_ids.append(new_pull_id)
-
-                cur.execute("""
-                    INSERT INTO user_article_stats (
-                        office_id, user_id, url_id, pull_id,
-                        pull_impressions, pull_clicks,
-                        pull_bookmarks, pull_adds
-                    )
-                    VALUES (%s, %s, %s, %s, 0, 0, 0, 0)
-                    ON CONFLICT (office_id, user_id, url_id, pull_id)
-                    DO NOTHING;
-                """, (
-                    office_id,
-                    user_id,
-                    article["url_id"],
-                    new_pull_id
-                ))
-            conn.commit()
+        # Paginate (ranked_list is already in UCB order), then phase 2: hydrate the page
+        paged_articles = hydrate_articles(conn, [aid for (aid, _) in ranked_list[offset : offset + limit]], fields=fields)
 
-        # Log impressions
-        log_impressions(
-            conn,
+        # Hand the page's pulls, per-pull stats and impressions to the background writer
+        page = impression_page(
             user_id,
             [a["url_id"] for a in paged_articles],
             session_id,
-            pull_ids,
-            office_id
+            office_id,
+            topics=topics,
+            date_min=date_min,
+            page_offset=offset
         )
+        if page["url_ids"] and not IMPRESSION_WRITER.submit(page, rows=len(page["url_ids"]), key=user_id):
+            # Writer stopped or queue full: write on the request path instead of dropping
+            print("[DEBUG] /recommendations => Impression queue unavailable; writing synchronously.")
+            write_impression_pages(conn, [page])
 
         return {"recommendations": paged_articles, "total_count": total_count}
     except Exception as e:
@@ -512,8 +955,6 @@ def get_recommendations(data: dict = Body(...), authorization: str = Header(None
         print(traceback.format_exc())
         conn.rollback()
         raise HTTPException(status_code=500, detail="An internal error occurred.")
-    finally:
-        conn.close()
 
 
 
@@ -694,31 +1135,14 @@ def get_recommendations(data: dict = Body(...), authorization: str = Header(None
 
 
 @app.get("/api/pulls")
-def get_pulls(authorization: str = Header(None, alias="Authorization")):
+def get_pulls(session: tuple = Depends(current_session), conn=Depends(get_db)):
     """
     Retrieve all pulls for the current user.
     """
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Session token required")
-
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+    user_id = session[0]
 
     try:
         with conn.cursor() as cur:
-            # Validate session token
-            cur.execute("""
-                SELECT user_id 
-                FROM sessions 
-                WHERE session_token = %s AND expires_at > NOW();
-            """, (authorization,))
-            sess = cur.fetchone()
-            if not sess:
-                raise HTTPException(status_code=401, detail="Invalid or expired session token")
-
-            user_id = sess[0]
-
             # Fetch pulls
             cur.execute("""
                 SELECT pull_id, url_id, filter_topics, filter_date, page_offset, created_at
@@ -745,12 +1169,10 @@ def get_pulls(authorization: str = Header(None, alias="Authorization")):
     except Exception as e:
         print(f"[ERROR] {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch pulls")
-    finally:
-        conn.close()
 
 
 @app.get("/api/user_article_stats")
-def get_user_article_stats(authorization: str = Header(None, alias="Authorization")):
+def get_user_article_stats(session: tuple = Depends(current_session), conn=Depends(get_db)):
     """
     Retrieve per-pull engagement stats for a user, including clicks, impressions, bookmarks, and adds.
 
@@ -759,26 +1181,10 @@ def get_user_article_stats(authorization: str = Header(None, alias="Authorizatio
     - Shows individual user stats, not office-wide aggregations.
     - Summarizes total engagement across all pulls for the user.
     """
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Session token required")
-
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+    user_id = session[0]
 
     try:
         with conn.cursor() as cur:
-            # 1️⃣ Get user_id from session
-            cur.execute("""
-                SELECT user_id FROM sessions 
-                WHERE session_token = %s 
-                  AND expires_at > NOW()
-            """, (authorization,))
-            sess_row = cur.fetchone()
-            if not sess_row:
-                raise HTTPException(status_code=401, detail="Invalid or expired session token")
-            user_id = sess_row[0]
-
             # 2️⃣ Fetch per-user engagement stats per pull
             cur.execute("""
                 SELECT url_id, pull_id, office_id, pull_impressions, pull_clicks, pull_bookmarks, pull_adds
@@ -788,15 +1194,23 @@ def get_user_article_stats(authorization: str = Header(None, alias="Authorizatio
             """, (user_id,))
             stats = cur.fetchall()
 
-            # 3️⃣ Calculate Summary Stats for User Engagement
+            # 3️⃣ Calculate Summary Stats for User Engagement (including rolled-up months)
             cur.execute("""
-                SELECT SUM(pull_clicks) AS total_clicks, 
-                       SUM(pull_impressions) AS total_impressions, 
-                       SUM(pull_bookmarks) AS total_bookmarks,
-                       SUM(pull_adds) AS total_adds
-                FROM user_article_stats
-                WHERE user_id = %s
-            """, (user_id,))
+                SELECT SUM(clicks) AS total_clicks, 
+                       SUM(impressions) AS total_impressions, 
+                       SUM(bookmarks) AS total_bookmarks,
+                       SUM(adds) AS total_adds
+                FROM (
+                    SELECT pull_clicks AS clicks, pull_impressions AS impressions,
+                           pull_bookmarks AS bookmarks, pull_adds AS adds
+                    FROM user_article_stats
+                    WHERE user_id = %s
+                    UNION ALL
+                    SELECT clicks, impressions, bookmarks, adds
+                    FROM daily_article_stats
+                    WHERE user_id = %s
+                ) AS stats
+            """, (user_id, user_id))
             summary_row = cur.fetchone()
             total_clicks = summary_row[0] or 0
             total_impressions = summary_row[1] or 0
@@ -831,154 +1245,220 @@ def get_user_article_stats(authorization: str = Header(None, alias="Authorizatio
     except psycopg2.Error as e:
         print(f"[ERROR] Database error: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch user article stats")
-    finally:
-        conn.close()
 
 
 
+# Months dropped by event_retention.py live on in daily_article_stats
+USER_MAB_STATS_QUERY = """
+    SELECT url_id,
+           SUM(clicks) AS total_clicks,
+           SUM(impressions) AS total_impressions,
+           SUM(clicks) * 1.0 / NULLIF(SUM(impressions), 0) AS user_ctr,
+           SUM(bookmarks) AS total_bookmarks,
+           SUM(adds) AS total_adds
+    FROM (
+        SELECT url_id, pull_clicks AS clicks, pull_impressions AS impressions,
+               pull_bookmarks AS bookmarks, pull_adds AS adds
+        FROM user_article_stats
+        WHERE user_id = %s
+        UNION ALL
+        SELECT url_id, clicks, impressions, bookmarks, adds
+        FROM daily_article_stats
+        WHERE user_id = %s
+    ) AS stats
+    GROUP BY url_id
+    ORDER BY user_ctr DESC
+"""
+
+
+def format_user_mab_stat(row):
+    return {
+        "url_id": row[0],
+        "total_clicks": row[1],
+        "total_impressions": row[2],
+        "user_ctr": round(row[3], 3) if row[3] is not None else 0.0,
+        "total_bookmarks": row[4],
+        "total_adds": row[5]
+    }
+
+
 @app.get("/api/user_mab_stats")
-def get_user_mab_stats(authorization: str = Header(None, alias="Authorization")):
+def get_user_mab_stats(session: tuple = Depends(current_session), conn=Depends(get_db)):
     """
     Retrieve per-pull engagement stats for all articles for the current user.
 
     No query params needed. The user_id is determined from the session token.
     """
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Session token required")
-    
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+    user_id = session[0]
     
     try:
         with conn.cursor() as cur:
-            # Validate session token and get the current user's user_id instead of office_id
-            cur.execute("""
-                SELECT user_id
-                FROM sessions
-                WHERE session_token = %s AND expires_at > NOW()
-            """, (authorization,))
-            sess_row = cur.fetchone()
-            if not sess_row:
-                raise HTTPException(status_code=401, detail="Invalid or expired session token")
-            user_id = sess_row[0]
-
             # Fetch per-pull engagement stats using user-specific data
-            cur.execute(
-                """
-                SELECT url_id,
-                       SUM(pull_clicks) AS total_clicks,
-                       SUM(pull_impressions) AS total_impressions,
-                       SUM(pull_clicks) * 1.0 / NULLIF(SUM(pull_impressions), 0) AS user_ctr,
-                       SUM(pull_bookmarks) AS total_bookmarks,
-                       SUM(pull_adds) AS total_adds
-                FROM user_article_stats
-                WHERE user_id = %s
-                GROUP BY url_id
-                ORDER BY user_ctr DESC
-                """,
-                (user_id,)
-            )
+            cur.execute(USER_MAB_STATS_QUERY, (user_id, user_id))
             stats = cur.fetchall()
         
-        return {
-            "user_mab_stats": [
-                {
-                    "url_id": row[0],
-                    "total_clicks": row[1],
-                    "total_impressions": row[2],
-                    "user_ctr": round(row[3], 3) if row[3] is not None else 0.0,
-                    "total_bookmarks": row[4],
-                    "total_adds": row[5]
-                }
-                for row in stats
-            ]
-        }
+        return {"user_mab_stats": [format_user_mab_stat(row) for row in stats]}
     
     except Exception as e:
         print(f"[ERROR] Failed to fetch MAB stats: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch MAB statistics")
-    
-    finally:
-        conn.close()
 
 
 
-# @app.get("/api/office_mab_stats")
-# def get_office_mab_stats(authorization: str = Header(None, alias="Authorization")):
-#     """
-#     Retrieve per-pull engagement stats for all articles in the office
-#     assigned to the currently logged-in user (from session).
+@app.get("/api/mab_cache_stats")
+def get_mab_cache_stats():
+    """
+    Hit/miss counters of the in-process Hellinger-UCB lookup tables.
+    """
+    return {"mab_cache_stats": UCB_CACHE.stats()}
+
+
+@app.get("/api/impression_writer_stats")
+def get_impression_writer_stats():
+    """
+    Queue depth, totals and ingest rate of the background impression writer.
+    """
+    return {"impression_writer_stats": IMPRESSION_WRITER.stats()}
+
+
+@app.get("/api/reference_cache_stats")
+def get_reference_cache_stats():
+    """
+    Hit/miss counters and catalog version of the topics/titles/dates cache, and the size of the title autocomplete index.
+    """
+    return {"reference_cache_stats": REFERENCE_CACHE.stats(), "title_index_stats": TITLE_INDEX.stats()}
+
+
+@app.get("/api/db_pool_stats")
+def get_db_pool_stats():
+    """
+    Checkouts, timeouts and in-use/idle connections of the database pool.
+    """
+    return {"db_pool_stats": pool_stats()}
+
+
+# Office rollup kept current by bump_arm_counters (n, s) and OFFICE_ENGAGEMENT_BUMPS (bookmarks, adds);
+# one row per article the office has seen, however many pulls it has accumulated
+OFFICE_MAB_STATS_QUERY = """
+    SELECT url_id,
+           s AS total_clicks,
+           n AS total_impressions,
+           s * 1.0 / NULLIF(n, 0) AS office_ctr,
+           bookmarks AS total_bookmarks,
+           adds AS total_adds
+    FROM office_arm_counters
+    WHERE office_id = %s
+    ORDER BY office_ctr DESC
+"""
+
+
+def format_office_mab_stat(row):
+    return {
+        "url_id": row[0],
+        "total_clicks": row[1],
+        "total_impressions": row[2],
+        "office_ctr": round(row[3], 3) if row[3] is not None else 0.0,
+        "total_bookmarks": row[4],
+        "total_adds": row[5]
+    }
+
+
+@app.get("/api/office_mab_stats")
+def get_office_mab_stats(session: tuple = Depends(current_session), conn=Depends(get_db)):
+    """
+    Retrieve engagement stats for all articles in the office of the
+    currently logged-in user, read from the office_arm_counters rollup.
+
+    No query params needed. The office_id is determined by the user's session token.
+    """
+    office_id = session[2]
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(OFFICE_MAB_STATS_QUERY, (office_id,))
+            stats = cur.fetchall()
+
+        return {"office_mab_stats": [format_office_mab_stat(row) for row in stats]}
+
+    except Exception as e:
+        print(f"[ERROR] Failed to fetch MAB stats: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch MAB statistics")
+
+
+# The pull's created_at bounds the queries on its interactions and stats below,
+# so they only scan the monthly partitions it can be in.
+LATEST_PULL_QUERY = f"""
+    SELECT pull_id, created_at
+    FROM pulls
+    WHERE user_id = %s AND url_id = %s
+      AND created_at >= NOW() - INTERVAL '{EVENT_RETENTION_MONTHS} months'
+    ORDER BY created_at DESC
+    LIMIT 1;
+"""
+# Params are (user_id, url_id, pull_id, pull created_at); interactions never precede their pull.
+CLICK_RECORDED_QUERY = """
+    SELECT 1 FROM user_interactions
+    WHERE user_id = %s AND url_id = %s AND pull_id = %s AND interaction_type = 'click'
+      AND interaction_time >= %s
+    LIMIT 1;
+"""
+INSERT_INTERACTION_QUERY = """
+    INSERT INTO user_interactions (user_id, url_id, pull_id, interaction_type, interaction_time)
+    VALUES (%s, %s, %s, %s, NOW());
+"""
+# Office rollup increments for non-click interactions; params are (office_id, url_id).
+OFFICE_ENGAGEMENT_BUMPS = {
+    "add": """
+        INSERT INTO office_arm_counters (office_id, url_id, adds)
+        VALUES (%s, %s, 1)
+        ON CONFLICT (office_id, url_id)
+        DO UPDATE SET adds = office_arm_counters.adds + 1;
+    """,
+    "bookmark": """
+        INSERT INTO office_arm_counters (office_id, url_id, bookmarks)
+        VALUES (%s, %s, 1)
+        ON CONFLICT (office_id, url_id)
+        DO UPDATE SET bookmarks = office_arm_counters.bookmarks + 1;
+    """,
+}
+# Per-pull stat update for each interaction type; params are (office_id, user_id, url_id, pull_id,
+# pull created_at). A stats row is written with its pull, so it has the pull's created_at.
+# Clicks add 2 (initially pull_clicks + 1 for office mab cold start).
+PULL_STAT_UPDATES = {
+    "click": """
+        UPDATE user_article_stats
+        SET pull_clicks = pull_clicks + 2, 
+            last_interaction = NOW()
+        WHERE office_id = %s 
+          AND user_id = %s 
+          AND url_id = %s 
+          AND pull_id = %s
+          AND created_at = %s;
+    """,
+    "add": """
+        UPDATE user_article_stats
+        SET pull_adds = pull_adds + 1
+        WHERE office_id = %s 
+          AND user_id = %s 
+          AND url_id = %s 
+          AND pull_id = %s
+          AND created_at = %s;
+    """,
+    "bookmark": """
+        UPDATE user_article_stats
+        SET pull_bookmarks = pull_bookmarks + 1,
+            last_interaction = NOW()
+        WHERE office_id = %s 
+          AND user_id = %s 
+          AND url_id = %s 
+          AND pull_id = %s
+          AND created_at = %s;
+    """,
+}
 
-#     No query params needed. The office_id is determined by the user's session token.
-#     """
-#     if not authorization:
-#         raise HTTPException(status_code=401, detail="Session token required")
-    
-#     conn = connect_db()
-#     if conn is None:
-#         raise HTTPException(status_code=500, detail="Database connection failed")
-    
-#     try:
-#         with conn.cursor() as cur:
-#             # 1. Validate session token & get user's office_id
-#             cur.execute(
-#                 """
-#                 SELECT users.office_id
-#                 FROM sessions
-#                 JOIN users ON sessions.user_id = users.user_id
-#                 WHERE sessions.session_token = %s
-#                   AND sessions.expires_at > NOW()
-#                 """,
-#                 (authorization,)
-#             )
-#             row = cur.fetchone()
-#             if not row:
-#                 raise HTTPException(status_code=401, detail="Invalid or expired session token")
-            
-#             office_id = row[0]  # The office_id from the user's record
-
-#             # 2. Fetch per-pull office-wide engagement stats
-#             cur.execute(
-#                 """
-#                 SELECT url_id,
-#                        SUM(pull_clicks) AS total_clicks,
-#                        SUM(pull_impressions) AS total_impressions,
-#                        SUM(pull_clicks) * 1.0 / NULLIF(SUM(pull_impressions), 0) AS office_ctr,
-#                        SUM(pull_bookmarks) AS total_bookmarks,
-#                        SUM(pull_adds) AS total_adds
-#                 FROM user_article_stats
-#                 WHERE office_id = %s
-#                 GROUP BY url_id
-#                 ORDER BY office_ctr DESC
-#                 """,
-#                 (office_id,)
-#             )
-#             stats = cur.fetchall()
-        
-#         return {
-#             "office_mab_stats": [
-#                 {
-#                     "url_id": row[0],
-#                     "total_clicks": row[1],
-#                     "total_impressions": row[2],
-#                     "office_ctr": round(row[3], 3) if row[3] is not None else 0.0,
-#                     "total_bookmarks": row[4],
-#                     "total_adds": row[5]
-#                 }
-#                 for row in stats
-#             ]
-#         }
-    
-#     except Exception as e:
-#         print(f"[ERROR] Failed to fetch MAB stats: {e}")
-#         raise HTTPException(status_code=500, detail="Failed to fetch MAB statistics")
-    
-#     finally:
-#         conn.close()
 
 @app.post("/api/interactions")
-def log_interaction(request: Request, data: dict = Body(...)):
+def log_interaction(data: dict = Body(...), session: tuple = Depends(settled_session), conn=Depends(get_db)):
     """
     Logs user interactions (clicks, adds, bookmarks) and updates `user_article_stats`.
 
@@ -986,121 +1466,59 @@ def log_interaction(request: Request, data: dict = Body(...)):
     - Bookmarks and adds are **cumulative per pull_id**.
     """
     print("[DEBUG] /interactions => Endpoint called.")
-    session_token = request.headers.get('Authorization')
     interaction_type = data.get("interaction_type")
     url_id = data.get("url_id")
+    user_id, _, office_id = session
 
     # Basic request validations
-    if not session_token:
-        print("[ERROR] /interactions => Session token missing.")
-        raise HTTPException(status_code=401, detail="Session token required")
-
     if not interaction_type or url_id is None:
         print("[ERROR] /interactions => Missing interaction_type or url_id in request body.")
         raise HTTPException(status_code=400, detail="interaction_type and url_id are required")
 
     print(f"[DEBUG] /interactions => Request data: interaction_type={interaction_type}, url_id={url_id}")
 
-    conn = connect_db()
-    if conn is None:
-        print("[ERROR] /interactions => Database connection failed.")
-        raise HTTPException(status_code=500, detail="Database connection failed")
-
     try:
         with conn.cursor() as cur:
-            # 1️⃣ Get user_id and office_id
-            print("[DEBUG] /interactions => Validating session...")
-            cur.execute("""
-                SELECT sessions.user_id, users.office_id
-                FROM sessions
-                JOIN users ON sessions.user_id = users.user_id
-                WHERE sessions.session_token = %s
-                AND sessions.expires_at > NOW();
-            """, (session_token,))
-            sess_row = cur.fetchone()
-
-            if not sess_row:
-                print("[ERROR] /interactions => Invalid or expired session token.")
-                raise HTTPException(status_code=401, detail="Invalid or expired session token")
-
-            user_id, office_id = sess_row
-            print(f"[DEBUG] /interactions => Session validated => user_id={user_id}, office_id={office_id}")
+            print(f"[DEBUG] /interactions => Session resolved => user_id={user_id}, office_id={office_id}")
 
             # 2️ Get latest pull_id for (user_id, url_id)
             print(f"[DEBUG] /interactions => Fetching latest pull_id for user_id={user_id}, url_id={url_id}")
-            cur.execute("""
-                SELECT pull_id 
-                FROM pulls
-                WHERE user_id = %s AND url_id = %s
-                ORDER BY created_at DESC
-                LIMIT 1;
-            """, (user_id, url_id))
+            cur.execute(LATEST_PULL_QUERY, (user_id, url_id))
             pull_row = cur.fetchone()
 
             if not pull_row:
                 print("[ERROR] /interactions => No active pull found for this article (pull_row is None).")
                 raise HTTPException(status_code=400, detail="No active pull found for this article")
 
-            pull_id = pull_row[0]
+            pull_id, pulled_at = pull_row
             print(f"[DEBUG] /interactions => Found pull_id={pull_id}")
 
             # 3️ Insert the raw interaction log and update stats
             if interaction_type == 'click':
                 # Check if a click has already been recorded for this user, article, and pull
-                cur.execute("""
-                    SELECT 1 FROM user_interactions
-                    WHERE user_id = %s AND url_id = %s AND pull_id = %s AND interaction_type = 'click'
-                    LIMIT 1;
-                """, (user_id, url_id, pull_id))
+                cur.execute(CLICK_RECORDED_QUERY, (user_id, url_id, pull_id, pulled_at))
                 already_clicked = cur.fetchone()
                 if already_clicked:
                     print("[DEBUG] /interactions => Click already recorded for pull_id. Ignoring duplicate click.")
                 else:
                     print("[DEBUG] /interactions => Inserting raw interaction log for click into user_interactions...")
-                    cur.execute("""
-                        INSERT INTO user_interactions (user_id, url_id, pull_id, interaction_type, interaction_time)
-                        VALUES (%s, %s, %s, %s, NOW());
-                    """, (user_id, url_id, pull_id, interaction_type))
-                    print(f"[DEBUG] /interactions => Incrementing pull_clicks for pull_id={pull_id}") # initially pull_clicks + 1 for office mab cold start
-                    cur.execute("""
-                        UPDATE user_article_stats
-                        SET pull_clicks = pull_clicks + 2, 
-                            last_interaction = NOW()
-                        WHERE office_id = %s 
-                          AND user_id = %s 
-                          AND url_id = %s 
-                          AND pull_id = %s;
-                    """, (office_id, user_id, url_id, pull_id))
+                    cur.execute(INSERT_INTERACTION_QUERY, (user_id, url_id, pull_id, interaction_type))
+                    print(f"[DEBUG] /interactions => Incrementing pull_clicks for pull_id={pull_id}")
+                    cur.execute(PULL_STAT_UPDATES["click"], (office_id, user_id, url_id, pull_id, pulled_at))
+                    # Mirror the pull_clicks increment in the bandit counters
+                    bump_arm_counters(cur, user_id, office_id, [url_id], s=2)
             else:
                 # For interactions that are not 'click', proceed normally
                 print("[DEBUG] /interactions => Inserting raw interaction log into user_interactions...")
-                cur.execute("""
-                    INSERT INTO user_interactions (user_id, url_id, pull_id, interaction_type, interaction_time)
-                    VALUES (%s, %s, %s, %s, NOW());
-                """, (user_id, url_id, pull_id, interaction_type))
-                if interaction_type == 'add':
-                    print(f"[DEBUG] /interactions => Incrementing pull_adds for pull_id={pull_id}")
-                    cur.execute("""
-                        UPDATE user_article_stats
-                        SET pull_adds = pull_adds + 1
-                        WHERE office_id = %s 
-                          AND user_id = %s 
-                          AND url_id = %s 
-                          AND pull_id = %s;
-                    """, (office_id, user_id, url_id, pull_id))
-                elif interaction_type == 'bookmark':
-                    print(f"[DEBUG] /interactions => Incrementing pull_bookmarks for pull_id={pull_id}")
-                    cur.execute("""
-                        UPDATE user_article_stats
-                        SET pull_bookmarks = pull_bookmarks + 1,
-                            last_interaction = NOW()
-                        WHERE office_id = %s 
-                          AND user_id = %s 
-                          AND url_id = %s 
-                          AND pull_id = %s;
-                    """, (office_id, user_id, url_id, pull_id))
+                cur.execute(INSERT_INTERACTION_QUERY, (user_id, url_id, pull_id, interaction_type))
+                if interaction_type in PULL_STAT_UPDATES:
+                    print(f"[DEBUG] /interactions => Incrementing pull_{interaction_type}s for pull_id={pull_id}")
+                    cur.execute(PULL_STAT_UPDATES[interaction_type], (office_id, user_id, url_id, pull_id, pulled_at))
+                if interaction_type in OFFICE_ENGAGEMENT_BUMPS:
+                    cur.execute(OFFICE_ENGAGEMENT_BUMPS[interaction_type], (office_id, url_id))
 
             print("[DEBUG] /interactions => Successfully updated user_article_stats.")
+            notify_dashboards(cur, [office_id])
 
             conn.commit()
             print("[DEBUG] /interactions => Transaction committed successfully.")
@@ -1117,19 +1535,13 @@ def log_interaction(request: Request, data: dict = Body(...)):
         print("[ERROR] /interactions => Unhandled exception encountered:")
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail="An internal error occurred")
-    finally:
-        conn.close()
-        print("[DEBUG] /interactions => Database connection closed.")
 
 
 @app.get("/api/articles/count")
-def get_articles_count():
+def get_articles_count(conn=Depends(get_db)):
     """
     Endpoint to get the total count of articles in the database.
     """
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
     try:
         query = "SELECT COUNT(*) FROM urls_content;"
         with conn.cursor() as cur:
@@ -1139,67 +1551,29 @@ def get_articles_count():
     except psycopg2.DatabaseError as e:
         print(f"[ERROR] Failed to fetch total articles count: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch total articles count")
-    finally:
-        conn.close()
 
 
 @app.get("/api/articles/dates")
-def get_publication_dates():
+def get_publication_dates(response: Response, if_none_match: Optional[str] = Header(None, alias="If-None-Match")):
     """
     Endpoint to retrieve a list of unique publication dates.
     """
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
     try:
-        query = """
-        SELECT DISTINCT DATE(publication_date) AS publication_date
-        FROM urls_content
-        ORDER BY publication_date DESC;
-        """
-        with conn.cursor() as cur:
-            cur.execute(query)
-            dates = cur.fetchall()
-        # Convert to a list of strings (e.g., "YYYY-MM-DD")
-        date_list = [date[0].strftime('%Y-%m-%d') for date in dates if date[0]]
-        return {"dates": date_list}
+        return reference_list("publication_dates", load_publication_dates, response, if_none_match)
     except psycopg2.Error as e:
         print(f"[ERROR] Database error: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch publication dates")
-    finally:
-        conn.close()
 
 
 @app.post("/api/add_page")
-def add_page(authorization: str = Header(None, alias="Authorization"), data: dict = Body(...)):
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Session token required")
-    
+def add_page(session: tuple = Depends(settled_session), data: dict = Body(...), conn=Depends(get_db)):
     url_id = data.get("url_id")
     if not url_id:
         raise HTTPException(status_code=400, detail="url_id is required")
     
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    
     try:
         with conn.cursor() as cur:
-            # Validate session token and retrieve user_id and office_id.
-            cur.execute(
-                """
-                SELECT user_id, office_id 
-                FROM sessions 
-                JOIN users USING(user_id)
-                WHERE session_token = %s 
-                  AND expires_at > NOW()
-                """,
-                (authorization,)
-            )
-            session_row = cur.fetchone()
-            if not session_row:
-                raise HTTPException(status_code=401, detail="Invalid or expired session token")
-            user_id, office_id = session_row
+            user_id, _, office_id = session
 
             # Insert into added_pages (with conflict handling)
             cur.execute(
@@ -1213,19 +1587,10 @@ def add_page(authorization: str = Header(None, alias="Authorization"), data: dic
             )
 
             # Try to fetch the latest pull_id for the given user and article.
-            cur.execute(
-                """
-                SELECT pull_id 
-                FROM pulls
-                WHERE user_id = %s AND url_id = %s
-                ORDER BY created_at DESC
-                LIMIT 1;
-                """,
-                (user_id, url_id)
-            )
+            cur.execute(LATEST_PULL_QUERY, (user_id, url_id))
             pull_row = cur.fetchone()
             if pull_row:
-                pull_id = pull_row[0]
+                pull_id, pulled_at = pull_row
 
                 # Insert a raw "add" interaction into user_interactions.
                 cur.execute(
@@ -1245,9 +1610,10 @@ def add_page(authorization: str = Header(None, alias="Authorization"), data: dic
                     WHERE office_id = %s 
                       AND user_id = %s 
                       AND url_id = %s 
-                      AND pull_id = %s;
+                      AND pull_id = %s
+                      AND created_at = %s;
                     """,
-                    (office_id, user_id, url_id, pull_id)
+                    (office_id, user_id, url_id, pull_id, pulled_at)
                 )
             else:
                 # Optionally, you could decide to log an error or create a pull.
@@ -1260,35 +1626,12 @@ def add_page(authorization: str = Header(None, alias="Authorization"), data: dic
         conn.rollback()
         print(f"[ERROR] /api/add_page encountered an error: {e}")
         raise HTTPException(status_code=500, detail="Failed to add page and log interaction")
-    
-    finally:
-        conn.close()
 
 @app.get("/api/added_pages")
-def get_added_pages(authorization: str = Header(None, alias="Authorization")):
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Session token required")
-    
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    
+def get_added_pages(session: tuple = Depends(current_session), conn=Depends(get_db)):
     try:
         with conn.cursor() as cur:
-            # Validate session token
-            cur.execute(
-                """
-                SELECT user_id 
-                FROM sessions 
-                WHERE session_token = %s 
-                  AND expires_at > NOW()
-                """,
-                (authorization,)
-            )
-            session_row = cur.fetchone()
-            if not session_row:
-                raise HTTPException(status_code=401, detail="Invalid or expired session token")
-            user_id = session_row[0]
+            user_id = session[0]
 
             # Fetch added articles with metadata from urls_content
             cur.execute(
@@ -1329,39 +1672,17 @@ def get_added_pages(authorization: str = Header(None, alias="Authorization")):
     except Exception as e:
         print(f"[ERROR] {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch added pages")
-    
-    finally:
-        conn.close()
 
 
 @app.delete("/api/added_pages/{url_id}")
-def remove_added_page(url_id: int, authorization: str = Header(None, alias="Authorization")):
+def remove_added_page(url_id: int, session: tuple = Depends(current_session), conn=Depends(get_db)):
     """
     Remove an added page by setting its removed_at timestamp.
     """
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Session token required")
-    
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
     
     try:
         with conn.cursor() as cur:
-            # Validate session token
-            cur.execute(
-                """
-                SELECT user_id 
-                FROM sessions 
-                WHERE session_token = %s 
-                  AND expires_at > NOW()
-                """,
-                (authorization,)
-            )
-            session_row = cur.fetchone()
-            if not session_row:
-                raise HTTPException(status_code=401, detail="Invalid or expired session token")
-            user_id = session_row[0]
+            user_id = session[0]
             
             # Update added_pages to mark the page as removed
             cur.execute(
@@ -1377,37 +1698,17 @@ def remove_added_page(url_id: int, authorization: str = Header(None, alias="Auth
     except Exception as e:
         print(f"[ERROR] {e}")
         raise HTTPException(status_code=500, detail="Failed to remove added page")
-    finally:
-        conn.close()
 
 
 @app.get("/api/added_pages/details")
-def get_added_pages_details(authorization: str = Header(None, alias="Authorization")):
+def get_added_pages_details(session: tuple = Depends(current_session), conn=Depends(get_db)):
     """
     Retrieve all added pages details (only pages that haven't been removed).
     """
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Session token required")
-    
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
     
     try:
         with conn.cursor() as cur:
-            # Validate session token and retrieve the user's id.
-            cur.execute(
-                """
-                SELECT user_id 
-                FROM sessions 
-                WHERE session_token = %s AND expires_at > NOW();
-                """,
-                (authorization,)
-            )
-            sess = cur.fetchone()
-            if not sess:
-                raise HTTPException(status_code=401, detail="Invalid or expired session token")
-            user_id = sess[0]
+            user_id = session[0]
             
             # Join added_pages and urls_content on url_id.
             cur.execute(
@@ -1436,32 +1737,13 @@ def get_added_pages_details(authorization: str = Header(None, alias="Authorizati
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
 
-        
+
 @app.get("/api/bookmarks")
-def get_bookmarks(authorization: str = Header(None, alias="Authorization")):
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Session token required")
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+def get_bookmarks(session: tuple = Depends(current_session), conn=Depends(get_db)):
     try:
         with conn.cursor() as cur:
-            # Validate session token and get user_id.
-            cur.execute(
-                """
-                SELECT user_id 
-                FROM sessions 
-                WHERE session_token = %s AND expires_at > NOW()
-                """,
-                (authorization,)
-            )
-            session_row = cur.fetchone()
-            if not session_row:
-                raise HTTPException(status_code=401, detail="Invalid or expired session token")
-            user_id = session_row[0]
+            user_id = session[0]
             # Fetch bookmarks along with metadata and the new grouping field.
             cur.execute(
                 """
@@ -1501,37 +1783,16 @@ def get_bookmarks(authorization: str = Header(None, alias="Authorization")):
     except Exception as e:
         print(f"[ERROR] {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch bookmarks")
-    finally:
-        conn.close()
 
 
 @app.post("/api/add_bookmark")
-def add_bookmark(authorization: str = Header(None, alias="Authorization"), data: dict = Body(...)):
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Session token required")
+def add_bookmark(session: tuple = Depends(settled_session), data: dict = Body(...), conn=Depends(get_db)):
     url_id = data.get("url_id")
     if not url_id:
         raise HTTPException(status_code=400, detail="url_id is required")
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
     try:
         with conn.cursor() as cur:
-            # Validate session token and retrieve user_id and office_id.
-            cur.execute(
-                """
-                SELECT user_id, office_id 
-                FROM sessions 
-                JOIN users USING(user_id)
-                WHERE session_token = %s 
-                  AND expires_at > NOW()
-                """,
-                (authorization,)
-            )
-            session_row = cur.fetchone()
-            if not session_row:
-                raise HTTPException(status_code=401, detail="Invalid or expired session token")
-            user_id, office_id = session_row
+            user_id, _, office_id = session
             # Insert into bookmarks (with conflict handling)
             cur.execute(
                 """
@@ -1542,20 +1803,13 @@ def add_bookmark(authorization: str = Header(None, alias="Authorization"), data:
                 """,
                 (user_id, url_id)
             )
+            # Precompute its near-duplicates for /api/bookmarks_candidates
+            store_bookmark_candidates(cur, user_id, url_id)
             # Try to fetch the latest pull_id for the given user and article.
-            cur.execute(
-                """
-                SELECT pull_id 
-                FROM pulls
-                WHERE user_id = %s AND url_id = %s
-                ORDER BY created_at DESC
-                LIMIT 1;
-                """,
-                (user_id, url_id)
-            )
+            cur.execute(LATEST_PULL_QUERY, (user_id, url_id))
             pull_row = cur.fetchone()
             if pull_row:
-                pull_id = pull_row[0]
+                pull_id, pulled_at = pull_row
                 # Log the raw "bookmark" interaction into user_interactions.
                 cur.execute(
                     """
@@ -1573,10 +1827,13 @@ def add_bookmark(authorization: str = Header(None, alias="Authorization"), data:
                     WHERE office_id = %s 
                       AND user_id = %s 
                       AND url_id = %s 
-                      AND pull_id = %s;
+                      AND pull_id = %s
+                      AND created_at = %s;
                     """,
-                    (office_id, user_id, url_id, pull_id)
+                    (office_id, user_id, url_id, pull_id, pulled_at)
                 )
+                cur.execute(OFFICE_ENGAGEMENT_BUMPS["bookmark"], (office_id, url_id))
+                notify_dashboards(cur, [office_id])
             else:
                 print("[WARNING] No pull found for user_id %s and url_id %s", user_id, url_id)
         conn.commit()
@@ -1585,38 +1842,17 @@ def add_bookmark(authorization: str = Header(None, alias="Authorization"), data:
         conn.rollback()
         print(f"[ERROR] /api/add_bookmark encountered an error: {e}")
         raise HTTPException(status_code=500, detail="Failed to add bookmark and log interaction")
-    finally:
-        conn.close()
 
 
 @app.delete("/api/bookmarks/{url_id}")
-def remove_bookmark(url_id: int, authorization: str = Header(None, alias="Authorization")):
+def remove_bookmark(url_id: int, session: tuple = Depends(current_session), conn=Depends(get_db)):
     """
     Remove a bookmark by setting its removed_at timestamp.
     """
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Session token required")
-    
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
     
     try:
         with conn.cursor() as cur:
-            # Validate session token and get user_id.
-            cur.execute(
-                """
-                SELECT user_id 
-                FROM sessions 
-                WHERE session_token = %s 
-                  AND expires_at > NOW()
-                """,
-                (authorization,)
-            )
-            session_row = cur.fetchone()
-            if not session_row:
-                raise HTTPException(status_code=401, detail="Invalid or expired session token")
-            user_id = session_row[0]
+            user_id = session[0]
             
             # Update bookmarks to mark the bookmark as removed.
             cur.execute(
@@ -1633,147 +1869,113 @@ def remove_bookmark(url_id: int, authorization: str = Header(None, alias="Author
         conn.rollback()
         print(f"[ERROR] {e}")
         raise HTTPException(status_code=500, detail="Failed to remove bookmark")
-    finally:
-        conn.close()
+
+
+# Candidate titles must clear this pg_trgm similarity to be scored at all (blocking);
+# kept well below what fuzz.ratio >= 85 implies so the GIN index doesn't drop true matches
+BOOKMARK_CANDIDATE_TRGM_THRESHOLD = float(os.environ.get("BOOKMARK_CANDIDATE_TRGM_THRESHOLD", 0.5))
+BOOKMARK_CANDIDATE_SIMILARITY = 85
+
+BOOKMARK_CANDIDATE_PAIRS_QUERY = """
+    SELECT o.title, c.url_id, c.title
+    FROM urls_content o
+    JOIN urls_content c ON c.title %% o.title AND c.url_id <> o.url_id
+    WHERE o.url_id = %s
+"""
+
+INSERT_BOOKMARK_CANDIDATES = """
+    INSERT INTO bookmark_candidates (user_id, original_url_id, candidate_url_id, similarity)
+    VALUES %s
+    ON CONFLICT (user_id, original_url_id, candidate_url_id)
+    DO UPDATE SET similarity = EXCLUDED.similarity
+"""
+
+BOOKMARK_CANDIDATES_QUERY = """
+    SELECT bc.original_url_id, bc.candidate_url_id, b.bookmarked_at,
+           o.title, c.title, c.publication_date, bc.similarity
+    FROM bookmark_candidates bc
+    JOIN bookmarks b
+      ON b.user_id = bc.user_id AND b.url_id = bc.original_url_id AND b.removed_at IS NULL
+    JOIN urls_content o ON o.url_id = bc.original_url_id
+    JOIN urls_content c ON c.url_id = bc.candidate_url_id
+    WHERE bc.user_id = %s
+      AND NOT EXISTS (
+          SELECT 1 FROM bookmarks x
+          WHERE x.user_id = bc.user_id AND x.url_id = bc.candidate_url_id AND x.removed_at IS NULL
+      )
+    ORDER BY c.publication_date ASC, bc.candidate_url_id, bc.similarity DESC
+"""
+
+
+def store_bookmark_candidates(cur, user_id, url_id):
+    """
+    Match one bookmark against the whole corpus and upsert its near-duplicates
+    into bookmark_candidates. The pg_trgm `%` operator (idx_urls_content_title_trgm)
+    blocks the corpus down to a handful of similar titles; only those are scored
+    with fuzz.ratio. Titles scraped later are matched by the scraper.
+    """
+    cur.execute("SELECT set_config('pg_trgm.similarity_threshold', %s, true)", (str(BOOKMARK_CANDIDATE_TRGM_THRESHOLD),))
+    cur.execute(BOOKMARK_CANDIDATE_PAIRS_QUERY, (url_id,))
+    rows = []
+    for original_title, candidate_url_id, candidate_title in cur.fetchall():
+        similarity = fuzz.ratio(original_title, candidate_title)
+        if similarity >= BOOKMARK_CANDIDATE_SIMILARITY:
+            rows.append((user_id, url_id, candidate_url_id, similarity))
+    if rows:
+        psycopg2.extras.execute_values(cur, INSERT_BOOKMARK_CANDIDATES, rows)
+    return len(rows)
 
 
 @app.get("/api/bookmarks_candidates")
-def get_bookmark_candidates(authorization: str = Header(None, alias="Authorization")):
+def get_bookmark_candidates(session: tuple = Depends(current_session), conn=Depends(get_db)):
     """
-    For each bookmarked article, scan all scraped articles (urls_content)
-    and use fuzzy matching on the title. If the similarity is above a given
-    threshold (e.g., >= 90), consider it a candidate updated version.
-    Exclude any articles already in the user's bookmarks from the results.
+    Likely updated versions of the user's bookmarked articles: the precomputed
+    near-identical titles (fuzz.ratio >= 85) in bookmark_candidates, excluding
+    articles already in the user's bookmarks. One indexed read.
     """
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Session token required")
-    
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
     
     try:
         with conn.cursor() as cur:
-            # 1) Validate session token & get user_id.
-            cur.execute(
-                """
-                SELECT user_id 
-                FROM sessions 
-                WHERE session_token = %s 
-                  AND expires_at > NOW()
-                """,
-                (authorization,)
-            )
-            row = cur.fetchone()
-            if not row:
-                raise HTTPException(status_code=401, detail="Invalid or expired session token")
-            user_id = row[0]
-            
-            # 2) Get all the user's active bookmarks for exclusion.
-            cur.execute(
-                """
-                SELECT url_id 
-                FROM bookmarks
-                WHERE user_id = %s
-                  AND removed_at IS NULL
-                """,
-                (user_id,)
-            )
-            already_bookmarked = set(b[0] for b in cur.fetchall())
-            
-            # 3) Fetch all active bookmarks for this user along with their title.
-            cur.execute(
-                """
-                SELECT 
-                    b.url_id,
-                    b.bookmarked_at,
-                    uc.title,
-                    uc.publication_date
-                FROM bookmarks b
-                JOIN urls_content uc ON b.url_id = uc.url_id
-                WHERE b.user_id = %s AND b.removed_at IS NULL
-                """,
-                (user_id,)
-            )
-            user_bookmarks = cur.fetchall()
-            
-            similarity_threshold = 85
+            user_id = session[0]
+
+            # Precomputed candidates, oldest publication first.
+            cur.execute(BOOKMARK_CANDIDATES_QUERY, (user_id,))
             candidates = []
             unique_candidate_ids = set()
-            
-            for bm in user_bookmarks:
-                original_url_id, bookmarked_at, original_title, original_pub_date = bm
-                
-                # 4) Find all articles that are NOT the same URL and NOT already bookmarked.
-                cur.execute(
-                    """
-                    SELECT url_id, title, publication_date
-                    FROM urls_content
-                    WHERE url_id != %s
-                    AND url_id NOT IN %s
-                    """,
-                    (original_url_id, tuple(already_bookmarked))
-                )
-                all_articles = cur.fetchall()
-                
-                # 5) Fuzzy match each candidate.
-                for article in all_articles:
-                    candidate_url_id, candidate_title, candidate_pub_date = article
-                    similarity = fuzz.ratio(original_title, candidate_title)
-                    if similarity >= similarity_threshold:
-                        if candidate_url_id not in unique_candidate_ids:
-                            candidate = {
-                                "user_id": user_id,
-                                "original_url_id": original_url_id,
-                                "candidate_url_id": candidate_url_id,
-                                "bookmarked_at": bookmarked_at,
-                                "original_title": original_title,
-                                "candidate_title": candidate_title,
-                                "candidate_publication_date": candidate_pub_date,
-                                "similarity": similarity
-                            }
-                            candidates.append(candidate)
-                            unique_candidate_ids.add(candidate_url_id)
-            
-            # 6) Sort candidates by publication date in ascending order.
-            candidates.sort(key=lambda candidate: candidate["candidate_publication_date"])
-            
-            # 7) Return the candidate list in the response.
+            for (original_url_id, candidate_url_id, bookmarked_at, original_title,
+                 candidate_title, candidate_pub_date, similarity) in cur.fetchall():
+                # An article similar to several bookmarks is listed once
+                if candidate_url_id in unique_candidate_ids:
+                    continue
+                unique_candidate_ids.add(candidate_url_id)
+                candidates.append({
+                    "user_id": user_id,
+                    "original_url_id": original_url_id,
+                    "candidate_url_id": candidate_url_id,
+                    "bookmarked_at": bookmarked_at,
+                    "original_title": original_title,
+                    "candidate_title": candidate_title,
+                    "candidate_publication_date": candidate_pub_date,
+                    "similarity": similarity
+                })
+
+            # Return the candidate list in the response.
             return {"bookmark_candidates": candidates}
     except Exception as e:
         print(f"[ERROR] {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch bookmark candidates")
-    finally:
-        conn.close()
-@app.post("/api/confirm_bookmark_candidate")
-def confirm_bookmark_candidate(authorization: str = Header(None, alias="Authorization"), data: dict = Body(...)):
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Session token required")
 
+
+@app.post("/api/confirm_bookmark_candidate")
+def confirm_bookmark_candidate(session: tuple = Depends(current_session), data: dict = Body(...), conn=Depends(get_db)):
     original_url_id = data.get("original_url_id")
     candidate_url_id = data.get("candidate_url_id")
     if original_url_id is None or candidate_url_id is None:
         raise HTTPException(status_code=400, detail="Both original_url_id and candidate_url_id are required")
 
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-
     try:
         with conn.cursor() as cur:
-            # Validate session token and get user_id.
-            cur.execute(
-                """
-                SELECT user_id 
-                FROM sessions 
-                WHERE session_token = %s AND expires_at > NOW()
-                """,
-                (authorization,)
-            )
-            session_row = cur.fetchone()
-            if not session_row:
-                raise HTTPException(status_code=401, detail="Invalid or expired session token")
-            user_id = session_row[0]
+            user_id = session[0]
 
             # Optionally verify candidate exists in urls_content.
             cur.execute(
@@ -1809,71 +2011,35 @@ def confirm_bookmark_candidate(authorization: str = Header(None, alias="Authoriz
             cur.execute(
                 """
                 INSERT INTO bookmarks (user_id, url_id, bookmarked_at, journal_series_id)
-                VALUES (%s, %s, NOW(), %s)
-                ON CONFLICT (user_id, url_id)
-                DO UPDATE SET 
-                  bookmarked_at = EXCLUDED.bookmarked_at,
-                  removed_at = NULL,
-                  journal_series_id = EXCLUDED.journal_series_id;
-                """,
-                (user_id, candidate_url_id, series_id)
-            )
-            conn.commit()
-        return {"message": "Bookmark candidate confirmed successfully"}
-    except Exception as e:
-        conn.rollback()
-        print(f"[ERROR] {e}")
-        raise HTTPException(status_code=500, detail="Failed to confirm bookmark candidate")
-    finally:
-        conn.close()
-
-
-
-@app.get("/api/mab_rank_logs")
-def get_mab_rank_logs(
-    office_id: Optional[str] = Query(None),
-    user_id: Optional[str] = Query(None),
-    session_id: Optional[str] = Query(None),
-    start_date: Optional[str] = Query(None),
-    end_date: Optional[str] = Query(None)
-):
-    """
-    Retrieve the latest MAB ranking data from the mab_rank_logs table.
-    Instead of returning all logs, returns only the rows whose created_at matches the latest value.
-    Optional query params:
-      - office_id
-      - user_id
-      - session_id
-      - start_date (YYYY-MM-DD)
-      - end_date (YYYY-MM-DD)
-    """
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    
-    # Base query to select all columns from mab_rank_logs.
-    base_query = """
-        SELECT
-            mab_rank_log_id,
-            created_at,
-            office_id,
-            user_id,
-            session_id,
-            url_id,
-            rank_position,
-            impressions_count,
-            clicks_count,
-            ucb_value,
-            time_index_t,
-            c_param,
-            filter_topics,
-            filter_date
-        FROM mab_rank_logs
-        WHERE 1=1
+                VALUES (%s, %s, NOW(), %s)
+                ON CONFLICT (user_id, url_id)
+                DO UPDATE SET 
+                  bookmarked_at = EXCLUDED.bookmarked_at,
+                  removed_at = NULL,
+                  journal_series_id = EXCLUDED.journal_series_id;
+                """,
+                (user_id, candidate_url_id, series_id)
+            )
+            store_bookmark_candidates(cur, user_id, candidate_url_id)
+            conn.commit()
+        return {"message": "Bookmark candidate confirmed successfully"}
+    except Exception as e:
+        conn.rollback()
+        print(f"[ERROR] {e}")
+        raise HTTPException(status_code=500, detail="Failed to confirm bookmark candidate")
+
+
+
+def mab_rank_logs_query(office_id=None, user_id=None, session_id=None, start_date=None, end_date=None):
+    """
+    (sql, params) selecting the latest mab_rank_logs snapshot matching the filters.
+    The newest matching snapshot comes from an index-only LIMIT 1 scan of the
+    small mab_rank_snapshots table; only that snapshot's log rows are read, from
+    the one monthly partition its created_at falls in.
     """
     filters = []
     params = []
-    
+
     if office_id:
         filters.append("AND office_id = %s")
         params.append(office_id)
@@ -1889,77 +2055,97 @@ def get_mab_rank_logs(
     if end_date:
         filters.append("AND created_at <= %s")
         params.append(end_date)
-    
-    # Combine into a CTE, then select only the rows with the latest created_at.
+
     final_query = f"""
-        WITH filtered_logs AS (
-            {base_query} {' '.join(filters)}
+        SELECT
+            mab_rank_log_id,
+            created_at,
+            office_id,
+            user_id,
+            session_id,
+            url_id,
+            rank_position,
+            impressions_count,
+            clicks_count,
+            ucb_value,
+            time_index_t,
+            c_param,
+            filter_topics,
+            filter_date
+        FROM mab_rank_logs
+        WHERE (snapshot_id, created_at) = (
+            SELECT snapshot_id, created_at
+            FROM mab_rank_snapshots
+            WHERE 1=1 {' '.join(filters)}
+            ORDER BY created_at DESC, snapshot_id DESC
+            LIMIT 1
         )
-        SELECT *
-        FROM filtered_logs
-        WHERE created_at = (SELECT MAX(created_at) FROM filtered_logs)
-        ORDER BY created_at DESC
+        ORDER BY rank_position
+    """
+    return final_query, params
+
+
+def format_mab_rank_log(row):
+    return {
+        "mab_rank_log_id": row[0],
+        "created_at": row[1].isoformat() if row[1] else None,
+        "office_id": str(row[2]) if row[2] else None,
+        "user_id": str(row[3]) if row[3] else None,
+        "session_id": str(row[4]) if row[4] else None,
+        "url_id": row[5],
+        "rank_position": row[6],
+        "impressions_count": row[7],
+        "clicks_count": row[8],
+        "ucb_value": row[9],
+        "time_index_t": row[10],
+        "c_param": row[11],
+        "filter_topics": row[12],
+        "filter_date": row[13].isoformat() if row[13] else None
+    }
+
+
+@app.get("/api/mab_rank_logs")
+def get_mab_rank_logs(
+    office_id: Optional[str] = Query(None),
+    user_id: Optional[str] = Query(None),
+    session_id: Optional[str] = Query(None),
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None),
+    conn=Depends(get_db)
+):
+    """
+    Retrieve the latest MAB ranking data from the mab_rank_logs table.
+    Instead of returning all logs, returns only the rows of the latest matching snapshot.
+    Optional query params:
+      - office_id
+      - user_id
+      - session_id
+      - start_date (YYYY-MM-DD)
+      - end_date (YYYY-MM-DD)
     """
     
+    final_query, params = mab_rank_logs_query(office_id, user_id, session_id, start_date, end_date)
+    
     try:
         with conn.cursor() as cur:
             cur.execute(final_query, tuple(params))
             rows = cur.fetchall()
-            result = []
-            for row in rows:
-                result.append({
-                    "mab_rank_log_id": row[0],
-                    "created_at": row[1].isoformat() if row[1] else None,
-                    "office_id": str(row[2]) if row[2] else None,
-                    "user_id": str(row[3]) if row[3] else None,
-                    "session_id": str(row[4]) if row[4] else None,
-                    "url_id": row[5],
-                    "rank_position": row[6],
-                    "impressions_count": row[7],
-                    "clicks_count": row[8],
-                    "ucb_value": row[9],
-                    "time_index_t": row[10],
-                    "c_param": row[11],
-                    "filter_topics": row[12],
-                    "filter_date": row[13].isoformat() if row[13] else None
-                })
+            result = [format_mab_rank_log(row) for row in rows]
         return {"mab_rank_logs": result}
     except Exception as e:
         print(f"[ERROR] Failed to fetch mab_rank_logs: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch mab_rank_logs")
-    finally:
-        conn.close()
 
 
 @app.get("/api/office_users")
-def get_office_users(authorization: str = Header(None, alias="Authorization")):
+def get_office_users(session: tuple = Depends(current_session), conn=Depends(get_db)):
     """
     Retrieve office users by validating the session token then joining users with offices.
     """
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Session token required")
-    
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+    _, _, office_id = session
     
     try:
         with conn.cursor() as cur:
-            # Validate session token and get the user's office_id.
-            cur.execute(
-                """
-                SELECT u.office_id 
-                FROM sessions s
-                JOIN users u ON s.user_id = u.user_id
-                WHERE s.session_token = %s AND s.expires_at > NOW();
-                """,
-                (authorization,)
-            )
-            row = cur.fetchone()
-            if not row:
-                raise HTTPException(status_code=401, detail="Invalid or expired session token")
-            office_id = row[0]
-            
             # Join users with offices to fetch the office_code.
             cur.execute(
                 """
@@ -1984,38 +2170,19 @@ def get_office_users(authorization: str = Header(None, alias="Authorization")):
         return {"users": users}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
 
 
 
 
 @app.get("/api/office_user_interactions")
-def get_office_user_interactions(authorization: str = Header(None, alias="Authorization")):
+def get_office_user_interactions(session: tuple = Depends(current_session), conn=Depends(get_db)):
     """
     Retrieves office user interactions for users in the same office as the logged-in user.
     """
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Session token required")
-    
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+    _, _, office_id = session
     
     try:
         with conn.cursor() as cur:
-            # Validate session token and get the user's office_id.
-            cur.execute("""
-                SELECT u.office_id 
-                FROM sessions s
-                JOIN users u ON s.user_id = u.user_id
-                WHERE s.session_token = %s AND s.expires_at > NOW();
-            """, (authorization,))
-            row = cur.fetchone()
-            if not row:
-                raise HTTPException(status_code=401, detail="Invalid or expired session token")
-            office_id = row[0]
-            
             # Revised join: using d.defensenews_url_id instead of d.url_id.
             cur.execute("""
                 SELECT u.username, uc.title, d.defensenews_url, ui.interaction_type, ui.interaction_time
@@ -2048,16 +2215,11 @@ def get_office_user_interactions(authorization: str = Header(None, alias="Author
     except Exception as e:
         print(f"[ERROR] get_office_user_interactions: {e}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
 
 
 
 @app.post("/api/templates", status_code=201)
-def create_template(data: dict = Body(...), authorization: str = Header(None, alias="Authorization")):
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Session token required")
-    
+def create_template(data: dict = Body(...), session: tuple = Depends(current_session), conn=Depends(get_db)):
     name = data.get("name")
     description = data.get("description")
     content = data.get("content")  # This contains the sections data
@@ -2065,21 +2227,9 @@ def create_template(data: dict = Body(...), authorization: str = Header(None, al
     if not name or not content:
         raise HTTPException(status_code=400, detail="Template name and content are required")
     
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    
     try:
         with conn.cursor() as cur:
-            # Get user_id from session
-            cur.execute("""
-                SELECT user_id FROM sessions 
-                WHERE session_token = %s AND expires_at > NOW();
-            """, (authorization,))
-            sess_row = cur.fetchone()
-            if not sess_row:
-                raise HTTPException(status_code=401, detail="Invalid or expired session token")
-            user_id = sess_row[0]
+            user_id = session[0]
     
             # Insert template
             cur.execute("""
@@ -2127,34 +2277,19 @@ def create_template(data: dict = Body(...), authorization: str = Header(None, al
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-            conn.close()
 
 @app.get("/api/templates")
 def get_templates(
     archived: bool = Query(False),
     limit: int = Query(10),
     offset: int = Query(0),
-    authorization: str = Header(None, alias="Authorization")
+    session: tuple = Depends(current_session),
+    conn=Depends(get_db)
 ):
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Session token required")
-    
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
     
     try:
         with conn.cursor() as cur:
-            # Get user_id from session
-            cur.execute("""
-                SELECT user_id FROM sessions 
-                WHERE session_token = %s AND expires_at > NOW();
-            """, (authorization,))
-            sess_row = cur.fetchone()
-            if not sess_row:
-                raise HTTPException(status_code=401, detail="Invalid or expired session token")
-            user_id = sess_row[0]
+            user_id = session[0]
     
             # Get templates
             cur.execute("""
@@ -2178,29 +2313,12 @@ def get_templates(
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
 
 @app.get("/api/templates/{template_id}")
-def get_template(template_id: int, authorization: str = Header(None, alias="Authorization")):
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Session token required")
-    
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    
+def get_template(template_id: int, session: tuple = Depends(current_session), conn=Depends(get_db)):
     try:
         with conn.cursor() as cur:
-            # Get user_id from session
-            cur.execute("""
-                SELECT user_id FROM sessions 
-                WHERE session_token = %s AND expires_at > NOW();
-            """, (authorization,))
-            sess_row = cur.fetchone()
-            if not sess_row:
-                raise HTTPException(status_code=401, detail="Invalid or expired session token")
-            user_id = sess_row[0]
+            user_id = session[0]
     
             # Get template metadata
             cur.execute("""
@@ -2280,18 +2398,14 @@ def get_template(template_id: int, authorization: str = Header(None, alias="Auth
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
 
 @app.put("/api/templates/{template_id}")
 def update_template(
     template_id: int,
     data: dict = Body(...),
-    authorization: str = Header(None, alias="Authorization")
+    session: tuple = Depends(current_session),
+    conn=Depends(get_db)
 ):
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Session token required")
-    
     name = data.get("name")
     description = data.get("description")
     content = data.get("content")  # This contains the sections data
@@ -2299,21 +2413,9 @@ def update_template(
     if not name or not content:
         raise HTTPException(status_code=400, detail="Template name and content are required")
     
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    
     try:
         with conn.cursor() as cur:
-            # Get user_id from session
-            cur.execute("""
-                SELECT user_id FROM sessions 
-                WHERE session_token = %s AND expires_at > NOW();
-            """, (authorization,))
-            sess_row = cur.fetchone()
-            if not sess_row:
-                raise HTTPException(status_code=401, detail="Invalid or expired session token")
-            user_id = sess_row[0]
+            user_id = session[0]
     
             # Verify template exists and belongs to user
             cur.execute("""
@@ -2373,39 +2475,23 @@ def update_template(
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        conn.close()
 
 @app.patch("/api/templates/{template_id}/archive")
 def archive_template(
     template_id: int,
     data: dict = Body(...),
-    authorization: str = Header(None, alias="Authorization")
+    session: tuple = Depends(current_session),
+    conn=Depends(get_db)
 ):
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Session token required")
-    
     is_archived = data.get("is_archived")
     if is_archived is None:
         raise HTTPException(status_code=400, detail="is_archived field is required")
     
     print(f"[DEBUG] Archiving template {template_id}, is_archived={is_archived}")
     
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    
     try:
         with conn.cursor() as cur:
-            # Get user_id from session
-            cur.execute("""
-                SELECT user_id FROM sessions 
-                WHERE session_token = %s AND expires_at > NOW();
-            """, (authorization,))
-            sess_row = cur.fetchone()
-            if not sess_row:
-                raise HTTPException(status_code=401, detail="Invalid or expired session token")
-            user_id = sess_row[0]
+            user_id = session[0]
     
             print(f"[DEBUG] User {user_id} attempting to archive template {template_id}")
 
@@ -2457,24 +2543,10 @@ def archive_template(
         print(f"[ERROR] Failed to archive template {template_id}: {str(e)}")
         conn.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to archive template: {str(e)}")
-    finally:
-        conn.close()
 
 @app.post("/api/articles/filter")
-def filter_articles(data: dict = Body(...), authorization: str = Header(None, alias="Authorization")):
-    if not authorization:
-        raise HTTPException(status_code=401, detail="Session token required")
-    conn = connect_db()
-    if conn is None:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+def filter_articles(data: dict = Body(...), session: tuple = Depends(current_session), conn=Depends(get_db)):
     try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT user_id FROM sessions WHERE session_token = %s AND expires_at > NOW()", (authorization,))
-            sess = cur.fetchone()
-            if not sess:
-                raise HTTPException(status_code=401, detail="Invalid or expired session token")
-            user_id = sess[0]
-        
         topics = data.get("topics", [])
         if isinstance(topics, str):
             try:
@@ -2517,13 +2589,349 @@ def filter_articles(data: dict = Body(...), authorization: str = Header(None, al
         try:
             offset = int(data.get("offset", 0))
             limit = int(data.get("limit", 20))
+            # Keyset cursor from the previous page's next_cursor (takes precedence over offset)
+            after = decode_cursor(data["cursor"]) if data.get("cursor") else None
         except ValueError as e:
             raise HTTPException(status_code=400, detail="Invalid pagination parameters")
+        fields = data.get("fields", "summary")
+        try:
+            article_columns(fields)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
-        filtered_articles = fetch_articles(conn, topics=topics, date_min=date_min, articles=articles, offset=offset, limit=limit)
-        total_count = len(fetch_articles(conn, topics=topics, date_min=date_min, articles=articles, offset=0, limit=999999))
-        return {"recommendations": filtered_articles, "total_count": total_count}
+        # "exact" (default) or "estimated" (planner row estimate for broad filters)
+        estimated = data.get("count_mode") == "estimated"
+
+        filtered_articles = fetch_articles(conn, topics=topics, date_min=date_min, articles=articles, offset=offset, limit=limit, after=after, fields=fields)
+        total_count, is_estimate = count_articles(conn, topics=topics, date_min=date_min, articles=articles, estimated=estimated)
+        return {
+            "recommendations": filtered_articles,
+            "total_count": total_count,
+            "total_count_estimated": is_estimate,
+            "next_cursor": next_cursor(filtered_articles, limit)
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail="An internal error occurred.")
-    finally:
-        conn.close()
\ No newline at end of file
+
+
+
+# ------------------------------------------------------------------
+# Async (asyncpg) endpoints
+#
+# Same behaviour as the sync routes above, but the database I/O is awaited on
+# an asyncpg pool instead of blocking a threadpool worker, so one uvicorn
+# worker can serve many concurrent users. The SQL is shared with the sync
+# routes (async_db.pg_query converts the placeholders).
+# ------------------------------------------------------------------
+
+def _plain(value):
+    """asyncpg returns uuid.UUID; psycopg2 (and SESSION_CACHE) use str."""
+    return str(value) if isinstance(value, uuid.UUID) else value
+
+
+def _as_datetime(value):
+    """asyncpg needs real date/time values where psycopg2 accepted 'YYYY-MM-DD' strings."""
+    if isinstance(value, str) and value:
+        return datetime.fromisoformat(value)
+    return value or None
+
+
+async def _async_pool():
+    try:
+        return await get_async_pool()
+    except Exception as e:
+        print("[ERROR] Async database connection failed:", e)
+        raise HTTPException(status_code=500, detail="Database connection failed")
+
+
+async def current_session_async(authorization: str = Header(None, alias="Authorization")):
+    """Async counterpart of current_session (shares SESSION_CACHE)."""
+    if not authorization:
+        raise HTTPException(status_code=401, detail="Session token required")
+    cached = SESSION_CACHE.get(authorization)
+    if cached is not None:
+        return cached
+    pool = await _async_pool()
+    async with pool.acquire() as conn:
+        sess_row = await async_db.fetchrow(conn, SESSION_LOOKUP_QUERY, (authorization,))
+    if not sess_row:
+        raise HTTPException(status_code=401, detail="Invalid or expired session token")
+    user_id, session_id, office_id, expires_at = sess_row
+    return SESSION_CACHE.put(authorization, (_plain(user_id), _plain(session_id), _plain(office_id)), expires_at)
+
+
+@app.post("/api/async/recommendations")
+async def get_recommendations_async(data: dict = Body(...), session: tuple = Depends(current_session_async)):
+    user_id, session_id, office_id = session
+    try:
+        offset = int(data.get("offset", 0))
+        limit = int(data.get("limit", 20))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail="Invalid pagination parameters")
+    try:
+        hydrate_query = hydrate_articles_query(data.get("fields", "summary"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    topics = data.get("topics", [])
+    date_min = data.get("date_min")
+    articles = data.get("articles", [])
+
+    pool = await _async_pool()
+    try:
+        async with pool.acquire() as conn:
+            # Phase 1: candidate url_ids with this user's MAB stats
+            query, params = candidate_stats_query(user_id, topics=topics, date_min=date_min, articles=articles)
+            candidates = [(url_id, int(n), int(s)) for url_id, n, s in await async_db.fetch(conn, query, params)]
+            total_count = len(candidates)
+            if total_count == 0:
+                return {"recommendations": [], "total_count": 0}
+
+            log_ranks = sample_mab_rank_log()
+            ranked_list, stats_dict, t = rank_candidates(candidates, offset, limit, log_ranks=log_ranks)
+
+            if log_ranks:
+                async with conn.transaction():
+                    snapshot_id = await async_db.fetchval(
+                        conn, INSERT_MAB_RANK_SNAPSHOT, (office_id, user_id, session_id)
+                    )
+                    await async_db.executemany(conn, INSERT_MAB_RANK_LOG, mab_rank_log_rows(
+                        snapshot_id, session, ranked_list, stats_dict, t, topics, _as_datetime(date_min)
+                    ))
+
+            # Phase 2: hydrate the page
+            page_ids = [aid for (aid, _) in ranked_list[offset : offset + limit]]
+            rows_by_id = {row["url_id"]: dict(row) for row in await async_db.fetch(conn, hydrate_query, (page_ids,))}
+            paged_articles = [rows_by_id[url_id] for url_id in page_ids if url_id in rows_by_id]
+    except Exception as e:
+        print("[ERROR] /async/recommendations => Exception encountered:")
+        print(traceback.format_exc())
+        raise HTTPException(status_code=500, detail="An internal error occurred.")
+
+    page = impression_page(
+        user_id,
+        [a["url_id"] for a in paged_articles],
+        session_id,
+        office_id,
+        topics=topics,
+        date_min=date_min,
+        page_offset=offset
+    )
+    if page["url_ids"] and not IMPRESSION_WRITER.submit(page, rows=len(page["url_ids"]), key=user_id):
+        print("[DEBUG] /async/recommendations => Impression queue unavailable; writing synchronously.")
+        await run_in_threadpool(_write_impression_batch, [page])
+
+    return {"recommendations": paged_articles, "total_count": total_count}
+
+
+@app.post("/api/async/interactions")
+async def log_interaction_async(data: dict = Body(...), session: tuple = Depends(current_session_async)):
+    """
+    Async counterpart of /api/interactions (same click de-duplication and per-pull stats).
+    """
+    interaction_type = data.get("interaction_type")
+    url_id = data.get("url_id")
+    user_id, _, office_id = session
+
+    if not interaction_type or url_id is None:
+        raise HTTPException(status_code=400, detail="interaction_type and url_id are required")
+
+    # The pull may still be queued in the background impression writer
+    await run_in_threadpool(wait_for_queued_pulls, user_id)
+    pool = await _async_pool()
+    try:
+        async with pool.acquire() as conn:
+            pull_row = await async_db.fetchrow(conn, LATEST_PULL_QUERY, (user_id, url_id))
+            if pull_row is None:
+                raise HTTPException(status_code=400, detail="No active pull found for this article")
+            pull_id, pulled_at = pull_row["pull_id"], pull_row["created_at"]
+
+            async with conn.transaction():
+                if interaction_type == 'click':
+                    if await async_db.fetchval(conn, CLICK_RECORDED_QUERY, (user_id, url_id, pull_id, pulled_at)):
+                        print("[DEBUG] /async/interactions => Click already recorded for pull_id. Ignoring duplicate click.")
+                        return {"message": f"{interaction_type} recorded."}
+                await async_db.execute(conn, INSERT_INTERACTION_QUERY, (user_id, url_id, pull_id, interaction_type))
+                if interaction_type in PULL_STAT_UPDATES:
+                    await async_db.execute(conn, PULL_STAT_UPDATES[interaction_type], (office_id, user_id, url_id, pull_id, pulled_at))
+                if interaction_type == 'click':
+                    # Mirror the pull_clicks increment in the bandit counters
+                    await async_db.executemany(conn, BUMP_USER_ARM_COUNTERS, [(user_id, url_id, 0, 2)])
+                    await async_db.executemany(conn, BUMP_OFFICE_ARM_COUNTERS, [(office_id, url_id, 0, 2)])
+                elif interaction_type in OFFICE_ENGAGEMENT_BUMPS:
+                    await async_db.execute(conn, OFFICE_ENGAGEMENT_BUMPS[interaction_type], (office_id, url_id))
+                await async_db.execute(conn, NOTIFY_DASHBOARDS_QUERY, ([str(office_id)],))
+        return {"message": f"{interaction_type} recorded."}
+    except HTTPException:
+        raise
+    except Exception as ex:
+        print("[ERROR] /async/interactions => Unhandled exception encountered:")
+        print(traceback.format_exc())
+        raise HTTPException(status_code=500, detail="An internal error occurred")
+
+
+@app.get("/api/async/user_mab_stats")
+async def get_user_mab_stats_async(session: tuple = Depends(current_session_async)):
+    """
+    Async counterpart of /api/user_mab_stats (polled every second by the dashboard).
+    """
+    pool = await _async_pool()
+    try:
+        async with pool.acquire() as conn:
+            stats = await async_db.fetch(conn, USER_MAB_STATS_QUERY, (session[0], session[0]))
+        return {"user_mab_stats": [format_user_mab_stat(row) for row in stats]}
+    except Exception as e:
+        print(f"[ERROR] Failed to fetch MAB stats: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch MAB statistics")
+
+
+@app.get("/api/async/mab_rank_logs")
+async def get_mab_rank_logs_async(
+    office_id: Optional[str] = Query(None),
+    user_id: Optional[str] = Query(None),
+    session_id: Optional[str] = Query(None),
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None)
+):
+    """
+    Async counterpart of /api/mab_rank_logs.
+    """
+    final_query, params = mab_rank_logs_query(
+        office_id, user_id, session_id, _as_datetime(start_date), _as_datetime(end_date)
+    )
+    pool = await _async_pool()
+    try:
+        async with pool.acquire() as conn:
+            rows = await async_db.fetch(conn, final_query, params)
+        return {"mab_rank_logs": [format_mab_rank_log(row) for row in rows]}
+    except Exception as e:
+        print(f"[ERROR] Failed to fetch mab_rank_logs: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch mab_rank_logs")
+
+
+# ------------------------------------------------------------------
+# Dashboard stream (Server-Sent Events)
+# ------------------------------------------------------------------
+
+async def fetch_dashboard_snapshot(office_id):
+    """What the dashboard shows for an office: its MAB stats rollup and latest rank-log snapshot."""
+    pool = await _async_pool()
+    async with pool.acquire() as conn:
+        stats = await async_db.fetch(conn, OFFICE_MAB_STATS_QUERY, (office_id,))
+        query, params = mab_rank_logs_query(office_id=office_id)
+        logs = await async_db.fetch(conn, query, params)
+    return jsonable_encoder({
+        "office_mab_stats": [format_office_mab_stat(row) for row in stats],
+        "mab_rank_logs": [format_mab_rank_log(row) for row in logs],
+    })
+
+
+# One producer per office per worker, shared by every open dashboard of that office
+DASHBOARD_HUB = DashboardHub(
+    fetch_dashboard_snapshot,
+    min_interval=float(os.environ.get("DASHBOARD_STREAM_MIN_INTERVAL", 1)),
+    max_interval=float(os.environ.get("DASHBOARD_STREAM_MAX_INTERVAL", 30)),
+)
+_dashboard_listener = None
+_dashboard_listener_lock = asyncio.Lock()
+
+
+async def _listen_for_dashboard_updates():
+    """LISTEN for notify_dashboards() from every worker; without it feeds refresh every max_interval."""
+    global _dashboard_listener
+    if _dashboard_listener is not None and not _dashboard_listener.is_closed():
+        return
+    async with _dashboard_listener_lock:
+        if _dashboard_listener is None or _dashboard_listener.is_closed():
+            try:
+                _dashboard_listener = await async_db.listen(DASHBOARD_CHANNEL, DASHBOARD_HUB.notify)
+            except Exception as e:
+                print(f"[WARNING] Dashboard LISTEN unavailable, falling back to periodic refresh: {e}")
+
+
+# EventSource cannot send an Authorization header, and a session token in the
+# stream URL would end up in proxy/access logs and browser history. The URL
+# carries a single-use ticket instead, stored in Postgres so any worker can
+# redeem it; tickets expire after DASHBOARD_STREAM_TICKET_TTL seconds.
+DASHBOARD_TICKET_TTL = float(os.environ.get("DASHBOARD_STREAM_TICKET_TTL", 30))
+ISSUE_DASHBOARD_TICKET_QUERY = """
+    WITH expired AS (
+        DELETE FROM dashboard_stream_tickets WHERE expires_at <= NOW()
+    )
+    INSERT INTO dashboard_stream_tickets (ticket, office_id, expires_at)
+    VALUES (%s, %s, NOW() + make_interval(secs => %s));
+"""
+REDEEM_DASHBOARD_TICKET_QUERY = """
+    DELETE FROM dashboard_stream_tickets
+    WHERE ticket = %s AND expires_at > NOW()
+    RETURNING office_id;
+"""
+
+
+@app.post("/api/dashboard/stream_ticket")
+async def issue_dashboard_stream_ticket(session: tuple = Depends(current_session_async)):
+    """
+    A single-use ticket for opening /api/dashboard/stream on the caller's office.
+    """
+    _, _, office_id = session
+    ticket = secrets.token_urlsafe(32)
+    pool = await _async_pool()
+    try:
+        async with pool.acquire() as conn:
+            await async_db.execute(conn, ISSUE_DASHBOARD_TICKET_QUERY, (ticket, office_id, DASHBOARD_TICKET_TTL))
+    except Exception as e:
+        print(f"[ERROR] Failed to issue dashboard stream ticket: {e}")
+        raise HTTPException(status_code=500, detail="Failed to issue dashboard stream ticket")
+    return {"ticket": ticket, "expires_in": DASHBOARD_TICKET_TTL}
+
+
+async def redeem_dashboard_ticket(ticket):
+    """office_id the ticket was issued for; 401 if it is unknown, expired or already used."""
+    pool = await _async_pool()
+    async with pool.acquire() as conn:
+        office_id = await async_db.fetchval(conn, REDEEM_DASHBOARD_TICKET_QUERY, (ticket,))
+    if office_id is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired stream ticket")
+    return _plain(office_id)
+
+
+@app.get("/api/dashboard/stream")
+async def dashboard_stream(
+    ticket: Optional[str] = Query(None),
+    authorization: Optional[str] = Header(None, alias="Authorization")
+):
+    """
+    Server-Sent Events for the dashboard of the caller's office: one `snapshot`
+    event ({office_mab_stats, mab_rank_logs}), then `delta` events with the
+    office stats rows that changed and/or the new rank-log snapshot.
+    Browsers open it with a `ticket` from POST /api/dashboard/stream_ticket;
+    other clients may send the Authorization header instead.
+    """
+    if ticket:
+        office_id = await redeem_dashboard_ticket(ticket)
+    else:
+        _, _, office_id = await current_session_async(authorization)
+    await _listen_for_dashboard_updates()
+
+    async def events():
+        async for event, data in DASHBOARD_HUB.subscribe(office_id):
+            if event == "keepalive":
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/dashboard_stream_stats")
+def get_dashboard_stream_stats():
+    """
+    Offices with an active dashboard producer, subscribers and snapshot refreshes.
+    """
+    return {"dashboard_stream_stats": DASHBOARD_HUB.stats()}
@@ -0,0 +1,246 @@
+"""
+Background writer for recommendation impressions.
+
+/api/recommendations hands each served page to an ImpressionWriter instead of
+writing its pulls/impressions before responding. A single worker thread drains
+the bounded queue, groups pages from concurrent requests into batches, and
+passes each batch to `write_batch` (one transaction per batch).
+
+- Backpressure: `submit` waits at most `put_timeout` seconds for queue space
+  and returns False when the queue is still full (or the writer is stopping),
+  so the caller can fall back to writing synchronously.
+- Failures: a batch that fails twice is retried one item at a time, so only
+  the items that fail on their own (e.g. a foreign-key violation) are lost.
+  Those are logged and counted in `failed_items`.
+- `flush` blocks until everything submitted before it has been written.
+- `wait_for(key)` blocks only while items submitted under `key` (e.g. one
+  user's pages) are still queued or being written, not on the whole backlog.
+- `stop` drains the queue and joins the worker (called on app shutdown).
+- `stats` reports queue depth, totals and the recent ingest rate.
+"""
+
+import queue
+import threading
+import time
+import traceback
+from collections import deque
+
+
+class _FlushMarker:
+    """Queue item that is acknowledged once every item before it is written."""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+_STOP = object()
+
+
+class ImpressionWriter:
+    def __init__(self, write_batch, max_queue=10000, batch_size=200, flush_interval=0.05,
+                 put_timeout=0.05, rate_window=60.0):
+        """
+        write_batch: callable(list_of_items) that persists one batch; it should
+        raise on failure. A failed batch is retried once, then item by item;
+        items that still fail are counted as failed.
+        """
+        self.write_batch = write_batch
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.rate_window = rate_window
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._stopping = False
+        self._lock = threading.Lock()
+        self._settled = threading.Condition(self._lock)
+        self._pending = {}  # key -> items queued or being written
+        self._recent = deque()  # (monotonic time, rows written)
+        self._submitted = 0
+        self._rejected = 0
+        self._batches = 0
+        self._items_written = 0
+        self._rows_written = 0
+        self._failed_items = 0
+        self._last_batch_ms = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="impression-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """
+        Write everything still queued, then stop the worker. Returns False if
+        the worker is still writing after `timeout` (it keeps draining).
+        """
+        if not self.running:
+            return True
+        if not self._stopping:
+            self._stopping = True
+            self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            print(f"[WARNING] impression writer => still draining after {timeout}s")
+            return False
+        self._thread = None
+        return True
+
+    def submit(self, item, rows=1, key=None):
+        """
+        Queue one item (rows = number of impressions it carries, for metrics;
+        key = what `wait_for` can wait on). Returns False if the writer is not
+        running or the queue stayed full.
+        """
+        if not self.running or self._stopping:
+            return False
+        # Counted before the put so the worker can never settle it first
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + 1
+        try:
+            self._queue.put((item, rows, key), timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+                self._settle([key])
+            return False
+        with self._lock:
+            self._submitted += 1
+        return True
+
+    def flush(self, timeout=5.0):
+        """Wait until everything submitted so far has been written."""
+        if not self.running:
+            return False
+        marker = _FlushMarker()
+        try:
+            self._queue.put(marker, timeout=timeout)
+        except queue.Full:
+            return False
+        return marker.done.wait(timeout)
+
+    def wait_for(self, key, timeout=5.0):
+        """
+        Wait until nothing submitted under `key` is queued or being written.
+        Returns immediately when nothing is; False if it is still pending after `timeout`.
+        """
+        with self._settled:
+            return self._settled.wait_for(lambda: key not in self._pending, timeout)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            self._trim_recent(now)
+            recent_rows = sum(rows for _, rows in self._recent)
+            return {
+                "running": self.running,
+                "queue_depth": self._queue.qsize(),
+                "max_queue": self.max_queue,
+                "submitted": self._submitted,
+                "rejected": self._rejected,
+                "batches": self._batches,
+                "items_written": self._items_written,
+                "impressions_written": self._rows_written,
+                "failed_items": self._failed_items,
+                "last_batch_ms": self._last_batch_ms,
+                "ingest_rate_per_sec": round(recent_rows / self.rate_window, 2),
+            }
+
+    # ------------------------------------------------------------------
+    # Worker
+    # ------------------------------------------------------------------
+
+    def _settle(self, keys):
+        """Drop finished items from the pending counts; call with the lock held."""
+        for key in keys:
+            if self._pending[key] == 1:
+                del self._pending[key]
+            else:
+                self._pending[key] -= 1
+        self._settled.notify_all()
+
+    def _trim_recent(self, now):
+        while self._recent and now - self._recent[0][0] > self.rate_window:
+            self._recent.popleft()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, markers = [], []
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            pending = [first]
+            # Gather whatever else is already queued, up to one batch
+            while len(pending) < self.batch_size:
+                try:
+                    pending.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for entry in pending:
+                if entry is _STOP:
+                    stopping = True
+                elif isinstance(entry, _FlushMarker):
+                    markers.append(entry)
+                else:
+                    batch.append(entry)
+            if stopping:
+                # Drain the rest of the queue before exiting
+                while True:
+                    try:
+                        entry = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if isinstance(entry, _FlushMarker):
+                        markers.append(entry)
+                    elif entry is not _STOP:
+                        batch.append(entry)
+            for start in range(0, len(batch), self.batch_size):
+                self._write(batch[start : start + self.batch_size])
+            for marker in markers:
+                marker.done.set()
+
+    def _write(self, batch):
+        if not batch:
+            return
+        started = time.monotonic()
+        if self._attempt(batch, attempts=2):
+            written = batch
+        elif len(batch) == 1:
+            written = []
+        else:
+            # Isolate the failing item(s) instead of losing the whole batch
+            written = [entry for entry in batch if self._attempt([entry], attempts=1)]
+        failed = len(batch) - len(written)
+        now = time.monotonic()
+        rows = sum(r for _, r, _ in written)
+        with self._lock:
+            self._settle([key for _, _, key in batch])
+            self._failed_items += failed
+            if written:
+                self._batches += 1
+                self._items_written += len(written)
+                self._rows_written += rows
+                self._last_batch_ms = round((now - started) * 1000, 2)
+                self._recent.append((now, rows))
+                self._trim_recent(now)
+
+    def _attempt(self, batch, attempts):
+        items = [item for item, _, _ in batch]
+        for attempt in range(1, attempts + 1):
+            try:
+                self.write_batch(items)
+                return True
+            except Exception:
+                print(f"[ERROR] impression writer => batch of {len(items)} failed (attempt {attempt}):")
+                print(traceback.format_exc())
+        return False
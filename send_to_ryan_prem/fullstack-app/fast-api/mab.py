@@ -5,19 +5,37 @@ A Python module implementing Hellinger-UCB for Bernoulli bandits.
 Exported functions:
   1) hellinger_squared(p, q)
   2) find_hellinger_ucb(p_hat, alpha, tol=1e-6)
-  3) get_hellinger_ucb(N, S, t, c)
-  4) rank_articles_hellinger_ucb(article_ids, stats, t, c)
+  3) find_hellinger_ucb_closed_form(p_hat, alpha)
+  4) get_hellinger_ucb(N, S, t, c, method="closed_form")
+  5) rank_articles_hellinger_ucb(article_ids, stats, t, c, method="closed_form")
+  6) find_hellinger_ucb_batch(p_hat, alpha, tol=1e-6)
+  7) find_hellinger_ucb_closed_form_batch(p_hat, alpha)
+  8) get_hellinger_ucb_batch(N_array, S_array, t, c, method="closed_form")
+  9) rank_articles_hellinger_ucb_batch(article_ids, N_array, S_array, t, c, method="closed_form", cache=None)
+ 10) top_k_indices(ucbs, k)
+ 11) top_k_hellinger_ucb_batch(article_ids, N_array, S_array, t, c, k, method="closed_form", cache=None)
+
+Exported classes:
+  HellingerUCBCache(max_n=128, t_resolution=16, max_tables=32)
 
 Usage:
   from mab_hellinger import (
       hellinger_squared,
       find_hellinger_ucb,
       get_hellinger_ucb,
-      rank_articles_hellinger_ucb
+      rank_articles_hellinger_ucb,
+      rank_articles_hellinger_ucb_batch
   )
 """
 
 import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# UCB solvers selectable through the `method=` argument.
+UCB_METHODS = ("closed_form", "bisection")
 
 
 def hellinger_squared(p: float, q: float) -> float:
@@ -57,7 +75,26 @@ def find_hellinger_ucb(p_hat: float, alpha: float, tol: float = 1e-6) -> float:
     return low
 
 
-def get_hellinger_ucb(N: int, S: int, t: float, c: float) -> float:
+def find_hellinger_ucb_closed_form(p_hat: float, alpha: float) -> float:
+    """
+    Closed-form solution of the problem find_hellinger_ucb bisects.
+
+    Writing sqrt(p) = cos(a) and sqrt(q) = cos(b) with a, b in [0, pi/2],
+    sqrt(p*q) + sqrt((1-p)*(1-q)) = cos(a - b), so the constraint
+    H^2 <= alpha becomes |a - b| <= arccos(1 - alpha). The largest q
+    is therefore cos(max(0, a - arccos(1 - alpha)))^2.
+
+    :param p_hat: Empirical success probability (S / N)
+    :param alpha: Upper bound on H^2
+    :return: The largest q in [0,1] that meets the constraint
+    """
+    p_hat = max(0.0, min(1.0, p_hat))
+    bc_min = max(-1.0, min(1.0, 1.0 - alpha))
+    angle = max(0.0, math.acos(math.sqrt(p_hat)) - math.acos(bc_min))
+    return math.cos(angle) ** 2
+
+
+def get_hellinger_ucb(N: int, S: int, t: float, c: float, method: str = "closed_form") -> float:
     """
     Compute the Hellinger-UCB for a single Bernoulli arm, given:
       - N: # times displayed (pull count)
@@ -72,11 +109,14 @@ def get_hellinger_ucb(N: int, S: int, t: float, c: float) -> float:
     :param S: integer, success count
     :param t: float, time index (e.g. sum of pulls in the bandit)
     :param c: float, hyperparameter controlling exploration
+    :param method: "closed_form" (default) or "bisection"
     :return: UCB value (float in [0,1])
     """
     # Enforce constraint on c: must be between 0.25 and 0.5 inclusive
     if not (0.25 < c <= 0.5):
         raise ValueError("Parameter c must be strictly greater than 0.25 and less than or equal to 0.5")
+    if method not in UCB_METHODS:
+        raise ValueError(f"Unknown UCB method '{method}', expected one of {UCB_METHODS}")
         
     if N == 0:
         # brand new arm => maximum UCB
@@ -93,11 +133,12 @@ def get_hellinger_ucb(N: int, S: int, t: float, c: float) -> float:
         alpha_i = 1.0 - math.exp(-c * (math.log(t + 1) / N))
         
     p_hat = S / N
-    ucb = find_hellinger_ucb(p_hat, alpha_i)
-    return ucb
+    if method == "bisection":
+        return find_hellinger_ucb(p_hat, alpha_i)
+    return find_hellinger_ucb_closed_form(p_hat, alpha_i)
 
 
-def rank_articles_hellinger_ucb(article_ids, stats, t: float, c: float):
+def rank_articles_hellinger_ucb(article_ids, stats, t: float, c: float, method: str = "closed_form"):
     """
     Rank a list of articles by their Hellinger-UCB in descending order.
 
@@ -106,12 +147,13 @@ def rank_articles_hellinger_ucb(article_ids, stats, t: float, c: float):
                   or any DB-accessor that returns (N, S) for a given article_id
     :param t: float, the 'time index' (total pulls in the bandit)
     :param c: float, hyperparameter from eq. (3.3)
+    :param method: UCB solver, see get_hellinger_ucb
     :return: list of (article_id, ucb) sorted descending by UCB
     """
     ranked = []
     for article_id in article_ids:
         N, S = stats.get(article_id, (0, 0))
-        ucb_val = get_hellinger_ucb(N, S, t, c)
+        ucb_val = get_hellinger_ucb(N, S, t, c, method=method)
         ranked.append((article_id, ucb_val))
 
     # Sort descending by UCB
@@ -119,6 +161,256 @@ def rank_articles_hellinger_ucb(article_ids, stats, t: float, c: float):
     return ranked
 
 
+def find_hellinger_ucb_batch(p_hat, alpha, tol: float = 1e-6):
+    """
+    Vectorized version of find_hellinger_ucb: bisects every arm at once.
+
+    Every arm starts from the same [0,1] bracket, so all arms need the same
+    number of halvings and the result matches the scalar search exactly.
+
+    :param p_hat: array of empirical success probabilities (S / N)
+    :param alpha: array of upper bounds on H^2 (same shape as p_hat)
+    :param tol: Tolerance for stopping the binary search
+    :return: array with the largest feasible q for each arm
+    """
+    p = np.clip(np.asarray(p_hat, dtype=np.float64), 0.0, 1.0)
+    alpha = np.asarray(alpha, dtype=np.float64)
+    low = np.zeros_like(p)
+    high = np.ones_like(p)
+    width = 1.0
+    while width > tol:
+        mid = 0.5 * (low + high)
+        h2 = 1.0 - (np.sqrt(p * mid) + np.sqrt((1.0 - p) * (1.0 - mid)))
+        feasible = h2 <= alpha
+        low = np.where(feasible, mid, low)
+        high = np.where(feasible, high, mid)
+        width = 0.5 * width
+    return low
+
+
+def find_hellinger_ucb_closed_form_batch(p_hat, alpha):
+    """
+    Vectorized version of find_hellinger_ucb_closed_form.
+
+    :param p_hat: array of empirical success probabilities (S / N)
+    :param alpha: array of upper bounds on H^2 (same shape as p_hat)
+    :return: array with the largest feasible q for each arm
+    """
+    p = np.clip(np.asarray(p_hat, dtype=np.float64), 0.0, 1.0)
+    bc_min = np.clip(1.0 - np.asarray(alpha, dtype=np.float64), -1.0, 1.0)
+    angle = np.maximum(0.0, np.arccos(np.sqrt(p)) - np.arccos(bc_min))
+    return np.cos(angle) ** 2
+
+
+def get_hellinger_ucb_batch(N_array, S_array, t: float, c: float, method: str = "closed_form"):
+    """
+    Vectorized version of get_hellinger_ucb (unsorted).
+
+    :param N_array: pull counts
+    :param S_array: success counts, aligned with N_array
+    :param t: float, the 'time index' (total pulls in the bandit)
+    :param c: float, hyperparameter from eq. (3.3)
+    :param method: UCB solver, see get_hellinger_ucb
+    :return: array of UCB values aligned with N_array
+    """
+    if not (0.25 < c <= 0.5):
+        raise ValueError("Parameter c must be strictly greater than 0.25 and less than or equal to 0.5")
+    if method not in UCB_METHODS:
+        raise ValueError(f"Unknown UCB method '{method}', expected one of {UCB_METHODS}")
+
+    N = np.asarray(N_array, dtype=np.float64)
+    S = np.asarray(S_array, dtype=np.float64)
+
+    # brand new arms (N == 0) => maximum UCB
+    ucbs = np.ones(N.shape, dtype=np.float64)
+    pulled = N > 0
+    if pulled.any():
+        N_pulled = N[pulled]
+        alpha = 1.0 - np.exp(-c * (math.log(t + 1) / N_pulled))
+        p_hat = S[pulled] / N_pulled
+        if method == "bisection":
+            ucbs[pulled] = find_hellinger_ucb_batch(p_hat, alpha)
+        else:
+            ucbs[pulled] = find_hellinger_ucb_closed_form_batch(p_hat, alpha)
+    return ucbs
+
+
+class HellingerUCBCache:
+    """
+    Memoizes Hellinger-UCB values for small integer (N, S).
+
+    For each (c, method, t-bucket) a dense table[N, S] is built once for all
+    N, S < max_n; ranking then becomes array indexing. t is bucketed on a
+    log2 scale (t_resolution buckets per doubling) and every arm in a bucket
+    is scored with the bucket's lower-edge t, so a ranking never mixes two
+    time indices. Arms outside the table are computed directly with the same
+    bucketed t and counted as misses.
+
+    Tables are kept in a bounded LRU (several users with different t share
+    the process) and the whole cache is cleared whenever c changes.
+    """
+
+    def __init__(self, max_n: int = 128, t_resolution: int = 16, max_tables: int = 32,
+                 method: str = "closed_form"):
+        if method not in UCB_METHODS:
+            raise ValueError(f"Unknown UCB method '{method}', expected one of {UCB_METHODS}")
+        self.max_n = max_n
+        self.t_resolution = t_resolution
+        self.max_tables = max_tables
+        self.method = method
+        self._tables = OrderedDict()
+        self._c = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.table_builds = 0
+
+    def t_bucket(self, t: float) -> int:
+        return int(math.floor(math.log2(max(t, 0) + 1) * self.t_resolution))
+
+    def bucket_t(self, bucket: int) -> float:
+        """Lower-edge time index of a t-bucket."""
+        return 2.0 ** (bucket / self.t_resolution) - 1.0
+
+    def _table(self, bucket: int, c: float):
+        with self._lock:
+            if c != self._c:
+                self._tables.clear()
+                self._c = c
+            table = self._tables.get(bucket)
+            if table is not None:
+                self._tables.move_to_end(bucket)
+                return table
+
+        N_grid, S_grid = np.meshgrid(np.arange(self.max_n), np.arange(self.max_n), indexing="ij")
+        table = get_hellinger_ucb_batch(N_grid.ravel(), S_grid.ravel(), self.bucket_t(bucket), c,
+                                        method=self.method).reshape(N_grid.shape)
+
+        with self._lock:
+            if c == self._c:
+                self._tables[bucket] = table
+                while len(self._tables) > self.max_tables:
+                    self._tables.popitem(last=False)
+            self.table_builds += 1
+        return table
+
+    def lookup(self, N_array, S_array, t: float, c: float):
+        """
+        UCB values for every (N, S) pair, read from the table where possible.
+
+        :return: array of UCB values aligned with N_array
+        """
+        if not (0.25 < c <= 0.5):
+            raise ValueError("Parameter c must be strictly greater than 0.25 and less than or equal to 0.5")
+
+        N = np.asarray(N_array, dtype=np.int64)
+        S = np.asarray(S_array, dtype=np.int64)
+        bucket = self.t_bucket(t)
+        table = self._table(bucket, c)
+
+        in_table = (N >= 0) & (N < self.max_n) & (S >= 0) & (S < self.max_n)
+        ucbs = np.empty(N.shape, dtype=np.float64)
+        ucbs[in_table] = table[N[in_table], S[in_table]]
+        missed = ~in_table
+        n_missed = int(missed.sum())
+        if n_missed:
+            ucbs[missed] = get_hellinger_ucb_batch(N[missed], S[missed], self.bucket_t(bucket), c,
+                                                   method=self.method)
+
+        with self._lock:
+            self.hits += int(in_table.sum())
+            self.misses += n_missed
+        return ucbs
+
+    def get(self, N: int, S: int, t: float, c: float) -> float:
+        """Cached equivalent of get_hellinger_ucb(N, S, t, c)."""
+        return float(self.lookup([N], [S], t, c)[0])
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "table_builds": self.table_builds,
+                "tables_cached": len(self._tables),
+                "max_n": self.max_n,
+                "t_resolution": self.t_resolution,
+                "c": self._c,
+            }
+
+
+def rank_articles_hellinger_ucb_batch(article_ids, N_array, S_array, t: float, c: float,
+                                      method: str = "closed_form", cache: HellingerUCBCache = None):
+    """
+    NumPy-backed equivalent of rank_articles_hellinger_ucb.
+
+    :param article_ids: sequence of article IDs
+    :param N_array: pull counts, aligned with article_ids
+    :param S_array: success counts, aligned with article_ids
+    :param t: float, the 'time index' (total pulls in the bandit)
+    :param c: float, hyperparameter from eq. (3.3)
+    :param method: UCB solver, see get_hellinger_ucb (ignored when cache is given)
+    :param cache: optional HellingerUCBCache; scores are then table lookups
+                  using the cache's bucketed t
+    :return: (ids, ucbs) as NumPy arrays sorted descending by UCB;
+             ties keep their input order, like the scalar version
+    """
+    ids = np.asarray(article_ids)
+    if cache is not None:
+        ucbs = cache.lookup(N_array, S_array, t, c)
+    else:
+        ucbs = get_hellinger_ucb_batch(N_array, S_array, t, c, method=method)
+
+    order = np.argsort(-ucbs, kind="stable")
+    return ids[order], ucbs[order]
+
+
+def top_k_indices(ucbs, k: int):
+    """
+    Positions of the k largest UCBs, in the same order a stable descending
+    sort would give (ties keep their input order).
+
+    Runs in O(n + k log k) via np.partition instead of sorting every arm.
+    """
+    ucbs = np.asarray(ucbs, dtype=np.float64)
+    n = ucbs.shape[0]
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k >= n:
+        return np.argsort(-ucbs, kind="stable")
+
+    # k-th largest value; everything strictly above it is in, then the
+    # earliest ties fill the remaining slots.
+    kth = np.partition(ucbs, n - k)[n - k]
+    above = np.flatnonzero(ucbs > kth)
+    ties = np.flatnonzero(ucbs == kth)[: k - above.shape[0]]
+    winners = np.sort(np.concatenate([above, ties]))
+    return winners[np.argsort(-ucbs[winners], kind="stable")]
+
+
+def top_k_hellinger_ucb_batch(article_ids, N_array, S_array, t: float, c: float, k: int,
+                              method: str = "closed_form", cache: HellingerUCBCache = None):
+    """
+    Like rank_articles_hellinger_ucb_batch, but only returns the first k arms.
+
+    The result equals rank_articles_hellinger_ucb_batch(...)[:k] without
+    sorting the whole candidate set.
+
+    :param k: number of top-ranked arms to return (e.g. offset + limit)
+    :return: (ids, ucbs) of the top k arms, sorted descending by UCB
+    """
+    ids = np.asarray(article_ids)
+    if cache is not None:
+        ucbs = cache.lookup(N_array, S_array, t, c)
+    else:
+        ucbs = get_hellinger_ucb_batch(N_array, S_array, t, c, method=method)
+
+    order = top_k_indices(ucbs, k)
+    return ids[order], ucbs[order]
+
+
 
 
 
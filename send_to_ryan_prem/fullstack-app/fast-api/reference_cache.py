@@ -0,0 +1,78 @@
+"""
+In-process cache for the reference lists behind /api/topics,
+/api/article_titles and /api/articles/dates.
+
+The lists only change when the scraper runs, and the scraper bumps the
+single-row `catalog_version` table when it finishes (schema_update.sql).
+Every cached list is stamped with the version it was loaded at. The version
+itself is re-read at most every `check_interval` seconds, so in between
+requests are served from memory without touching the database; once a new
+version is seen, every list is reloaded on its next request.
+
+Each uvicorn worker has its own cache, so a scraper run becomes visible to
+all of them within `check_interval` seconds.
+"""
+
+import threading
+import time
+
+
+class ReferenceCache:
+    def __init__(self, check_interval=30.0):
+        self.check_interval = check_interval
+        self._version = None
+        self._checked_at = 0.0
+        self._values = {}  # name -> (version, value)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._version_checks = 0
+
+    def version(self, fetch_version):
+        """Current catalog version; calls fetch_version() only when the last check is stale."""
+        now = time.monotonic()
+        with self._lock:
+            if self._version is not None and now - self._checked_at < self.check_interval:
+                return self._version
+        version = fetch_version()
+        with self._lock:
+            self._version_checks += 1
+            if version != self._version:
+                self._values.clear()
+                self._version = version
+            self._checked_at = now
+        return version
+
+    def get(self, name, version, load):
+        """The list `name` as of `version`, calling load() on a miss."""
+        with self._lock:
+            entry = self._values.get(name)
+            if entry is not None and entry[0] == version:
+                self._hits += 1
+                return entry[1]
+            self._misses += 1
+        value = load()
+        with self._lock:
+            # A newer version may have been seen while loading; don't cache stale data under it
+            if version == self._version:
+                self._values[name] = (version, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+            self._version = None
+            self._checked_at = 0.0
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "version_checks": self._version_checks,
+                "version": self._version,
+                "lists": sorted(self._values),
+                "check_interval": self.check_interval,
+            }
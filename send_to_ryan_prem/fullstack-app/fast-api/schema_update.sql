@@ -16,4 +16,336 @@ CREATE INDEX IF NOT EXISTS idx_templates_created_by ON templates(created_by);
 CREATE INDEX IF NOT EXISTS idx_templates_archived ON templates(is_archived);
 CREATE INDEX IF NOT EXISTS idx_template_sections_template_id ON template_sections(template_id);
 CREATE INDEX IF NOT EXISTS idx_template_sections_parent ON template_sections(parent_section_id);
-CREATE INDEX IF NOT EXISTS idx_template_history_template_id ON template_history(template_id); 
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_template_history_template_id ON template_history(template_id); 
+
+-- Per-user bandit stats aggregate used by /api/recommendations (index-only scan)
+CREATE INDEX IF NOT EXISTS idx_user_article_stats_user_url
+    ON user_article_stats(user_id, url_id) INCLUDE (pull_impressions, pull_clicks);
+
+-- Materialized bandit counters (one row per arm instead of one per pull).
+-- Kept current by log_impressions (n) and /api/interactions clicks (s).
+CREATE TABLE IF NOT EXISTS bandit_arm_counters (
+    user_id UUID NOT NULL REFERENCES users(user_id),
+    url_id INTEGER NOT NULL REFERENCES urls_content(url_id),
+    n BIGINT NOT NULL DEFAULT 0,
+    s BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, url_id)
+);
+
+CREATE TABLE IF NOT EXISTS office_arm_counters (
+    office_id UUID NOT NULL REFERENCES offices(office_id),
+    url_id INTEGER NOT NULL REFERENCES urls_content(url_id),
+    n BIGINT NOT NULL DEFAULT 0,
+    s BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (office_id, url_id)
+);
+
+-- One-time backfill from the per-pull history
+INSERT INTO bandit_arm_counters (user_id, url_id, n, s)
+SELECT user_id, url_id, SUM(pull_impressions), SUM(pull_clicks)
+FROM user_article_stats
+GROUP BY user_id, url_id
+ON CONFLICT (user_id, url_id) DO NOTHING;
+
+INSERT INTO office_arm_counters (office_id, url_id, n, s)
+SELECT office_id, url_id, SUM(pull_impressions), SUM(pull_clicks)
+FROM user_article_stats
+GROUP BY office_id, url_id
+ON CONFLICT (office_id, url_id) DO NOTHING;
+
+-- Office-level engagement rollup behind /api/office_mab_stats: bookmarks and adds
+-- alongside n/s, bumped by /api/interactions and /api/add_bookmark
+ALTER TABLE office_arm_counters
+    ADD COLUMN IF NOT EXISTS bookmarks BIGINT NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS adds BIGINT NOT NULL DEFAULT 0;
+
+UPDATE office_arm_counters oc
+SET bookmarks = agg.bookmarks, adds = agg.adds
+FROM (
+    SELECT office_id, url_id, SUM(pull_bookmarks) AS bookmarks, SUM(pull_adds) AS adds
+    FROM user_article_stats
+    GROUP BY office_id, url_id
+) agg
+WHERE oc.office_id = agg.office_id AND oc.url_id = agg.url_id;
+
+-- Index-backed article filtering (build_article_filters in fast_api_app.py).
+-- topics_array && %s::text[] uses the array GIN index; the leading-wildcard
+-- ILIKE '%x%' matches on title/topics use the pg_trgm GIN indexes.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_urls_content_topics_array
+    ON urls_content USING GIN (topics_array);
+CREATE INDEX IF NOT EXISTS idx_urls_content_title_trgm
+    ON urls_content USING GIN (title gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_urls_content_topics_trgm
+    ON urls_content USING GIN (topics gin_trgm_ops);
+
+-- Keyset pagination for /api/articles and /api/articles/filter:
+-- ORDER BY publication_date DESC, url_id DESC with (publication_date, url_id) < cursor
+CREATE INDEX IF NOT EXISTS idx_urls_content_pubdate_url
+    ON urls_content (publication_date DESC, url_id DESC);
+
+-- Version stamp for the cached reference lists (/api/topics, /api/article_titles,
+-- /api/articles/dates); the scraper bumps it after each run (reference_cache.py)
+CREATE TABLE IF NOT EXISTS catalog_version (
+    id INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+INSERT INTO catalog_version (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+
+-- Near-duplicates of bookmarked articles (likely updated versions), read by
+-- /api/bookmarks_candidates. Filled incrementally: the scraper matches newly
+-- scraped titles against active bookmarks, /api/add_bookmark matches a new
+-- bookmark against the corpus. Existing bookmarks are backfilled once with
+--   python scrape_url_content.py --backfill-bookmark-candidates
+CREATE TABLE IF NOT EXISTS bookmark_candidates (
+    user_id UUID NOT NULL REFERENCES users(user_id),
+    original_url_id INTEGER NOT NULL REFERENCES urls_content(url_id),
+    candidate_url_id INTEGER NOT NULL REFERENCES urls_content(url_id),
+    similarity SMALLINT NOT NULL,
+    found_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (user_id, original_url_id, candidate_url_id)
+);
+
+-- Latest-ranking lookup for /api/mab_rank_logs and the dashboard stream: one
+-- mab_rank_snapshots row per logged ranking, shared by its mab_rank_logs rows.
+-- The newest snapshot for an office/user/session is an index-only LIMIT 1 scan
+-- of the covering indexes; its rows are then read by snapshot_id.
+CREATE TABLE IF NOT EXISTS mab_rank_snapshots (
+    snapshot_id BIGSERIAL PRIMARY KEY,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    office_id UUID,
+    user_id UUID,
+    session_id UUID
+);
+CREATE INDEX IF NOT EXISTS idx_mab_rank_snapshots_office_user_created
+    ON mab_rank_snapshots (office_id, user_id, created_at DESC) INCLUDE (snapshot_id);
+CREATE INDEX IF NOT EXISTS idx_mab_rank_snapshots_user_created
+    ON mab_rank_snapshots (user_id, created_at DESC) INCLUDE (snapshot_id);
+CREATE INDEX IF NOT EXISTS idx_mab_rank_snapshots_session_created
+    ON mab_rank_snapshots (session_id, created_at DESC) INCLUDE (snapshot_id);
+CREATE INDEX IF NOT EXISTS idx_mab_rank_snapshots_created
+    ON mab_rank_snapshots (created_at DESC) INCLUDE (snapshot_id);
+
+ALTER TABLE mab_rank_logs ADD COLUMN IF NOT EXISTS snapshot_id BIGINT REFERENCES mab_rank_snapshots(snapshot_id);
+CREATE INDEX IF NOT EXISTS idx_mab_rank_logs_snapshot
+    ON mab_rank_logs (snapshot_id, rank_position);
+
+-- One-time backfill: every (created_at, office, user, session) group of
+-- existing rows was written by one ranking
+INSERT INTO mab_rank_snapshots (created_at, office_id, user_id, session_id)
+SELECT DISTINCT created_at, office_id, user_id, session_id
+FROM mab_rank_logs
+WHERE snapshot_id IS NULL;
+
+UPDATE mab_rank_logs l
+SET snapshot_id = s.snapshot_id
+FROM mab_rank_snapshots s
+WHERE l.snapshot_id IS NULL
+  AND s.created_at = l.created_at
+  AND s.office_id IS NOT DISTINCT FROM l.office_id
+  AND s.user_id IS NOT DISTINCT FROM l.user_id
+  AND s.session_id IS NOT DISTINCT FROM l.session_id;
+
+-- Single-use tickets for /api/dashboard/stream, so the EventSource URL never
+-- carries a session token (issued by POST /api/dashboard/stream_ticket)
+CREATE TABLE IF NOT EXISTS dashboard_stream_tickets (
+    ticket TEXT PRIMARY KEY,
+    office_id UUID NOT NULL,
+    expires_at TIMESTAMP NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_dashboard_stream_tickets_expires
+    ON dashboard_stream_tickets (expires_at);
+
+-- Monthly range partitions for the append-only event tables, so old months can
+-- be dropped (after folding them into the daily rollups below) instead of
+-- every aggregation scanning the full history. event_retention.py keeps
+-- future partitions created and expired ones dropped; run it daily.
+--
+-- user_article_stats has no creation time of its own; it gets the created_at
+-- of its pull (both are written by the same LOG_IMPRESSIONS_QUERY statement).
+ALTER TABLE user_article_stats ADD COLUMN IF NOT EXISTS created_at TIMESTAMP;
+UPDATE user_article_stats s
+SET created_at = p.created_at
+FROM pulls p
+WHERE s.created_at IS NULL AND p.pull_id = s.pull_id;
+UPDATE user_article_stats
+SET created_at = COALESCE(last_interaction, NOW())
+WHERE created_at IS NULL;
+ALTER TABLE user_article_stats ALTER COLUMN created_at SET DEFAULT NOW();
+
+-- Converts `tbl` into a table partitioned by month on `part_col` (no-op once
+-- done): the rows are copied into the new partitions and the old table dropped.
+-- The time column is appended to the primary key and unique constraints, as
+-- Postgres requires, and the other indexes are re-created as they were.
+-- Foreign keys between the event tables (e.g. impressions.pull_id -> pulls)
+-- cannot follow the extended keys; they are dropped with a NOTICE naming each.
+-- Views on the table, or foreign keys into it from any other table, abort the
+-- migration instead of being dropped with the old table.
+CREATE OR REPLACE FUNCTION partition_event_table(tbl TEXT, part_col TEXT) RETURNS VOID AS $$
+DECLARE
+    legacy TEXT := tbl || '_legacy';
+    keys TEXT[];
+    fks TEXT[];
+    indexes TEXT[];
+    blockers TEXT;
+    stmt TEXT;
+    seq RECORD;
+    fk RECORD;
+    m DATE;
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = tbl::regclass) THEN
+        RETURN;
+    END IF;
+
+    SELECT string_agg(DISTINCT v.oid::regclass::TEXT, ', ')
+    INTO blockers
+    FROM pg_depend d
+    JOIN pg_rewrite r ON r.oid = d.objid
+    JOIN pg_class v ON v.oid = r.ev_class
+    WHERE d.classid = 'pg_rewrite'::regclass AND d.refobjid = tbl::regclass AND v.oid <> tbl::regclass;
+    IF blockers IS NOT NULL THEN
+        RAISE EXCEPTION 'partition_event_table(%): drop or rewrite the views on it first: %', tbl, blockers;
+    END IF;
+
+    SELECT string_agg(format('%s.%s', conrelid::regclass, conname), ', ')
+    INTO blockers
+    FROM pg_constraint
+    WHERE confrelid = tbl::regclass AND contype = 'f'
+      AND conrelid::regclass::TEXT NOT IN ('pulls', 'impressions', 'user_article_stats', 'user_interactions', 'mab_rank_logs');
+    IF blockers IS NOT NULL THEN
+        RAISE EXCEPTION 'partition_event_table(%): foreign keys from other tables reference it: %', tbl, blockers;
+    END IF;
+
+    -- Primary key / unique constraints to re-create, with part_col appended
+    SELECT array_agg(
+               CASE WHEN i.indisprimary THEN 'PRIMARY KEY' ELSE 'UNIQUE' END
+               || ' (' || cols.list
+               || CASE WHEN part_col = ANY (cols.names) THEN '' ELSE ', ' || quote_ident(part_col) END
+               || ')')
+    INTO keys
+    FROM pg_index i
+    CROSS JOIN LATERAL (
+        SELECT string_agg(quote_ident(a.attname), ', ' ORDER BY k.ord) AS list,
+               array_agg(a.attname::TEXT) AS names
+        FROM unnest(i.indkey) WITH ORDINALITY AS k(attnum, ord)
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+    ) cols
+    WHERE i.indrelid = tbl::regclass AND i.indisunique;
+
+    -- Foreign keys to non-event tables (users, urls_content, ...)
+    SELECT array_agg(format('ALTER TABLE %I ADD CONSTRAINT %I %s', tbl, conname, pg_get_constraintdef(oid)))
+    INTO fks
+    FROM pg_constraint
+    WHERE conrelid = tbl::regclass AND contype = 'f'
+      AND confrelid::regclass::TEXT NOT IN ('pulls', 'impressions', 'user_article_stats', 'user_interactions', 'mab_rank_logs');
+
+    -- Every other index, pointed at the new table
+    SELECT array_agg(regexp_replace(pg_get_indexdef(indexrelid), ' ON \S+ USING ', format(' ON %I USING ', tbl)))
+    INTO indexes
+    FROM pg_index
+    WHERE indrelid = tbl::regclass AND NOT indisunique;
+
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', tbl, legacy);
+    EXECUTE format('UPDATE %I SET %I = NOW() WHERE %I IS NULL', legacy, part_col, part_col);
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING CONSTRAINTS) PARTITION BY RANGE (%I)',
+                   tbl, legacy, part_col);
+
+    -- SERIAL sequences move to the new table so dropping the old one keeps them
+    FOR seq IN
+        SELECT s.oid::regclass::TEXT AS seq_name, a.attname
+        FROM pg_depend d
+        JOIN pg_class s ON s.oid = d.objid AND s.relkind = 'S'
+        JOIN pg_attribute a ON a.attrelid = d.refobjid AND a.attnum = d.refobjsubid
+        WHERE d.refobjid = legacy::regclass AND d.deptype = 'a'
+    LOOP
+        EXECUTE format('ALTER SEQUENCE %s OWNED BY %I.%I', seq.seq_name, tbl, seq.attname);
+    END LOOP;
+
+    -- One partition per month of existing data through three months ahead, and
+    -- a default partition so a missed maintenance run never rejects writes
+    EXECUTE format('SELECT date_trunc(''month'', MIN(%I))::DATE FROM %I', part_col, legacy) INTO m;
+    m := LEAST(COALESCE(m, date_trunc('month', NOW())::DATE), date_trunc('month', NOW())::DATE);
+    WHILE m <= date_trunc('month', NOW() + INTERVAL '3 months')::DATE LOOP
+        EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                       tbl || '_p' || to_char(m, 'YYYYMM'), tbl, m, (m + INTERVAL '1 month')::DATE);
+        m := (m + INTERVAL '1 month')::DATE;
+    END LOOP;
+    EXECUTE format('CREATE TABLE %I PARTITION OF %I DEFAULT', tbl || '_default', tbl);
+
+    EXECUTE format('INSERT INTO %I OVERRIDING SYSTEM VALUE SELECT * FROM %I', tbl, legacy);
+    FOR fk IN
+        SELECT conrelid::regclass::TEXT AS rel, conname
+        FROM pg_constraint
+        WHERE confrelid = legacy::regclass AND contype = 'f' AND conrelid <> legacy::regclass
+    LOOP
+        RAISE NOTICE 'partition_event_table(%): dropping foreign key %.% (the key it references now includes %)',
+                     tbl, fk.rel, fk.conname, part_col;
+        EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I', fk.rel, fk.conname);
+    END LOOP;
+    -- No CASCADE: anything else still depending on the old table fails the migration
+    EXECUTE format('DROP TABLE %I', legacy);
+    -- Keys and indexes are added once the old table (and its index names) is gone
+    FOREACH stmt IN ARRAY COALESCE(keys, '{}') LOOP
+        EXECUTE format('ALTER TABLE %I ADD %s', tbl, stmt);
+    END LOOP;
+    FOREACH stmt IN ARRAY COALESCE(indexes, '{}') LOOP
+        EXECUTE stmt;
+    END LOOP;
+    FOREACH stmt IN ARRAY COALESCE(fks, '{}') LOOP
+        EXECUTE stmt;
+    END LOOP;
+
+    -- IDENTITY columns got a fresh sequence; continue after the copied ids
+    FOR seq IN
+        SELECT a.attname FROM pg_attribute a
+        WHERE a.attrelid = tbl::regclass AND a.attidentity <> ''
+    LOOP
+        EXECUTE format('SELECT setval(pg_get_serial_sequence(%L, %L), COALESCE(MAX(%I), 0) + 1, false) FROM %I',
+                       tbl, seq.attname, seq.attname, tbl);
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT partition_event_table('pulls', 'created_at');
+SELECT partition_event_table('impressions', 'impression_time');
+SELECT partition_event_table('user_article_stats', 'created_at');
+SELECT partition_event_table('user_interactions', 'interaction_time');
+SELECT partition_event_table('mab_rank_logs', 'created_at');
+
+-- Secondary indexes the event queries rely on (no-ops where partition_event_table
+-- already re-created them)
+CREATE INDEX IF NOT EXISTS idx_user_article_stats_user_url
+    ON user_article_stats(user_id, url_id) INCLUDE (pull_impressions, pull_clicks);
+CREATE INDEX IF NOT EXISTS idx_pulls_user_url_created
+    ON pulls (user_id, url_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_user_interactions_user_url_pull
+    ON user_interactions (user_id, url_id, pull_id);
+CREATE INDEX IF NOT EXISTS idx_mab_rank_logs_snapshot
+    ON mab_rank_logs (snapshot_id, rank_position);
+
+-- Daily aggregates of the months event_retention.py drops. user_article_stats
+-- already carries the per-pull impression, so pulls and impressions need no
+-- rollup of their own; mab_rank_logs are diagnostics and are dropped outright.
+CREATE TABLE IF NOT EXISTS daily_article_stats (
+    day DATE NOT NULL,
+    office_id UUID NOT NULL,
+    user_id UUID NOT NULL,
+    url_id INTEGER NOT NULL,
+    impressions BIGINT NOT NULL DEFAULT 0,
+    clicks BIGINT NOT NULL DEFAULT 0,
+    bookmarks BIGINT NOT NULL DEFAULT 0,
+    adds BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, office_id, user_id, url_id)
+);
+CREATE INDEX IF NOT EXISTS idx_daily_article_stats_user_url
+    ON daily_article_stats (user_id, url_id);
+
+CREATE TABLE IF NOT EXISTS daily_interactions (
+    day DATE NOT NULL,
+    user_id UUID NOT NULL,
+    url_id INTEGER NOT NULL,
+    interaction_type TEXT NOT NULL,
+    interactions BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, user_id, url_id, interaction_type)
+);
@@ -0,0 +1,76 @@
+"""
+In-process TTL cache for resolved session tokens.
+
+Maps a session token to the (user_id, session_id, office_id) it resolved to.
+An entry lives for at most `ttl` seconds and never past the session's own
+`expires_at`; `invalidate` drops it immediately (used by /api/logout). The
+cache is bounded: once `max_entries` is reached the least recently used
+token is evicted.
+
+Each uvicorn worker has its own cache, so a logout handled by one worker is
+seen by the others after at most `ttl` seconds.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+class SessionCache:
+    def __init__(self, ttl=60.0, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # token -> (deadline, value)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, token):
+        """Cached value for token, or None if absent or expired."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[token]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self._hits += 1
+            return entry[1]
+
+    def put(self, token, value, expires_at=None):
+        """Cache value until min(now + ttl, expires_at); returns value."""
+        lifetime = self.ttl
+        if expires_at is not None:
+            now = datetime.now(expires_at.tzinfo) if expires_at.tzinfo else datetime.now()
+            lifetime = min(lifetime, (expires_at - now).total_seconds())
+        if lifetime <= 0:
+            return value
+        with self._lock:
+            self._entries[token] = (time.monotonic() + lifetime, value)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+            }
@@ -1,6 +1,6 @@
 import json
 from datetime import datetime, timedelta
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 import uuid
 import sys
 from pathlib import Path
@@ -8,6 +8,7 @@ import psycopg2
 from bcrypt import hashpw, gensalt
 from psycopg2 import DatabaseError
 import os
+import numpy as np
 import pytest
 from fastapi.testclient import TestClient
 import asyncio
@@ -24,6 +25,7 @@ def safe_response_json(response):
 sys.path.append(str(Path(__file__).parent.parent))
 
 from fast_api_app import app
+from db_utils import get_db
 
 @pytest.fixture
 def client():
@@ -41,6 +43,13 @@ def mock_db_connection():
     mock_conn.cursor.return_value.__enter__.return_value = mock_cur
     return mock_conn
 
+@pytest.fixture
+def pooled_db(mock_db_connection):
+    """Serve mock_db_connection to endpoints that borrow it through Depends(get_db)."""
+    app.dependency_overrides[get_db] = lambda: mock_db_connection
+    yield mock_db_connection
+    app.dependency_overrides.pop(get_db, None)
+
 @pytest.fixture
 def mock_user_data():
     """Sample user data for testing."""
@@ -55,6 +64,13 @@ def mock_session_token():
     """Generate a mock session token."""
     return str(uuid.uuid4())
 
+@pytest.fixture
+def cached_session(mock_session_token):
+    """Resolve mock_session_token from the session cache (no sessions query)."""
+    from fast_api_app import SESSION_CACHE
+    SESSION_CACHE.put(mock_session_token, (1, "session_id", 1))
+    return mock_session_token
+
 @pytest.fixture
 def mock_article_data():
     """Sample article data for testing."""
@@ -70,7 +86,7 @@ def mock_article_data():
 
 # --- Authentication Tests ---
 
-def test_signup_success(client, mock_db_connection, mock_user_data):
+def test_signup_success(client, pooled_db, mock_db_connection, mock_user_data):
     """Test successful user signup."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_db_connection.cursor.return_value.__enter__.return_value.fetchone.return_value = (1,)
@@ -79,7 +95,7 @@ def test_signup_success(client, mock_db_connection, mock_user_data):
         data = response.json()
         assert data["message"] == "User created successfully"
 
-def test_signup_invalid_office(client, mock_db_connection, mock_user_data):
+def test_signup_invalid_office(client, pooled_db, mock_db_connection, mock_user_data):
     """Test signup with invalid office code."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_db_connection.cursor.return_value.__enter__.return_value.fetchone.return_value = None
@@ -88,7 +104,7 @@ def test_signup_invalid_office(client, mock_db_connection, mock_user_data):
         data = response.json()
         assert "Invalid office code" in data["detail"]
 
-def test_login_success(client, mock_db_connection, mock_user_data, mock_session_token):
+def test_login_success(client, pooled_db, mock_db_connection, mock_user_data, mock_session_token):
     """Test successful login."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection), \
          patch('fast_api_app.checkpw', return_value=True):
@@ -105,7 +121,7 @@ def test_login_success(client, mock_db_connection, mock_user_data, mock_session_
         assert "session_token" in data
         assert data["message"] == "Login successful"
 
-def test_login_invalid_credentials(client, mock_db_connection, mock_user_data):
+def test_login_invalid_credentials(client, pooled_db, mock_db_connection, mock_user_data):
     """Test login with invalid credentials."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_db_connection.cursor.return_value.__enter__.return_value.fetchone.return_value = None
@@ -119,7 +135,7 @@ def test_login_invalid_credentials(client, mock_db_connection, mock_user_data):
 
 # --- Article Endpoints Tests ---
 
-def test_get_articles(client, mock_db_connection, mock_article_data):
+def test_get_articles(client, pooled_db, mock_db_connection, mock_article_data):
     """Test getting articles with optional filters."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_db_connection.cursor.return_value.__enter__.return_value.fetchall.return_value = [
@@ -135,7 +151,7 @@ def test_get_articles(client, mock_db_connection, mock_article_data):
         assert len(data["articles"]) == 1
         assert data["articles"][0]["url_id"] == mock_article_data["url_id"]
 
-def test_get_articles_count(client, mock_db_connection):
+def test_get_articles_count(client, pooled_db, mock_db_connection):
     """Test getting total article count."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_db_connection.cursor.return_value.__enter__.return_value.fetchone.return_value = (42,)
@@ -144,7 +160,7 @@ def test_get_articles_count(client, mock_db_connection):
         data = response.json()
         assert data["total"] == 42
 
-def test_get_offices(client, mock_db_connection):
+def test_get_offices(client, pooled_db, mock_db_connection):
     """Test getting list of offices."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_db_connection.cursor.return_value.__enter__.return_value.fetchall.return_value = [
@@ -157,13 +173,13 @@ def test_get_offices(client, mock_db_connection):
         assert len(data) == 2
         assert {"office_id": 1, "office_code": "Office1"} in data
 
-def test_log_interaction(client, mock_db_connection, mock_session_token):
+def test_log_interaction(client, pooled_db, mock_db_connection, mock_session_token, cached_session):
     """Test successful interaction logging."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
         mock_cursor.fetchone.side_effect = [
-            (1, 1),  # user_id, office_id from session
-            (101,)   # pull_id
+            (101, datetime.now()),  # pull_id, created_at
+            None                    # no click recorded yet for this pull
         ]
         
         response = client.post('/api/interactions',
@@ -177,14 +193,15 @@ def test_log_interaction(client, mock_db_connection, mock_session_token):
         data = response.json()
         assert "click recorded" in data["message"]
         mock_db_connection.commit.assert_called_once()
+        # First click on the pull: its stats row is bumped
+        assert any("pull_clicks = pull_clicks + 2" in c.args[0] for c in mock_cursor.execute.call_args_list)
 
-def test_get_template(client, mock_db_connection, mock_session_token):
+def test_get_template(client, pooled_db, mock_db_connection, mock_session_token, cached_session):
     """Test getting a specific template."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         current_time = datetime.now()
         mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
         mock_cursor.fetchone.side_effect = [
-            (1,),  # user_id
             ("Test Template", "Test Description", current_time, current_time, False)  # template metadata
         ]
         # Mock section tree data
@@ -198,12 +215,11 @@ def test_get_template(client, mock_db_connection, mock_session_token):
         assert data["name"] == "Test Template"
         assert "sections" in data
 
-def test_get_template_not_found(client, mock_db_connection, mock_session_token):
+def test_get_template_not_found(client, pooled_db, mock_db_connection, mock_session_token, cached_session):
     """Test retrieving a non-existent template."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
         mock_cursor.fetchone.side_effect = [
-            (1,),  # user_id
             None   # no template found
         ]
         mock_cursor.fetchall.return_value = []  # No sections
@@ -215,12 +231,11 @@ def test_get_template_not_found(client, mock_db_connection, mock_session_token):
         data = response.json()
         assert "Template not found" in data["detail"]
 
-def test_archive_template_not_found(client, mock_db_connection, mock_session_token):
+def test_archive_template_not_found(client, pooled_db, mock_db_connection, mock_session_token, cached_session):
     """Test archiving a non-existent template."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
         mock_cursor.fetchone.side_effect = [
-            (1,),  # user_id
             None   # no template found
         ]
         mock_cursor.rowcount = 0  # Indicate no rows updated
@@ -254,7 +269,7 @@ def test_invalid_session_token(client, mock_db_connection):
 
 def test_database_connection_error(client):
     """Test handling of database connection errors."""
-    with patch('fast_api_app.connect_db', return_value=None):
+    with patch('db_utils.connect_db', return_value=None):
         response = client.get('/api/articles')
         assert response.status_code == 500
         data = response.json()
@@ -262,7 +277,7 @@ def test_database_connection_error(client):
 
 # --- Additional Authentication Tests ---
 
-def test_logout_success(client, mock_db_connection, mock_session_token):
+def test_logout_success(client, pooled_db, mock_db_connection, mock_session_token):
     """Test successful logout."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_db_connection.cursor.return_value.__enter__.return_value.execute.return_value = None
@@ -273,6 +288,27 @@ def test_logout_success(client, mock_db_connection, mock_session_token):
         assert data["message"] == "Logged out successfully"
         mock_db_connection.commit.assert_called_once()
 
+def test_logout_invalidates_cached_session(client, pooled_db, mock_db_connection, cached_session):
+    """Test that a logged-out token no longer resolves from the session cache."""
+    with patch('fast_api_app.connect_db', return_value=mock_db_connection):
+        mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
+        assert client.post('/api/logout', headers={'Authorization': cached_session}).status_code == 200
+        mock_cursor.fetchone.return_value = None
+        response = client.get('/api/pulls', headers={'Authorization': cached_session})
+        assert response.status_code == 401
+
+def test_session_lookup_is_cached(client, pooled_db, mock_db_connection, mock_session_token):
+    """Test that a resolved session token is not looked up again."""
+    with patch('fast_api_app.connect_db', return_value=mock_db_connection):
+        mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchone.return_value = (1, "session_id", 1, datetime.now() + timedelta(hours=1))
+        mock_cursor.fetchall.return_value = [("user1",)]
+        for _ in range(3):
+            response = client.get('/api/user_names', headers={'Authorization': mock_session_token})
+            assert response.status_code == 200
+        session_lookups = [c for c in mock_cursor.execute.call_args_list if "session_token" in c.args[0]]
+        assert len(session_lookups) == 1
+
 # --- Additional Article Related Tests ---
 
 def test_get_topics(client, mock_db_connection):
@@ -302,7 +338,47 @@ def test_get_article_titles(client, mock_db_connection):
         assert isinstance(data["titles"], list)
         assert len(data["titles"]) == 2
 
-def test_get_user_names(client, mock_db_connection, mock_session_token):
+def test_get_topics_etag_not_modified(client, mock_db_connection):
+    """Test that reference lists are cached per catalog version and revalidated by ETag."""
+    with patch('fast_api_app.connect_db', return_value=mock_db_connection) as connect:
+        mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchone.return_value = (7,)
+        mock_cursor.fetchall.return_value = [("topic1",)]
+        response = client.get('/api/topics')
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+        assert etag == '"topics-7"'
+
+        response = client.get('/api/topics')
+        assert response.json() == {"topics": ["topic1"]}
+        response = client.get('/api/topics', headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        # Only the first request needed the database
+        assert connect.call_count == 1
+
+def test_get_publication_dates_cached(client, mock_db_connection):
+    """Test that /api/articles/dates is served from the reference cache."""
+    with patch('fast_api_app.connect_db', return_value=mock_db_connection):
+        mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchone.return_value = (3,)
+        mock_cursor.fetchall.return_value = [(datetime(2024, 5, 1),)]
+        assert client.get('/api/articles/dates').json() == {"dates": ["2024-05-01"]}
+        mock_cursor.fetchall.return_value = []
+        assert client.get('/api/articles/dates').json() == {"dates": ["2024-05-01"]}
+
+def test_search_article_titles(client, mock_db_connection):
+    """Test that title autocomplete loads the index once per catalog version."""
+    with patch('fast_api_app.connect_db', return_value=mock_db_connection) as connect:
+        mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchone.return_value = (1,)
+        mock_cursor.fetchall.return_value = [(1, "Drone swarm trial", datetime(2024, 1, 1)), (2, "Naval drone order", datetime(2024, 1, 2))]
+        response = client.get('/api/article_titles/search', params={"q": "dro"})
+        assert response.status_code == 200
+        assert response.json() == {"titles": ["Drone swarm trial", "Naval drone order"]}
+        assert client.get('/api/article_titles/search', params={"q": "naval"}).json() == {"titles": ["Naval drone order"]}
+        assert connect.call_count == 1
+
+def test_get_user_names(client, pooled_db, mock_db_connection, mock_session_token, cached_session):
     """Test getting usernames for an office."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_db_connection.cursor.return_value.__enter__.return_value.fetchone.return_value = (1,)
@@ -319,21 +395,21 @@ def test_get_user_names(client, mock_db_connection, mock_session_token):
 
 # --- Recommendations Tests ---
 
-def test_get_recommendations(client, mock_db_connection, mock_session_token, mock_article_data):
+def _mock_recommendation_queries(mock_db_connection, mock_article_data):
+    mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
+    mock_cursor.description = [(col,) for col in mock_article_data]
+    mock_cursor.fetchall.side_effect = [
+        [(mock_article_data["url_id"], 10, 5)],  # phase 1: (url_id, N, S)
+        [tuple(mock_article_data.values())]      # phase 2: hydrated page
+    ]
+    return mock_cursor
+
+def test_get_recommendations(client, pooled_db, mock_db_connection, mock_session_token, mock_article_data, cached_session):
     """Test getting article recommendations."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection), \
-         patch('fast_api_app.rank_articles_hellinger_ucb', return_value=[(1, 0.8)]) as mock_rank:
-        mock_db_connection.cursor.return_value.__enter__.return_value.fetchone.side_effect = [
-            (1, "session_id", 1),
-            (1,)
-        ]
-        mock_db_connection.cursor.return_value.__enter__.return_value.fetchall.side_effect = [
-            [(mock_article_data["url_id"], mock_article_data["title"],
-              mock_article_data["publication_date"], mock_article_data["topics_array"],
-              mock_article_data["description"], mock_article_data["author"],
-              mock_article_data["url"])],
-            [(1, 10, 5)]
-        ]
+         patch('fast_api_app.top_k_hellinger_ucb_batch', return_value=(np.array([1]), np.array([0.8]))) as mock_rank, \
+         patch('fast_api_app.IMPRESSION_WRITER.submit', return_value=True) as mock_submit:
+        mock_cursor = _mock_recommendation_queries(mock_db_connection, mock_article_data)
         response = client.post('/api/recommendations',
                                headers={'Authorization': mock_session_token},
                                json={
@@ -346,13 +422,383 @@ def test_get_recommendations(client, mock_db_connection, mock_session_token, moc
         assert response.status_code == 200
         data = response.json()
         mock_rank.assert_called_once()
+        assert data["total_count"] == 1
+        assert data["recommendations"][0]["url_id"] == mock_article_data["url_id"]
+        # Impressions are queued for the background writer, not written on the request path
+        mock_submit.assert_called_once()
+        assert mock_submit.call_args.args[0]["url_ids"] == [mock_article_data["url_id"]]
+        # Queued under the user, so only this user's interactions wait for it
+        assert mock_submit.call_args.kwargs["key"] == 1
+        assert not [c for c in mock_cursor.execute.call_args_list if "INSERT INTO pulls" in c.args[0]]
+
+def test_recommendations_write_impressions_when_queue_unavailable(client, pooled_db, mock_db_connection, mock_session_token, mock_article_data, cached_session):
+    """Test the synchronous fallback when the impression writer rejects a page."""
+    with patch('fast_api_app.connect_db', return_value=mock_db_connection), \
+         patch('fast_api_app.top_k_hellinger_ucb_batch', return_value=(np.array([1]), np.array([0.8]))), \
+         patch('fast_api_app.IMPRESSION_WRITER.submit', return_value=False), \
+         patch('fast_api_app.write_impression_pages') as mock_write:
+        _mock_recommendation_queries(mock_db_connection, mock_article_data)
+        response = client.post('/api/recommendations',
+                               headers={'Authorization': mock_session_token},
+                               json={"offset": 0, "limit": 20})
+        assert response.status_code == 200
+        mock_write.assert_called_once()
+        assert mock_write.call_args.args[1][0]["url_ids"] == [mock_article_data["url_id"]]
+
+def test_recommendations_bulk_write_capped_rank_log(client, pooled_db, mock_db_connection, mock_session_token, mock_article_data, cached_session):
+    """Test that a logged ranking is one snapshot insert plus one bulk insert of the top N ranks."""
+    with patch('fast_api_app.connect_db', return_value=mock_db_connection), \
+         patch('fast_api_app.LOG_MAB_RANKS', True), \
+         patch('fast_api_app.MAB_RANK_LOG_TOP_N', 2), \
+         patch('fast_api_app.top_k_hellinger_ucb_batch',
+               return_value=(np.array([1, 2, 3]), np.array([0.9, 0.8, 0.7]))) as mock_rank, \
+         patch('fast_api_app.psycopg2.extras.execute_values') as execute_values, \
+         patch('fast_api_app.IMPRESSION_WRITER.submit', return_value=True):
+        mock_cursor = _mock_recommendation_queries(mock_db_connection, mock_article_data)
+        mock_cursor.fetchone.return_value = (99,)  # snapshot_id
+        response = client.post('/api/recommendations',
+                               headers={'Authorization': mock_session_token},
+                               json={"offset": 0, "limit": 1})
+        assert response.status_code == 200
+        assert mock_rank.call_args.kwargs["k"] == 2
+        execute_values.assert_called_once()
+        rows = execute_values.call_args.args[2]
+        assert [(row[0], row[4], row[5]) for row in rows] == [(99, 1, 1), (99, 2, 2)]
+        assert not [c for c in mock_cursor.execute.call_args_list if "INSERT INTO mab_rank_logs" in c.args[0]]
+
+def _mock_async_pool(conn):
+    """An asyncpg-like pool whose acquire() yields conn."""
+    acquire = MagicMock()
+    acquire.__aenter__ = AsyncMock(return_value=conn)
+    acquire.__aexit__ = AsyncMock(return_value=False)
+    pool = MagicMock()
+    pool.acquire.return_value = acquire
+    return AsyncMock(return_value=pool)
+
+def test_get_recommendations_async(client, cached_session, mock_article_data):
+    """Test the asyncpg variant of /api/recommendations."""
+    conn = MagicMock()
+    conn.fetch = AsyncMock(side_effect=[
+        [(mock_article_data["url_id"], 10, 5)],  # phase 1: (url_id, N, S)
+        [mock_article_data]                      # phase 2: hydrated page (records behave like dicts)
+    ])
+    with patch('fast_api_app.get_async_pool', _mock_async_pool(conn)), \
+         patch('fast_api_app.IMPRESSION_WRITER.submit', return_value=True) as mock_submit:
+        response = client.post('/api/async/recommendations',
+                               headers={'Authorization': cached_session},
+                               json={"topics": ["test"], "offset": 0, "limit": 20})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total_count"] == 1
+        assert data["recommendations"][0]["url_id"] == mock_article_data["url_id"]
+        phase_1_sql = conn.fetch.call_args_list[0].args[0]
+        assert "%s" not in phase_1_sql and "$1" in phase_1_sql
+        mock_submit.assert_called_once()
+
+def test_get_user_mab_stats_async(client, cached_session):
+    """Test the asyncpg variant of /api/user_mab_stats."""
+    conn = MagicMock()
+    conn.fetch = AsyncMock(return_value=[(7, 2, 10, 0.2, 0, 1)])
+    with patch('fast_api_app.get_async_pool', _mock_async_pool(conn)):
+        response = client.get('/api/async/user_mab_stats', headers={'Authorization': cached_session})
+        assert response.status_code == 200
+        assert response.json()["user_mab_stats"][0] == {
+            "url_id": 7, "total_clicks": 2, "total_impressions": 10,
+            "user_ctr": 0.2, "total_bookmarks": 0, "total_adds": 1
+        }
+
+def _mock_async_interaction_conn(pull_row, already_clicked=None):
+    """asyncpg-like connection for /api/async/interactions: the pull lookup, click check and writes."""
+    conn = MagicMock()
+    conn.fetchrow = AsyncMock(return_value=pull_row)
+    conn.fetchval = AsyncMock(return_value=already_clicked)
+    conn.execute = AsyncMock()
+    conn.executemany = AsyncMock()
+    conn.transaction.return_value.__aenter__ = AsyncMock()
+    conn.transaction.return_value.__aexit__ = AsyncMock(return_value=False)
+    return conn
+
+def test_log_interaction_async_click(client, cached_session):
+    """Test the asyncpg variant of /api/interactions for a first click on a pull."""
+    pulled_at = datetime.now()
+    conn = _mock_async_interaction_conn({"pull_id": 101, "created_at": pulled_at})
+    with patch('fast_api_app.get_async_pool', _mock_async_pool(conn)), \
+         patch('fast_api_app.IMPRESSION_WRITER.wait_for', return_value=True) as mock_wait:
+        response = client.post('/api/async/interactions',
+                               headers={'Authorization': cached_session},
+                               json={"interaction_type": "click", "url_id": 7})
+        assert response.status_code == 200
+        assert response.json()["message"] == "click recorded."
+        # Only this user's queued pages are waited for before the lookup
+        mock_wait.assert_called_once_with(1)
+        pull_sql, *pull_args = conn.fetchrow.call_args.args
+        assert "FROM pulls" in pull_sql and "$1" in pull_sql and "%s" not in pull_sql
+        assert pull_args == [1, 7]
+        assert conn.fetchval.call_args.args[1:] == (1, 7, 101, pulled_at)
+        executed = [c.args for c in conn.execute.call_args_list]
+        assert any("INSERT INTO user_interactions" in sql for sql, *_ in executed)
+        stat_update = next(args for args in executed if "pull_clicks = pull_clicks + 2" in args[0])
+        assert stat_update[1:] == (1, 1, 7, 101, pulled_at)
+        assert any("pg_notify" in sql and args == [["1"]] for sql, *args in executed)
+        # pull_clicks + 2 is mirrored in the user and office arm counters
+        bumps = {c.args[0].split("INTO")[1].split()[0]: c.args[1] for c in conn.executemany.call_args_list}
+        assert bumps == {"bandit_arm_counters": [[1, 7, 0, 2]], "office_arm_counters": [[1, 7, 0, 2]]}
+
+def test_log_interaction_async_duplicate_click(client, cached_session):
+    """Test that a second click on the same pull is not recorded again."""
+    conn = _mock_async_interaction_conn({"pull_id": 101, "created_at": datetime.now()}, already_clicked=1)
+    with patch('fast_api_app.get_async_pool', _mock_async_pool(conn)), \
+         patch('fast_api_app.IMPRESSION_WRITER.wait_for', return_value=True):
+        response = client.post('/api/async/interactions',
+                               headers={'Authorization': cached_session},
+                               json={"interaction_type": "click", "url_id": 7})
+        assert response.status_code == 200
+        conn.execute.assert_not_called()
+        conn.executemany.assert_not_called()
+
+def test_log_interaction_async_add_bumps_office_rollup(client, cached_session):
+    """Test that an async 'add' updates its pull's stats and the office rollup, not the arm counters."""
+    conn = _mock_async_interaction_conn({"pull_id": 101, "created_at": datetime.now()})
+    with patch('fast_api_app.get_async_pool', _mock_async_pool(conn)), \
+         patch('fast_api_app.IMPRESSION_WRITER.wait_for', return_value=True):
+        response = client.post('/api/async/interactions',
+                               headers={'Authorization': cached_session},
+                               json={"interaction_type": "add", "url_id": 7})
+        assert response.status_code == 200
+        conn.fetchval.assert_not_called()
+        executed = [c.args[0] for c in conn.execute.call_args_list]
+        assert any("pull_adds = pull_adds + 1" in sql for sql in executed)
+        assert any("adds = office_arm_counters.adds + 1" in sql for sql in executed)
+        assert any("pg_notify" in sql for sql in executed)
+        conn.executemany.assert_not_called()
+
+def test_log_interaction_async_without_pull(client, cached_session):
+    """Test that an interaction on an article that was never served is rejected."""
+    conn = _mock_async_interaction_conn(None)
+    with patch('fast_api_app.get_async_pool', _mock_async_pool(conn)), \
+         patch('fast_api_app.IMPRESSION_WRITER.wait_for', return_value=True):
+        response = client.post('/api/async/interactions',
+                               headers={'Authorization': cached_session},
+                               json={"interaction_type": "click", "url_id": 7})
+        assert response.status_code == 400
+        assert "No active pull" in response.json()["detail"]
+        conn.execute.assert_not_called()
+
+def test_get_mab_rank_logs_async(client):
+    """Test the asyncpg variant of /api/mab_rank_logs."""
+    created = datetime(2025, 1, 1, 12, 0)
+    conn = MagicMock()
+    conn.fetch = AsyncMock(return_value=[
+        (11, created, "office", "user", "session", 7, 1, 10, 4, 0.9, 30, 1.0, [], None),
+    ])
+    with patch('fast_api_app.get_async_pool', _mock_async_pool(conn)):
+        response = client.get('/api/async/mab_rank_logs',
+                              params={"office_id": "office", "start_date": "2025-01-01"})
+        assert response.status_code == 200
+        log = response.json()["mab_rank_logs"][0]
+        assert log["url_id"] == 7 and log["created_at"] == created.isoformat()
+        sql, *args = conn.fetch.call_args.args
+        assert "FROM mab_rank_snapshots" in sql and "$2" in sql and "%s" not in sql
+        # asyncpg needs a real datetime for the date filter
+        assert args == ["office", datetime(2025, 1, 1)]
+
+def test_issue_dashboard_stream_ticket(client, cached_session):
+    """Test that a stream ticket is stored for the caller's office and never echoes the session token."""
+    conn = MagicMock()
+    conn.execute = AsyncMock()
+    with patch('fast_api_app.get_async_pool', _mock_async_pool(conn)):
+        response = client.post('/api/dashboard/stream_ticket', headers={'Authorization': cached_session})
+        assert response.status_code == 200
+        ticket = response.json()["ticket"]
+        assert ticket and cached_session not in ticket
+        sql, *args = conn.execute.call_args.args
+        assert "INSERT INTO dashboard_stream_tickets" in sql and "%s" not in sql
+        assert args[:2] == [ticket, 1]
+
+def test_dashboard_stream_rejects_unknown_ticket(client):
+    """Test that an expired or already redeemed ticket cannot open the stream."""
+    conn = MagicMock()
+    conn.fetchval = AsyncMock(return_value=None)
+    with patch('fast_api_app.get_async_pool', _mock_async_pool(conn)):
+        response = client.get('/api/dashboard/stream', params={"ticket": "spent"})
+        assert response.status_code == 401
+        sql, *args = conn.fetchval.call_args.args
+        assert "DELETE FROM dashboard_stream_tickets" in sql and args == ["spent"]
+
+def test_dashboard_stream_ignores_session_token_in_url(client, cached_session):
+    """Test that the session token is no longer accepted as a query parameter."""
+    response = client.get('/api/dashboard/stream', params={"token": cached_session})
+    assert response.status_code == 401
+
+def test_get_office_mab_stats(client, pooled_db, cached_session):
+    """Test that office stats are one read of the office rollup, not a GROUP BY over pulls."""
+    mock_cursor = pooled_db.cursor.return_value.__enter__.return_value
+    mock_cursor.fetchall.return_value = [(7, 4, 10, 0.4, 2, 1), (8, 0, 0, None, 0, 0)]
+    response = client.get('/api/office_mab_stats', headers={'Authorization': cached_session})
+    assert response.status_code == 200
+    assert response.json()["office_mab_stats"] == [
+        {"url_id": 7, "total_clicks": 4, "total_impressions": 10, "office_ctr": 0.4, "total_bookmarks": 2, "total_adds": 1},
+        {"url_id": 8, "total_clicks": 0, "total_impressions": 0, "office_ctr": 0.0, "total_bookmarks": 0, "total_adds": 0},
+    ]
+    sql, params = mock_cursor.execute.call_args.args
+    assert "FROM office_arm_counters" in sql and "GROUP BY" not in sql
+    assert params == (1,)
+
+def test_get_mab_rank_logs_reads_latest_snapshot(client, pooled_db, mock_db_connection):
+    """Test that the latest ranking is looked up by snapshot_id, not MAX(created_at) over the logs."""
+    created = datetime(2025, 1, 1, 12, 0)
+    with patch('fast_api_app.connect_db', return_value=mock_db_connection):
+        mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchall.return_value = [
+            (11, created, "office", "user", "session", 7, 1, 10, 4, 0.9, 30, 1.0, [], None),
+        ]
+        response = client.get('/api/mab_rank_logs', params={"office_id": "office", "user_id": "user"})
+        assert response.status_code == 200
+        assert response.json()["mab_rank_logs"][0]["url_id"] == 7
+        sql, params = mock_cursor.execute.call_args.args
+        assert "FROM mab_rank_snapshots" in sql and "LIMIT 1" in sql
+        assert "MAX(created_at)" not in sql
+        # The snapshot's created_at selects the one partition holding its rows
+        assert "(snapshot_id, created_at) = (" in sql
+        assert params == ("office", "user")
+
+def test_get_impression_writer_stats(client):
+    """Test the impression writer metrics endpoint."""
+    response = client.get('/api/impression_writer_stats')
+    assert response.status_code == 200
+    stats = response.json()["impression_writer_stats"]
+    assert {"queue_depth", "impressions_written", "ingest_rate_per_sec"} <= set(stats)
+
+def test_filter_articles_counts_without_refetching(client, pooled_db, mock_db_connection, mock_session_token, mock_article_data, cached_session):
+    """Test that total_count comes from a count(*) query, not a second full fetch."""
+    with patch('fast_api_app.connect_db', return_value=mock_db_connection), \
+         patch('fast_api_app.fetch_articles', return_value=[mock_article_data]) as mock_fetch:
+        mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchone.return_value = (42,)  # count(*)
+        response = client.post('/api/articles/filter',
+                               headers={'Authorization': mock_session_token},
+                               json={"topics": ["test"], "offset": 0, "limit": 20})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total_count"] == 42
+        assert data["total_count_estimated"] is False
+        mock_fetch.assert_called_once()
+        assert "count(*)" in mock_cursor.execute.call_args_list[-1].args[0]
+
+def test_count_articles_estimated_mode():
+    """Test that broad filters use the planner estimate and narrow ones fall back to count(*)."""
+    from fast_api_app import count_articles
+    conn = MagicMock()
+    cur = conn.cursor.return_value.__enter__.return_value
+    cur.fetchone.return_value = ([{"Plan": {"Plan Rows": 250000}}],)
+    assert count_articles(conn, topics=["test"], estimated=True) == (250000, True)
+    assert cur.execute.call_count == 1
+
+    cur.reset_mock()
+    cur.fetchone.side_effect = [([{"Plan": {"Plan Rows": 12}}],), (9,)]
+    assert count_articles(conn, topics=["test"], estimated=True) == (9, False)
+    assert "count(*)" in cur.execute.call_args_list[-1].args[0]
+
+def test_article_cursor_round_trip():
+    """Test that keyset cursors encode (publication_date, url_id) opaquely."""
+    from fast_api_app import encode_cursor, decode_cursor, next_cursor
+    published = datetime(2024, 5, 1, 12, 30)
+    cursor = encode_cursor({"publication_date": published, "url_id": 17})
+    assert decode_cursor(cursor) == (published, 17)
+    assert decode_cursor(encode_cursor({"publication_date": None, "url_id": 3})) == (None, 3)
+    assert next_cursor([{"publication_date": published, "url_id": 17}], limit=2) is None
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+def test_get_articles_keyset_page(client, pooled_db, mock_db_connection, mock_article_data):
+    """Test that a cursor turns the page query into a keyset range without OFFSET skipping."""
+    from fast_api_app import encode_cursor
+    cursor = encode_cursor({"publication_date": datetime(2024, 5, 1), "url_id": 17})
+    with patch('fast_api_app.connect_db', return_value=mock_db_connection):
+        mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
+        mock_cursor.description = [(col,) for col in mock_article_data]
+        mock_cursor.fetchall.return_value = [tuple(mock_article_data.values())]
+        response = client.get('/api/articles', params={"cursor": cursor, "limit": 1, "offset": 40})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["next_cursor"] is not None
+        sql, params = mock_cursor.execute.call_args.args
+        assert "(uc.publication_date, uc.url_id) < (%s, %s)" in sql
+        assert params[-4:] == [datetime(2024, 5, 1), 17, 1, 0]
+
+def test_get_articles_invalid_cursor(client, pooled_db):
+    """Test that a malformed cursor is rejected before touching the database."""
+    response = client.get('/api/articles', params={"cursor": "garbage"})
+    assert response.status_code == 400
+
+def test_article_columns_projection():
+    """Test that list queries select the summary columns unless asked otherwise."""
+    from fast_api_app import article_columns
+    assert "uc.content" not in article_columns()
+    assert "uc.title" in article_columns("summary")
+    assert article_columns("detail") == "uc.*"
+    assert article_columns("title") == "uc.url_id, uc.publication_date, uc.title"
+    with pytest.raises(ValueError):
+        article_columns("title,password")
+
+def test_get_articles_summary_projection(client, pooled_db, mock_db_connection, mock_article_data):
+    """Test that /api/articles does not fetch the content body by default."""
+    with patch('fast_api_app.connect_db', return_value=mock_db_connection):
+        mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
+        mock_cursor.description = [(col,) for col in mock_article_data]
+        mock_cursor.fetchall.return_value = [tuple(mock_article_data.values())]
+        response = client.get('/api/articles')
+        assert response.status_code == 200
+        sql = mock_cursor.execute.call_args.args[0]
+        assert "uc.*" not in sql and "uc.content" not in sql
+
+def test_get_articles_unknown_field(client, pooled_db):
+    """Test that an unknown projection field is rejected."""
+    response = client.get('/api/articles', params={"fields": "title,nope"})
+    assert response.status_code == 400
+
+def test_get_article_detail(client, pooled_db, mock_article_data):
+    """Test the single-article endpoint returns every column, including content."""
+    article = dict(mock_article_data, content="Full body")
+    mock_cursor = pooled_db.cursor.return_value.__enter__.return_value
+    mock_cursor.description = [(col,) for col in article]
+    mock_cursor.fetchall.return_value = [tuple(article.values())]
+    response = client.get('/api/articles/1')
+    assert response.status_code == 200
+    assert response.json()["content"] == "Full body"
+    assert "uc.*" in mock_cursor.execute.call_args.args[0]
+
+def test_get_article_detail_not_found(client, pooled_db):
+    """Test the single-article endpoint returns 404 for an unknown url_id."""
+    mock_cursor = pooled_db.cursor.return_value.__enter__.return_value
+    mock_cursor.description = [("url_id",)]
+    mock_cursor.fetchall.return_value = []
+    response = client.get('/api/articles/999')
+    assert response.status_code == 404
+
+def test_get_mab_cache_stats(client):
+    """Test the UCB lookup cache metrics endpoint."""
+    response = client.get('/api/mab_cache_stats')
+    assert response.status_code == 200
+    stats = response.json()["mab_cache_stats"]
+    assert {"hits", "misses", "hit_ratio"} <= set(stats)
+
+def test_bump_arm_counters_updates_user_and_office_rows():
+    """Test the incremental bandit counter upserts."""
+    from fast_api_app import bump_arm_counters
+    mock_cursor = MagicMock()
+    bump_arm_counters(mock_cursor, "u1", "o1", [1, 2], n=1)
+    user_call, office_call = mock_cursor.executemany.call_args_list
+    assert "bandit_arm_counters" in user_call.args[0]
+    assert user_call.args[1] == [("u1", 1, 1, 0), ("u1", 2, 1, 0)]
+    assert "office_arm_counters" in office_call.args[0]
+    assert office_call.args[1] == [("o1", 1, 1, 0), ("o1", 2, 1, 0)]
 
 # --- Additional Bookmark Tests ---
 
-def test_delete_bookmark(client, mock_db_connection, mock_session_token):
+def test_delete_bookmark(client, pooled_db, mock_db_connection, mock_session_token, cached_session):
     """Test deleting a bookmark."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
-        mock_db_connection.cursor.return_value.__enter__.return_value.fetchone.return_value = (1,)
         response = client.delete('/api/bookmarks/1',
                                  headers={'Authorization': mock_session_token})
         assert response.status_code == 200
@@ -360,19 +806,15 @@ def test_delete_bookmark(client, mock_db_connection, mock_session_token):
         assert "Bookmark removed successfully" in data["message"]
         mock_db_connection.commit.assert_called_once()
 
-def test_get_bookmark_candidates(client, mock_db_connection, mock_session_token, mock_article_data):
+def test_get_bookmark_candidates(client, pooled_db, mock_db_connection, mock_session_token, mock_article_data, cached_session):
     """Test getting bookmark candidates."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
-        mock_db_connection.cursor.return_value.__enter__.return_value.fetchone.side_effect = [
-            (1,),
-        ]
         original_title = "This is a test article title"
         similar_title = "This is a test article title v2"
         current_time = datetime.now()
         mock_db_connection.cursor.return_value.__enter__.return_value.fetchall.side_effect = [
-            [(1,)],
-            [(1, current_time, original_title, current_time)],
-            [(2, similar_title, current_time)]
+            [(1, 2, current_time, original_title, similar_title, current_time, 95),
+             (5, 2, current_time, "This is a test article", similar_title, current_time, 86)]
         ]
         response = client.get('/api/bookmarks_candidates',
                               headers={'Authorization': mock_session_token})
@@ -384,12 +826,31 @@ def test_get_bookmark_candidates(client, mock_db_connection, mock_session_token,
             assert candidate["similarity"] >= 85
             assert candidate["original_title"] == original_title
             assert candidate["candidate_title"] == similar_title
-
-def test_confirm_bookmark_candidate(client, mock_db_connection, mock_session_token):
+        # A candidate similar to two bookmarks is listed once
+        assert len(data["bookmark_candidates"]) == 1
+        # Read straight from the precomputed table, no fuzzy matching per request
+        queries = [c.args[0] for c in mock_db_connection.cursor.return_value.__enter__.return_value.execute.call_args_list]
+        assert any("FROM bookmark_candidates" in q for q in queries)
+        assert not any("%%" in q for q in queries)
+
+def test_store_bookmark_candidates_scores_blocked_pairs():
+    """Test that a new bookmark's trigram-blocked pairs are scored and upserted."""
+    from fast_api_app import store_bookmark_candidates
+    cur = MagicMock()
+    cur.fetchall.return_value = [
+        ("This is a test article title", 2, "This is a test article title v2"),
+        ("This is a test article title", 3, "Unrelated budget story"),
+    ]
+    with patch('fast_api_app.psycopg2.extras.execute_values') as execute_values:
+        assert store_bookmark_candidates(cur, "user-1", 1) == 1
+        rows = execute_values.call_args.args[2]
+    assert [row[:3] for row in rows] == [("user-1", 1, 2)]
+    assert "c.title %% o.title" in cur.execute.call_args_list[-1].args[0]
+
+def test_confirm_bookmark_candidate(client, pooled_db, mock_db_connection, mock_session_token, cached_session):
     """Test confirming a bookmark candidate."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_db_connection.cursor.return_value.__enter__.return_value.fetchone.side_effect = [
-            (1,),
             ("http://example.com",),
             (1,)
         ]
@@ -411,7 +872,7 @@ def test_confirm_bookmark_candidate(client, mock_db_connection, mock_session_tok
 
 # --- Additional Template Tests ---
 
-def test_create_template_success(client, mock_db_connection, mock_session_token):
+def test_create_template_success(client, pooled_db, mock_db_connection, mock_session_token, cached_session):
     """Test successfully creating a template with sections."""
     template_data = {
         "name": "Test Template",
@@ -438,7 +899,6 @@ def test_create_template_success(client, mock_db_connection, mock_session_token)
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
         mock_cursor.fetchone.side_effect = [
-            (1,),  # user_id from session
             (1,),  # template_id
             (2,),  # section_id for parent
             (3,)   # section_id for child
@@ -454,7 +914,7 @@ def test_create_template_success(client, mock_db_connection, mock_session_token)
         assert data["message"] == "Template created successfully"
         mock_db_connection.commit.assert_called_once()
 
-def test_create_template_missing_fields(client, mock_session_token):
+def test_create_template_missing_fields(client, pooled_db, mock_session_token, cached_session):
     """Test creating a template with missing required fields."""
     response = client.post('/api/templates',
                           headers={'Authorization': mock_session_token},
@@ -464,12 +924,11 @@ def test_create_template_missing_fields(client, mock_session_token):
     data = response.json()
     assert "Template name and content are required" in data["detail"]
 
-def test_get_templates_success(client, mock_db_connection, mock_session_token):
+def test_get_templates_success(client, pooled_db, mock_db_connection, mock_session_token, cached_session):
     """Test successfully retrieving templates list."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
         current_time = datetime.now()
-        mock_cursor.fetchone.return_value = (1,)  # user_id
         mock_cursor.fetchall.return_value = [
             (1, "Template 1", "Description 1", current_time, current_time, False),
             (2, "Template 2", "Description 2", current_time, current_time, False)
@@ -485,15 +944,14 @@ def test_get_templates_success(client, mock_db_connection, mock_session_token):
         template = data["templates"][0]
         assert all(key in template for key in ["template_id", "name", "description", "created_at", "updated_at", "is_archived"])
 
-def test_get_template_by_id_success(client, mock_db_connection, mock_session_token):
+def test_get_template_by_id_success(client, pooled_db, mock_db_connection, mock_session_token, cached_session):
     """Test successfully retrieving a specific template with sections."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
         current_time = datetime.now()
         
-        # Mock session and template metadata
+        # Mock template metadata
         mock_cursor.fetchone.side_effect = [
-            (1,),  # user_id
             ("Template 1", "Description 1", current_time, current_time, False)  # template metadata
         ]
         
@@ -513,7 +971,7 @@ def test_get_template_by_id_success(client, mock_db_connection, mock_session_tok
         assert len(data["sections"]) == 1
         assert len(data["sections"][0]["subsections"]) == 1
 
-def test_archive_template_success(client, mock_db_connection, mock_session_token):
+def test_archive_template_success(client, pooled_db, mock_db_connection, mock_session_token, cached_session):
     """Test successfully archiving a template."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
@@ -529,7 +987,7 @@ def test_archive_template_success(client, mock_db_connection, mock_session_token
         assert "Template archived successfully" in data["message"]
         mock_db_connection.commit.assert_called_once()
 
-def test_archive_template_missing_field(client, mock_session_token):
+def test_archive_template_missing_field(client, pooled_db, mock_session_token, cached_session):
     """Test archiving a template without providing is_archived field."""
     response = client.patch('/api/templates/1/archive',
                           headers={'Authorization': mock_session_token},
@@ -541,12 +999,11 @@ def test_archive_template_missing_field(client, mock_session_token):
 
 # --- Added Pages Tests ---
 
-def test_add_page_success(client, mock_db_connection, mock_session_token, mock_article_data):
+def test_add_page_success(client, pooled_db, mock_db_connection, mock_session_token, mock_article_data, cached_session):
     """Test successfully adding a page."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_db_connection.cursor.return_value.__enter__.return_value.fetchone.side_effect = [
-            (1, 1),
-            (10,)
+            (10, datetime.now())
         ]
         response = client.post('/api/add_page',
                                headers={'Authorization': mock_session_token},
@@ -556,17 +1013,16 @@ def test_add_page_success(client, mock_db_connection, mock_session_token, mock_a
         assert "Page added and interaction logged successfully" in data["message"]
         mock_db_connection.commit.assert_called_once()
 
-def test_add_page_missing_url_id(client, mock_session_token):
+def test_add_page_missing_url_id(client, pooled_db, mock_session_token, cached_session):
     """Test adding a page without providing url_id."""
     response = client.post('/api/add_page',
                            headers={'Authorization': mock_session_token},
                            json={})
     assert response.status_code == 400
 
-def test_get_added_pages_success(client, mock_db_connection, mock_session_token, mock_article_data):
+def test_get_added_pages_success(client, pooled_db, mock_db_connection, mock_session_token, mock_article_data, cached_session):
     """Test retrieving added pages for a user."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
-        mock_db_connection.cursor.return_value.__enter__.return_value.fetchone.return_value = (1,)
         mock_db_connection.cursor.return_value.__enter__.return_value.fetchall.return_value = [
             (mock_article_data["url_id"], datetime.now(), mock_article_data["title"],
              mock_article_data["publication_date"], mock_article_data["topics_array"],
@@ -577,10 +1033,9 @@ def test_get_added_pages_success(client, mock_db_connection, mock_session_token,
                               headers={'Authorization': mock_session_token})
         assert response.status_code == 200
 
-def test_remove_added_page_success(client, mock_db_connection, mock_session_token, mock_article_data):
+def test_remove_added_page_success(client, pooled_db, mock_db_connection, mock_session_token, mock_article_data, cached_session):
     """Test removing an added page."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
-        mock_db_connection.cursor.return_value.__enter__.return_value.fetchone.return_value = (1,)
         mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
         mock_cursor.execute.return_value = None
         response = client.delete(f'/api/added_pages/{mock_article_data["url_id"]}',
@@ -597,7 +1052,8 @@ def test_remove_added_page_missing_session_token(client):
 
 def test_remove_added_page_db_connection_error(client, mock_session_token):
     """Test removing an added page when the database connection fails."""
-    with patch('fast_api_app.connect_db', return_value=None):
+    with patch('fast_api_app.connect_db', return_value=None), \
+         patch('db_utils.connect_db', return_value=None):
         response = client.delete('/api/added_pages/1', headers={'Authorization': mock_session_token})
         assert response.status_code == 500
         data = response.json()
@@ -608,24 +1064,22 @@ def test_remove_added_page_invalid_session(client, mock_db_connection, mock_sess
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_db_connection.cursor.return_value.__enter__.return_value.fetchone.return_value = None
         response = client.delete('/api/added_pages/1', headers={'Authorization': mock_session_token})
-        assert response.status_code == 500
+        # Session resolution happens before the endpoint body, so this is no longer masked as a 500
+        assert response.status_code == 401
         data = response.json()
-        assert ("Invalid or expired session token" in data["detail"] or
-                "Failed to remove added page" in data["detail"])
+        assert "Invalid or expired session token" in data["detail"]
 
-def test_remove_added_page_exception(client, mock_db_connection, mock_session_token):
+def test_remove_added_page_exception(client, mock_db_connection, mock_session_token, cached_session):
     """Test exception during removal of an added page."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         instance = mock_db_connection.cursor.return_value.__enter__.return_value
-        instance.fetchone.return_value = (1,)
         instance.execute.side_effect = Exception("Test removal error")
         response = client.delete('/api/added_pages/1', headers={'Authorization': mock_session_token})
         assert response.status_code == 500
 
-def test_get_added_pages_details_success(client, mock_db_connection, mock_session_token, mock_article_data):
+def test_get_added_pages_details_success(client, mock_db_connection, mock_session_token, mock_article_data, cached_session):
     """Test retrieving details for added pages."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
-        mock_db_connection.cursor.return_value.__enter__.return_value.fetchone.return_value = (1,)
         mock_db_connection.cursor.return_value.__enter__.return_value.fetchall.return_value = [
             (mock_article_data["url_id"], mock_article_data["title"], 
              mock_article_data["publication_date"], mock_article_data["author"], 
@@ -637,7 +1091,7 @@ def test_get_added_pages_details_success(client, mock_db_connection, mock_sessio
 
 # --- Office Info Tests ---
 
-def test_get_office_users_success(client, mock_db_connection, mock_session_token):
+def test_get_office_users_success(client, pooled_db, mock_db_connection, mock_session_token, cached_session):
     """Test retrieving users for the user's office."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_db_connection.cursor.return_value.__enter__.return_value.fetchone.return_value = (1,)
@@ -656,7 +1110,7 @@ def test_get_office_users_success(client, mock_db_connection, mock_session_token
         assert data["users"][0]["username"] == "user1"
         assert data["users"][0]["office_code"] == "Office1"
 
-def test_get_office_user_interactions_success(client, mock_db_connection, mock_session_token):
+def test_get_office_user_interactions_success(client, pooled_db, mock_db_connection, mock_session_token, cached_session):
     """Test retrieving user interactions for the user's office."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_db_connection.cursor.return_value.__enter__.return_value.fetchone.return_value = (1,)
@@ -677,7 +1131,7 @@ def test_get_office_user_interactions_success(client, mock_db_connection, mock_s
 
 # --- Pulls Endpoint Tests ---
 
-def test_get_pulls_success(client, mock_db_connection, mock_session_token):
+def test_get_pulls_success(client, pooled_db, mock_db_connection, mock_session_token, cached_session):
     """Test retrieving pulls for the current user."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_db_connection.cursor.return_value.__enter__.return_value.fetchone.return_value = (1,)
@@ -696,7 +1150,7 @@ def test_get_pulls_success(client, mock_db_connection, mock_session_token):
         assert data["pulls"][0]["url_id"] == 1
         assert "created_at" in data["pulls"][0]
 
-def test_get_pulls_no_pulls_found(client, mock_db_connection, mock_session_token):
+def test_get_pulls_no_pulls_found(client, mock_db_connection, mock_session_token, cached_session):
     """Test retrieving pulls when none exist for the user."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_db_connection.cursor.return_value.__enter__.return_value.fetchone.return_value = (1,)
@@ -708,17 +1162,17 @@ def test_get_pulls_no_pulls_found(client, mock_db_connection, mock_session_token
 
 # --- More Specific Error and Edge Case Tests ---
 
-def test_signup_missing_fields(client):
+def test_signup_missing_fields(client, pooled_db):
     """Test signup with missing required fields."""
     response = client.post('/api/signup', json={"username": "user"})
     assert response.status_code == 400
 
-def test_login_missing_fields(client):
+def test_login_missing_fields(client, pooled_db):
     """Test login with missing username or password."""
     response = client.post('/api/login', json={"username": "user"})
     assert response.status_code == 400
 
-def test_login_wrong_password(client, mock_db_connection, mock_user_data):
+def test_login_wrong_password(client, pooled_db, mock_db_connection, mock_user_data):
     """Test login with correct username but wrong password."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection), \
          patch('fast_api_app.checkpw', return_value=False) as mock_checkpw:
@@ -734,7 +1188,7 @@ def test_login_wrong_password(client, mock_db_connection, mock_user_data):
         assert "Invalid username or password" in data["detail"]
         mock_checkpw.assert_called_once()
 
-def test_login_db_error_user_lookup(client, mock_db_connection, mock_user_data):
+def test_login_db_error_user_lookup(client, pooled_db, mock_db_connection, mock_user_data):
     """Test login failure due to DB error during user lookup."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
@@ -747,12 +1201,11 @@ def test_login_db_error_user_lookup(client, mock_db_connection, mock_user_data):
         data = response.json()
         assert "Database error occurred" in data["detail"]
 
-def test_log_interaction_db_error(client, mock_db_connection, mock_session_token):
+def test_log_interaction_db_error(client, pooled_db, mock_db_connection, mock_session_token, cached_session):
     """Test psycopg2.Error during interaction logging."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
         mock_cursor.fetchone.side_effect = [
-            (1, 1),
             (101,)
         ]
         mock_cursor.execute.side_effect = psycopg2.Error("Interaction DB failed")
@@ -764,12 +1217,11 @@ def test_log_interaction_db_error(client, mock_db_connection, mock_session_token
         assert "Database error occurred" in data["detail"]
         mock_db_connection.rollback.assert_called_once()
 
-def test_log_interaction_generic_exception(client, mock_db_connection, mock_session_token):
+def test_log_interaction_generic_exception(client, pooled_db, mock_db_connection, mock_session_token, cached_session):
     """Test generic Exception during interaction logging."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
         mock_cursor.fetchone.side_effect = [
-            (1, 1),
             (101,)
         ]
         mock_cursor.execute.side_effect = Exception("Generic interaction error")
@@ -781,14 +1233,14 @@ def test_log_interaction_generic_exception(client, mock_db_connection, mock_sess
         assert "An internal error occurred" in data["detail"]
         mock_db_connection.rollback.assert_called_once()
 
-def test_confirm_bookmark_candidate_missing_keys(client, mock_session_token):
+def test_confirm_bookmark_candidate_missing_keys(client, pooled_db, mock_session_token, cached_session):
     """Test confirm bookmark candidate with missing JSON keys."""
     response = client.post('/api/confirm_bookmark_candidate',
                            headers={'Authorization': mock_session_token},
                            json={})
     assert response.status_code == 400
 
-def test_get_offices_fetch_error(client, mock_db_connection):
+def test_get_offices_fetch_error(client, pooled_db, mock_db_connection):
     """Test GET /api/offices specific psycopg2 error."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
@@ -800,7 +1252,7 @@ def test_get_offices_fetch_error(client, mock_db_connection):
         assert "Failed to fetch offices" in data["detail"]
         assert "Fetch offices failed" in data["detail"]
 
-def test_signup_insert_error(client, mock_db_connection, mock_user_data):
+def test_signup_insert_error(client, pooled_db, mock_db_connection, mock_user_data):
     """Test POST /api/signup specific psycopg2 error on insert."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
@@ -821,17 +1273,16 @@ def test_get_pulls_invalid_session(client, mock_db_connection):
         mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
         mock_cursor.fetchone.return_value = None
         response = client.get('/api/pulls', headers={'Authorization': 'invalid-token'})
-        assert response.status_code == 500
+        # Session resolution happens before the endpoint body, so this is no longer masked as a 500
+        assert response.status_code == 401
         data = response.json()
-        assert ("Invalid or expired session token" in data["detail"] or
-                "Failed to fetch pulls" in data["detail"])
+        assert "Invalid or expired session token" in data["detail"]
 
-def test_confirm_bookmark_candidate_not_found_error(client, mock_db_connection, mock_session_token):
+def test_confirm_bookmark_candidate_not_found_error(client, pooled_db, mock_db_connection, mock_session_token, cached_session):
     """Test POST /api/confirm_bookmark_candidate when candidate doesn't exist."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
         mock_cursor.fetchone.side_effect = [
-            (1,),
             ("http://orig.url",),
             None
         ]
@@ -845,11 +1296,40 @@ def test_confirm_bookmark_candidate_not_found_error(client, mock_db_connection,
         assert data.get("detail") or data.get("message")
         mock_db_connection.commit.assert_called_once()
 
-def test_log_interaction_add_type(client, mock_db_connection, mock_session_token):
+def test_log_interaction_waits_only_for_own_queued_pages(client, mock_db_connection, cached_session):
+    """Test that an interaction is rejected, not attached to an older pull, while the user's pages stay queued."""
+    borrowed = []
+    app.dependency_overrides[get_db] = lambda: borrowed.append(mock_db_connection) or mock_db_connection
+    try:
+        with patch('fast_api_app.IMPRESSION_WRITER.wait_for', return_value=False) as mock_wait:
+            response = client.post('/api/interactions',
+                                   headers={'Authorization': cached_session},
+                                   json={"interaction_type": "click", "url_id": 1})
+            assert response.status_code == 503
+            mock_wait.assert_called_once_with(1)
+            # The wait happens before a pooled connection is borrowed
+            assert borrowed == []
+    finally:
+        app.dependency_overrides.pop(get_db, None)
+
+def test_add_bookmark_waits_for_queued_pull(client, pooled_db, mock_db_connection, cached_session):
+    """Test that add_bookmark waits for the user's queued pages before looking up the pull."""
+    with patch('fast_api_app.connect_db', return_value=mock_db_connection), \
+         patch('fast_api_app.store_bookmark_candidates'), \
+         patch('fast_api_app.IMPRESSION_WRITER.wait_for', return_value=True) as mock_wait:
+        mock_db_connection.cursor.return_value.__enter__.return_value.fetchone.return_value = (101, datetime.now())
+        response = client.post('/api/add_bookmark',
+                               headers={'Authorization': cached_session},
+                               json={"url_id": 1})
+        assert response.status_code == 200
+        mock_wait.assert_called_once_with(1)
+
+def test_log_interaction_add_type(client, pooled_db, mock_db_connection, mock_session_token, cached_session):
     """Test POST /api/interactions for 'add' interaction type."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
-        mock_cursor.fetchone.side_effect = [(1, 1), (101,)]
+        pulled_at = datetime.now()
+        mock_cursor.fetchone.side_effect = [(101, pulled_at)]
         mock_cursor.execute.return_value = None
         interaction_data = {"interaction_type": "add", "url_id": 1}
         response = client.post('/api/interactions',
@@ -859,12 +1339,20 @@ def test_log_interaction_add_type(client, mock_db_connection, mock_session_token
         data = safe_response_json(response)
         assert "add recorded" in data["message"]
         mock_db_connection.commit.assert_called_once()
-
-def test_log_interaction_bookmark_type(client, mock_db_connection, mock_session_token):
+        # The office rollup is bumped in the same transaction
+        assert any("adds = office_arm_counters.adds + 1" in c.args[0] for c in mock_cursor.execute.call_args_list)
+        # Both lookups are bounded on the partition key
+        pull_sql = mock_cursor.execute.call_args_list[0].args[0]
+        assert "created_at >= NOW() - INTERVAL" in pull_sql
+        stats_call = next(c for c in mock_cursor.execute.call_args_list if "SET pull_adds" in c.args[0])
+        assert "created_at = %s" in stats_call.args[0]
+        assert stats_call.args[1][-1] == pulled_at
+
+def test_log_interaction_bookmark_type(client, pooled_db, mock_db_connection, mock_session_token, cached_session):
     """Test POST /api/interactions for 'bookmark' interaction type."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection):
         mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
-        mock_cursor.fetchone.side_effect = [(1, 1), (101,)]
+        mock_cursor.fetchone.side_effect = [(101, datetime.now())]
         mock_cursor.execute.return_value = None
         interaction_data = {"interaction_type": "bookmark", "url_id": 1}
         response = client.post('/api/interactions',
@@ -875,16 +1363,13 @@ def test_log_interaction_bookmark_type(client, mock_db_connection, mock_session_
         assert "bookmark recorded" in data["message"]
         mock_db_connection.commit.assert_called_once()
 
-def test_recommendations_no_articles_total_count_zero(client, mock_db_connection, mock_session_token):
-    """Test /api/recommendations when fetch_articles returns empty."""
+def test_recommendations_no_articles_total_count_zero(client, pooled_db, mock_db_connection, mock_session_token, cached_session):
+    """Test /api/recommendations when no article matches the filters."""
     with patch('fast_api_app.connect_db', return_value=mock_db_connection), \
-         patch('fast_api_app.fetch_articles', return_value=([], 0)):
-        mock_cursor = mock_db_connection.cursor.return_value.__enter__.return_value
-        mock_cursor.fetchone.return_value = (1, "sess1", 1)
+         patch('fast_api_app.fetch_candidate_stats', return_value=[]):
         response = client.post('/api/recommendations',
                                headers={'Authorization': mock_session_token},
                                json={})
-        # Updated expectation: 500 based on current behavior.
-        assert response.status_code == 500
+        assert response.status_code == 200
         data = safe_response_json(response)
-        # Optionally check error message here.
+        assert data == {"recommendations": [], "total_count": 0}
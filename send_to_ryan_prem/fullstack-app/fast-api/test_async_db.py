@@ -0,0 +1,27 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from async_db import pg_query
+
+
+def test_positional_placeholders_are_numbered():
+    sql, args = pg_query("SELECT 1 WHERE a = %s AND b ILIKE %s", ["x", "%y%"])
+    assert sql == "SELECT 1 WHERE a = $1 AND b ILIKE $2"
+    assert args == ["x", "%y%"]
+
+
+def test_named_placeholders_reuse_one_argument():
+    sql, args = pg_query(
+        "INSERT INTO t (a, b) SELECT %(user_id)s, %(url_ids)s::int[] WHERE %(user_id)s IS NOT NULL",
+        {"url_ids": [1, 2], "user_id": "u1", "unused": 0},
+    )
+    assert sql == "INSERT INTO t (a, b) SELECT $1, $2::int[] WHERE $1 IS NOT NULL"
+    assert args == ["u1", [1, 2]]
+
+
+def test_escaped_percent_is_unescaped():
+    sql, args = pg_query("SELECT 'a%%' || %s", ["b"])
+    assert sql == "SELECT 'a%' || $1"
+    assert args == ["b"]
@@ -0,0 +1,49 @@
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from dashboard_stream import DashboardHub, diff_snapshots
+
+
+def snapshot(ctr, log_ids):
+    return {
+        "office_mab_stats": [{"url_id": 1, "office_ctr": ctr}, {"url_id": 2, "office_ctr": 0.0}],
+        "mab_rank_logs": [{"mab_rank_log_id": i} for i in log_ids],
+    }
+
+
+def test_diff_only_carries_changed_rows():
+    assert diff_snapshots(snapshot(0.1, [1]), snapshot(0.1, [1])) == {}
+    delta = diff_snapshots(snapshot(0.1, [1]), snapshot(0.2, [2]))
+    assert delta["office_mab_stats"] == [{"url_id": 1, "office_ctr": 0.2}]
+    assert delta["mab_rank_logs"] == [{"mab_rank_log_id": 2}]
+
+
+def test_subscribers_of_one_office_share_a_producer():
+    async def scenario():
+        calls = []
+        snapshots = [snapshot(0.1, [1]), snapshot(0.2, [1])]
+
+        async def fetch(office_id):
+            calls.append(office_id)
+            return snapshots[min(len(calls), len(snapshots)) - 1]
+
+        hub = DashboardHub(fetch, min_interval=0, max_interval=60)
+        tabs = [hub.subscribe("office-1") for _ in range(3)]
+        firsts = [await tab.__anext__() for tab in tabs]
+        assert all(event == "snapshot" for event, _ in firsts)
+        assert hub.stats()["subscribers"] == 3
+
+        hub.notify("office-1")
+        updates = [await asyncio.wait_for(tab.__anext__(), 1) for tab in tabs]
+        assert all(update == ("delta", {"office_mab_stats": [{"url_id": 1, "office_ctr": 0.2}]}) for update in updates)
+        # One query per refresh, however many tabs are open
+        assert calls == ["office-1", "office-1"]
+
+        for tab in tabs:
+            await tab.aclose()
+        assert hub.stats()["offices"] == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,71 @@
+import sys
+import threading
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import psycopg2.extensions
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+import db_utils
+
+
+@pytest.fixture
+def mock_pool():
+    """A fake ThreadedConnectionPool handing out MagicMock connections."""
+    pool = MagicMock()
+    pool.getconn.side_effect = lambda: MagicMock(closed=0)
+    with patch('db_utils.psycopg2.pool.ThreadedConnectionPool', return_value=pool), \
+         patch('db_utils._slots', threading.BoundedSemaphore(2)), \
+         patch('db_utils.POOL_TIMEOUT', 0.01):
+        db_utils.close_pool()
+        yield pool
+        db_utils.close_pool()
+
+
+def test_close_returns_connection_to_pool(mock_pool):
+    conn = db_utils.connect_db()
+    raw = conn._raw
+    raw.get_transaction_status.return_value = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    conn.close()
+    mock_pool.putconn.assert_called_once_with(raw, close=False)
+    raw.close.assert_not_called()
+    raw.rollback.assert_not_called()
+
+
+def test_close_rolls_back_open_transaction(mock_pool):
+    conn = db_utils.connect_db()
+    raw = conn._raw
+    raw.get_transaction_status.return_value = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+    conn.close()
+    raw.rollback.assert_called_once()
+    mock_pool.putconn.assert_called_once_with(raw, close=False)
+
+
+def test_broken_connection_is_discarded(mock_pool):
+    conn = db_utils.connect_db()
+    raw = conn._raw
+    raw.closed = 2
+    conn.close()
+    mock_pool.putconn.assert_called_once_with(raw, close=True)
+
+
+def test_exhausted_pool_returns_none(mock_pool):
+    first, second = db_utils.connect_db(), db_utils.connect_db()
+    assert db_utils.connect_db() is None
+    first.close()
+    third = db_utils.connect_db()
+    assert third is not None
+    second.close()
+    third.close()
+
+
+def test_get_db_dependency_closes_connection(mock_pool):
+    dependency = db_utils.get_db()
+    conn = next(dependency)
+    raw = conn._raw
+    with pytest.raises(StopIteration):
+        next(dependency)
+    mock_pool.putconn.assert_called_once()
+    assert mock_pool.putconn.call_args.args[0] is raw
@@ -0,0 +1,341 @@
+"""
+Monthly partitioning of the event tables (partition_event_table in
+schema_update.sql) and the event_retention.py job, against a real database.
+
+These tests run only when RUN_DB_TESTS=1 (connection settings come from the
+usual DB_* variables). Each one builds small copies of the event tables in a
+scratch schema, seeds them across several months, runs the migration and
+drops the schema again.
+"""
+
+import json
+import os
+import sys
+import uuid
+from datetime import date, datetime, time
+from pathlib import Path
+
+import psycopg2
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from db_utils import _connect_params
+from event_retention import EVENT_TABLES, add_months, partition_name, run_maintenance
+from fast_api_app import (
+    CLICK_RECORDED_QUERY,
+    LATEST_PULL_QUERY,
+    LOG_IMPRESSIONS_QUERY,
+    PULL_STAT_UPDATES,
+    impression_page,
+    mab_rank_logs_query,
+)
+
+SCHEMA = "event_partitions_test"
+
+# The partitioning part of schema_update.sql (everything from its header on)
+SCHEMA_SQL = (Path(__file__).parent / "schema_update.sql").read_text()
+MIGRATION = SCHEMA_SQL[SCHEMA_SQL.index("-- Monthly range partitions"):]
+
+# Just the columns and keys the migration and the app queries touch. pulls,
+# impressions and user_interactions use SERIAL ids, mab_rank_logs an IDENTITY.
+BASE_TABLES = """
+    CREATE TABLE users (user_id UUID PRIMARY KEY, office_id UUID NOT NULL);
+    CREATE TABLE urls_content (url_id SERIAL PRIMARY KEY, title TEXT);
+    CREATE TABLE bandit_arm_counters (
+        user_id UUID, url_id INTEGER, n BIGINT NOT NULL DEFAULT 0, s BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, url_id)
+    );
+    CREATE TABLE office_arm_counters (
+        office_id UUID, url_id INTEGER, n BIGINT NOT NULL DEFAULT 0, s BIGINT NOT NULL DEFAULT 0,
+        bookmarks BIGINT NOT NULL DEFAULT 0, adds BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (office_id, url_id)
+    );
+    CREATE TABLE mab_rank_snapshots (
+        snapshot_id BIGSERIAL PRIMARY KEY, created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        office_id UUID, user_id UUID, session_id UUID
+    );
+    CREATE TABLE pulls (
+        pull_id SERIAL PRIMARY KEY,
+        user_id UUID REFERENCES users(user_id),
+        url_id INTEGER REFERENCES urls_content(url_id),
+        office_id UUID,
+        filter_topics TEXT[],
+        filter_date DATE,
+        page_offset INTEGER,
+        created_at TIMESTAMP DEFAULT NOW()
+    );
+    CREATE TABLE user_article_stats (
+        stat_id SERIAL PRIMARY KEY,
+        office_id UUID,
+        user_id UUID REFERENCES users(user_id),
+        url_id INTEGER REFERENCES urls_content(url_id),
+        pull_id INTEGER REFERENCES pulls(pull_id),
+        pull_impressions INTEGER DEFAULT 0,
+        pull_clicks INTEGER DEFAULT 0,
+        pull_bookmarks INTEGER DEFAULT 0,
+        pull_adds INTEGER DEFAULT 0,
+        last_interaction TIMESTAMP,
+        UNIQUE (office_id, user_id, url_id, pull_id)
+    );
+    CREATE TABLE impressions (
+        impression_id SERIAL PRIMARY KEY,
+        user_id UUID, url_id INTEGER, session_id UUID,
+        pull_id INTEGER REFERENCES pulls(pull_id),
+        office_id UUID,
+        impression_time TIMESTAMP DEFAULT NOW(),
+        UNIQUE (user_id, url_id, session_id, pull_id)
+    );
+    CREATE INDEX idx_impressions_session ON impressions (session_id);
+    CREATE TABLE user_interactions (
+        interaction_id SERIAL PRIMARY KEY,
+        user_id UUID, url_id INTEGER,
+        pull_id INTEGER REFERENCES pulls(pull_id),
+        interaction_type TEXT,
+        interaction_time TIMESTAMP DEFAULT NOW()
+    );
+    CREATE TABLE mab_rank_logs (
+        mab_rank_log_id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        snapshot_id BIGINT REFERENCES mab_rank_snapshots(snapshot_id),
+        created_at TIMESTAMP DEFAULT NOW(),
+        office_id UUID, user_id UUID, session_id UUID,
+        url_id INTEGER, rank_position INTEGER,
+        impressions_count INTEGER, clicks_count INTEGER,
+        ucb_value DOUBLE PRECISION, time_index_t INTEGER, c_param DOUBLE PRECISION,
+        filter_topics TEXT[], filter_date DATE
+    );
+"""
+
+KEYS_QUERY = """
+    SELECT c.contype, array_agg(a.attname::TEXT ORDER BY k.ord)
+    FROM pg_constraint c
+    CROSS JOIN LATERAL unnest(c.conkey) WITH ORDINALITY AS k(attnum, ord)
+    JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = k.attnum
+    WHERE c.conrelid = %s::regclass AND c.contype IN ('p', 'u')
+    GROUP BY c.oid, c.contype
+"""
+
+USER_ID = str(uuid.uuid4())
+OFFICE_ID = str(uuid.uuid4())
+SESSION_ID = str(uuid.uuid4())
+
+# Seeded months, relative to the current one: one past the default 6-month
+# retention, one inside it, and the current month
+SEEDED_MONTHS = (-8, -2, 0)
+
+
+def month_start(n):
+    return add_months(date.today().replace(day=1), n)
+
+
+def seed(cur):
+    cur.execute("INSERT INTO users VALUES (%s, %s)", (USER_ID, OFFICE_ID))
+    cur.execute("INSERT INTO urls_content (title) VALUES ('Drone contract'), ('Naval budget')")
+    for n in SEEDED_MONTHS:
+        at = datetime.combine(month_start(n), time(12))
+        cur.execute(
+            "INSERT INTO pulls (user_id, url_id, office_id, page_offset, created_at)"
+            " VALUES (%s, 1, %s, 0, %s) RETURNING pull_id",
+            (USER_ID, OFFICE_ID, at),
+        )
+        pull_id = cur.fetchone()[0]
+        cur.execute(
+            "INSERT INTO user_article_stats (office_id, user_id, url_id, pull_id, pull_impressions, pull_clicks)"
+            " VALUES (%s, %s, 1, %s, 1, 2)",
+            (OFFICE_ID, USER_ID, pull_id),
+        )
+        cur.execute(
+            "INSERT INTO impressions (user_id, url_id, session_id, pull_id, office_id, impression_time)"
+            " VALUES (%s, 1, %s, %s, %s, %s)",
+            (USER_ID, SESSION_ID, pull_id, OFFICE_ID, at),
+        )
+        cur.execute(
+            "INSERT INTO user_interactions (user_id, url_id, pull_id, interaction_type, interaction_time)"
+            " VALUES (%s, 1, %s, 'click', %s)",
+            (USER_ID, pull_id, at),
+        )
+        cur.execute(
+            "INSERT INTO mab_rank_snapshots (created_at, office_id, user_id, session_id)"
+            " VALUES (%s, %s, %s, %s) RETURNING snapshot_id",
+            (at, OFFICE_ID, USER_ID, SESSION_ID),
+        )
+        snapshot_id = cur.fetchone()[0]
+        cur.execute(
+            "INSERT INTO mab_rank_logs (snapshot_id, created_at, office_id, user_id, session_id, url_id, rank_position)"
+            " SELECT %s, %s, %s, %s, %s, url_id, url_id FROM urls_content",
+            (snapshot_id, at, OFFICE_ID, USER_ID, SESSION_ID),
+        )
+
+
+def table_keys(cur, table):
+    cur.execute(KEYS_QUERY, (table,))
+    return sorted((contype, tuple(columns)) for contype, columns in cur.fetchall())
+
+
+def row_counts(cur):
+    counts = {}
+    for table in EVENT_TABLES:
+        cur.execute(f"SELECT COUNT(*) FROM {table}")
+        counts[table] = cur.fetchone()[0]
+    return counts
+
+
+def migrate(conn):
+    with conn.cursor() as cur:
+        cur.execute(MIGRATION)
+    conn.commit()
+
+
+@pytest.fixture
+def db():
+    if os.environ.get("RUN_DB_TESTS") != "1":
+        pytest.skip("set RUN_DB_TESTS=1 to run the partition migration against a database")
+    try:
+        conn = psycopg2.connect(**_connect_params())
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"database unavailable: {e}")
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            cur.execute(f"CREATE SCHEMA {SCHEMA}")
+            # Session-wide, so it also covers the transactions run_maintenance commits
+            cur.execute(f"SET search_path TO {SCHEMA}")
+            cur.execute(BASE_TABLES)
+            seed(cur)
+        conn.commit()
+        yield conn
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.commit()
+        conn.close()
+
+
+def test_migration_keeps_rows_keys_and_indexes(db):
+    with db.cursor() as cur:
+        counts = row_counts(cur)
+        keys = {table: table_keys(cur, table) for table in EVENT_TABLES}
+    migrate(db)
+
+    with db.cursor() as cur:
+        assert row_counts(cur) == counts
+        for table, column in EVENT_TABLES.items():
+            cur.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", (table,))
+            assert cur.fetchone(), table
+            # Same keys, with the partition column appended
+            assert table_keys(cur, table) == sorted(
+                (contype, columns + (column,)) for contype, columns in keys[table]
+            ), table
+            cur.execute("SELECT to_regclass(%s), to_regclass(%s)",
+                        (f"{table}_default", partition_name(table, month_start(-8))))
+            assert all(cur.fetchone()), table
+        cur.execute(f"SELECT COUNT(*) FROM {partition_name('pulls', month_start(-2))}")
+        assert cur.fetchone()[0] == 1
+        # Secondary index re-created on the partitioned table; outbound FKs kept
+        cur.execute("SELECT indrelid::regclass::TEXT FROM pg_index WHERE indexrelid = to_regclass('idx_impressions_session')")
+        assert cur.fetchone() == ("impressions",)
+        cur.execute("SELECT COUNT(*) FROM pg_constraint WHERE conrelid = 'pulls'::regclass AND contype = 'f'")
+        assert cur.fetchone()[0] == 2
+        # user_article_stats.created_at was backfilled from its pull
+        cur.execute("""
+            SELECT COUNT(*) FROM user_article_stats s JOIN pulls p USING (pull_id)
+            WHERE s.created_at = p.created_at
+        """)
+        assert cur.fetchone()[0] == len(SEEDED_MONTHS)
+    # The FKs into pulls cannot follow its extended key and are reported
+    dropped = [notice for notice in db.notices if "dropping foreign key" in notice]
+    assert len(dropped) == 3
+
+
+def test_sequences_continue_after_copied_ids(db):
+    with db.cursor() as cur:
+        cur.execute("SELECT MAX(pull_id) FROM pulls")
+        max_pull = cur.fetchone()[0]
+        cur.execute("SELECT MAX(mab_rank_log_id) FROM mab_rank_logs")
+        max_log = cur.fetchone()[0]
+    migrate(db)
+
+    with db.cursor() as cur:
+        cur.execute("INSERT INTO pulls (user_id, url_id, office_id) VALUES (%s, 2, %s) RETURNING pull_id",
+                    (USER_ID, OFFICE_ID))
+        assert cur.fetchone()[0] > max_pull
+        cur.execute("INSERT INTO mab_rank_logs (url_id, rank_position) VALUES (2, 1) RETURNING mab_rank_log_id")
+        assert cur.fetchone()[0] > max_log
+
+
+def subplans_removed(cur, query, params):
+    """Partitions pruned from the query's plan (at planning or executor startup)."""
+    cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    def walk(node):
+        return node.get("Subplans Removed", 0) + sum(walk(child) for child in node.get("Plans", []))
+
+    return walk(plan[0]["Plan"])
+
+
+def test_app_queries_work_on_partitioned_tables(db):
+    migrate(db)
+    with db.cursor() as cur:
+        page = impression_page(USER_ID, [1, 2], SESSION_ID, OFFICE_ID)
+        cur.execute(LOG_IMPRESSIONS_QUERY, page)
+        cur.execute(LATEST_PULL_QUERY, (USER_ID, 2))
+        pull_id, pulled_at = cur.fetchone()
+        cur.execute("SELECT COUNT(*) FROM impressions WHERE pull_id = %s", (pull_id,))
+        assert cur.fetchone()[0] == 1
+
+        cur.execute(CLICK_RECORDED_QUERY, (USER_ID, 2, pull_id, pulled_at))
+        assert cur.fetchone() is None
+        cur.execute(PULL_STAT_UPDATES["click"], (OFFICE_ID, USER_ID, 2, pull_id, pulled_at))
+        assert cur.rowcount == 1
+        cur.execute("SELECT pull_clicks FROM user_article_stats WHERE pull_id = %s", (pull_id,))
+        assert cur.fetchone()[0] == 2
+
+        # The seeded pull from eight months back is outside the retention window
+        cur.execute(LATEST_PULL_QUERY, (USER_ID, 1))
+        assert cur.fetchone()[1].date() == month_start(0)
+        assert subplans_removed(cur, LATEST_PULL_QUERY, (USER_ID, 1)) > 0
+
+        query, params = mab_rank_logs_query(office_id=OFFICE_ID)
+        cur.execute(query, params)
+        rows = cur.fetchall()
+        assert [row[6] for row in rows] == [1, 2]
+        assert {row[1].date() for row in rows} == {month_start(0)}
+    db.commit()
+
+
+def test_migration_refuses_to_drop_dependent_views(db):
+    with db.cursor() as cur:
+        cur.execute("CREATE VIEW recent_pulls AS SELECT pull_id FROM pulls")
+    db.commit()
+    with pytest.raises(psycopg2.Error, match="recent_pulls"):
+        migrate(db)
+    db.rollback()
+    with db.cursor() as cur:
+        cur.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'pulls'::regclass")
+        assert cur.fetchone() is None
+
+
+def test_run_maintenance_creates_rolls_up_and_drops(db):
+    migrate(db)
+    summary = run_maintenance(db, retention_months=6, months_ahead=4)
+
+    for table in EVENT_TABLES:
+        assert partition_name(table, month_start(4)) in summary["created"]
+        assert partition_name(table, month_start(-8)) in summary["dropped"]
+        assert partition_name(table, month_start(-2)) not in summary["dropped"]
+    with db.cursor() as cur:
+        for table in EVENT_TABLES:
+            cur.execute("SELECT to_regclass(%s)", (partition_name(table, month_start(-8)),))
+            assert cur.fetchone()[0] is None
+        assert row_counts(cur)["pulls"] == len(SEEDED_MONTHS) - 1
+        # The expired month survives in the daily rollups
+        cur.execute("SELECT day, impressions, clicks FROM daily_article_stats")
+        assert cur.fetchall() == [(month_start(-8), 1, 2)]
+        cur.execute("SELECT day, interaction_type, interactions FROM daily_interactions")
+        assert cur.fetchall() == [(month_start(-8), "click", 1)]
+        cur.execute("SELECT COUNT(*) FROM mab_rank_snapshots")
+        assert cur.fetchone()[0] == len(SEEDED_MONTHS) - 1
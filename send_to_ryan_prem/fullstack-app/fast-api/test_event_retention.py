@@ -0,0 +1,45 @@
+import sys
+from datetime import date
+from pathlib import Path
+from unittest.mock import MagicMock
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from event_retention import EVENT_TABLES, add_months, partition_month, run_maintenance
+
+
+def test_month_arithmetic_and_partition_names():
+    assert add_months(date(2025, 11, 1), 3) == date(2026, 2, 1)
+    assert add_months(date(2025, 1, 1), -1) == date(2024, 12, 1)
+    assert partition_month("pulls", "pulls_p202502") == date(2025, 2, 1)
+    assert partition_month("pulls", "pulls_default") is None
+    assert partition_month("pulls", "impressions_p202502") is None
+
+
+def _mock_conn(partition_names):
+    conn = MagicMock()
+    cur = conn.cursor.return_value.__enter__.return_value
+    cur.fetchall.side_effect = [[(name,) for name in partition_names(table)] for table in EVENT_TABLES]
+    cur.rowcount = 0
+    return conn, cur
+
+
+def test_run_maintenance_creates_ahead_and_rolls_up_before_dropping():
+    conn, cur = _mock_conn(lambda table: [
+        f"{table}_p202502", f"{table}_p202503", f"{table}_p202509", f"{table}_default",
+    ])
+    summary = run_maintenance(conn, retention_months=6, months_ahead=1, today=date(2025, 9, 15))
+
+    assert summary["cutoff"] == "2025-03-01"
+    assert summary["created"] == [f"{table}_p202510" for table in EVENT_TABLES]
+    assert summary["dropped"] == [f"{table}_p202502" for table in EVENT_TABLES]
+
+    statements = [repr(c.args[0]) for c in cur.execute.call_args_list]
+    rollup = next(i for i, s in enumerate(statements)
+                  if "daily_article_stats" in s and "user_article_stats_p202502" in s)
+    detach = next(i for i, s in enumerate(statements)
+                  if "DETACH" in s and "user_article_stats_p202502" in s)
+    assert rollup < detach
+    # pulls have no rollup of their own (user_article_stats counts their impressions)
+    assert not [s for s in statements if "pulls_p202502" in s and "INSERT INTO daily" in s]
+    assert "mab_rank_snapshots" in statements[-1]
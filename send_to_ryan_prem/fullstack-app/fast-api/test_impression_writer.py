@@ -0,0 +1,158 @@
+import sys
+import threading
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from impression_writer import ImpressionWriter
+
+
+class RecordingSink:
+    def __init__(self, fail_times=0):
+        self.batches = []
+        self.fail_times = fail_times
+
+    def __call__(self, items):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("write failed")
+        self.batches.append(list(items))
+
+
+def test_submit_is_rejected_when_not_running():
+    writer = ImpressionWriter(RecordingSink())
+    assert writer.submit({"url_ids": [1]}) is False
+    assert writer.flush() is False
+
+
+def test_flush_writes_everything_submitted_in_batches():
+    sink = RecordingSink()
+    writer = ImpressionWriter(sink, batch_size=4)
+    writer.start()
+    try:
+        for i in range(10):
+            assert writer.submit(i, rows=2)
+        assert writer.flush()
+    finally:
+        writer.stop()
+    assert [item for batch in sink.batches for item in batch] == list(range(10))
+    assert all(len(batch) <= 4 for batch in sink.batches)
+    stats = writer.stats()
+    assert stats["items_written"] == 10
+    assert stats["impressions_written"] == 20
+    assert stats["ingest_rate_per_sec"] > 0
+
+
+def test_stop_drains_the_queue():
+    release = threading.Event()
+    written = []
+
+    def slow_sink(items):
+        release.wait(5)
+        written.extend(items)
+
+    writer = ImpressionWriter(slow_sink, batch_size=1)
+    writer.start()
+    for i in range(5):
+        writer.submit(i)
+    release.set()
+    writer.stop()
+    assert written == list(range(5))
+    assert not writer.running
+
+
+def test_full_queue_applies_backpressure():
+    release = threading.Event()
+    writer = ImpressionWriter(lambda items: release.wait(5), max_queue=2, batch_size=1, put_timeout=0.01)
+    writer.start()
+    try:
+        results = [writer.submit(i) for i in range(6)]
+        assert results[0] and not all(results)
+        assert writer.stats()["rejected"] == results.count(False)
+    finally:
+        release.set()
+        writer.stop()
+
+
+def test_failed_batch_is_retried_once():
+    sink = RecordingSink(fail_times=1)
+    writer = ImpressionWriter(sink)
+    writer.start()
+    try:
+        writer.submit("page")
+        writer.flush()
+    finally:
+        writer.stop()
+    assert sink.batches == [["page"]]
+    assert writer.stats()["failed_items"] == 0
+
+
+def test_failing_batch_is_retried_item_by_item():
+    release = threading.Event()
+    written = []
+
+    def sink(items):
+        release.wait(5)
+        if "bad" in items:
+            raise RuntimeError("foreign key violation")
+        written.extend(items)
+
+    writer = ImpressionWriter(sink, batch_size=10)
+    writer.start()
+    try:
+        # The first page holds the worker so the next three are batched together
+        for page in ["first", "a", "bad", "c"]:
+            writer.submit(page, rows=2, key="user-1")
+        release.set()
+        assert writer.wait_for("user-1")
+    finally:
+        writer.stop()
+    assert written == ["first", "a", "c"]
+    stats = writer.stats()
+    assert stats["failed_items"] == 1
+    assert stats["impressions_written"] == 6
+
+
+def test_wait_for_only_waits_on_its_own_key():
+    release = threading.Event()
+    writer = ImpressionWriter(lambda items: release.wait(5), batch_size=1)
+    writer.start()
+    try:
+        assert writer.submit("page", key="busy-user")
+        # Nothing queued for this user: no wait behind the other user's page
+        assert writer.wait_for("other-user", timeout=0)
+        assert writer.wait_for("busy-user", timeout=0.05) is False
+        release.set()
+        assert writer.wait_for("busy-user")
+    finally:
+        release.set()
+        writer.stop()
+
+
+def test_rejected_item_is_not_left_pending():
+    release = threading.Event()
+    writer = ImpressionWriter(lambda items: release.wait(5), max_queue=1, batch_size=1, put_timeout=0.01)
+    writer.start()
+    try:
+        results = [writer.submit(i, key="user-1") for i in range(4)]
+        assert not all(results)
+        release.set()
+        assert writer.wait_for("user-1")
+    finally:
+        release.set()
+        writer.stop()
+
+
+def test_stop_timeout_keeps_worker_and_rejects_new_items():
+    release = threading.Event()
+    writer = ImpressionWriter(lambda items: release.wait(5), batch_size=1)
+    writer.start()
+    try:
+        writer.submit("page")
+        assert writer.stop(timeout=0.05) is False
+        assert writer.running
+        assert writer.submit("late") is False
+    finally:
+        release.set()
+        assert writer.stop()
+    assert not writer.running
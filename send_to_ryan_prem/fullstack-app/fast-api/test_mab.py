@@ -0,0 +1,205 @@
+import math
+import random
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from mab import (
+    HellingerUCBCache,
+    find_hellinger_ucb,
+    find_hellinger_ucb_batch,
+    find_hellinger_ucb_closed_form,
+    find_hellinger_ucb_closed_form_batch,
+    get_hellinger_ucb,
+    get_hellinger_ucb_batch,
+    hellinger_squared,
+    rank_articles_hellinger_ucb,
+    rank_articles_hellinger_ucb_batch,
+    top_k_hellinger_ucb_batch,
+    top_k_indices,
+)
+
+C_PARAM = .26
+
+
+def make_stats(n_arms, seed=0):
+    rng = random.Random(seed)
+    stats = {}
+    for article_id in range(n_arms):
+        N = rng.choice([0, rng.randint(1, 60)])
+        stats[article_id] = (N, rng.randint(0, N) if N else 0)
+    return stats
+
+
+# --- Batch ranking ---
+
+def test_find_hellinger_ucb_batch_matches_scalar():
+    """Vectorized bisection agrees with the scalar search within tol."""
+    p_hat = np.linspace(0.0, 1.0, 41)
+    alpha = np.linspace(0.001, 0.9, 41)
+    batch = find_hellinger_ucb_batch(p_hat, alpha)
+    for p, a, q in zip(p_hat, alpha, batch):
+        assert abs(find_hellinger_ucb(p, a) - q) <= 1e-6
+
+
+@pytest.mark.parametrize("method", ["closed_form", "bisection"])
+def test_rank_batch_matches_scalar_ranking(method):
+    """Batch ranking returns the same order and UCBs as the scalar path."""
+    stats = make_stats(500)
+    article_ids = list(stats.keys())
+    t = max(sum(N for N, _ in stats.values()), 1)
+
+    scalar = rank_articles_hellinger_ucb(article_ids, stats, t, C_PARAM, method=method)
+    ids, ucbs = rank_articles_hellinger_ucb_batch(
+        article_ids,
+        [stats[a][0] for a in article_ids],
+        [stats[a][1] for a in article_ids],
+        t,
+        C_PARAM,
+        method=method,
+    )
+    assert ids.tolist() == [a for a, _ in scalar]
+    assert np.allclose(ucbs, [u for _, u in scalar], atol=1e-6)
+
+
+def test_rank_batch_new_arms_get_max_ucb():
+    ids, ucbs = rank_articles_hellinger_ucb_batch([7, 8], [10, 0], [1, 0], 10, C_PARAM)
+    assert ids.tolist() == [8, 7]
+    assert ucbs[0] == 1.0
+
+
+def test_rank_batch_invalid_c():
+    with pytest.raises(ValueError):
+        rank_articles_hellinger_ucb_batch([1], [1], [0], 1, 0.25)
+
+
+# --- Closed-form solver vs. bisection ---
+
+TOL = 1e-6
+P_GRID = np.linspace(0.0, 1.0, 101)
+ALPHA_GRID = np.concatenate([np.geomspace(1e-6, 1e-2, 20), np.linspace(0.01, 1.0, 100)])
+
+
+def test_closed_form_matches_bisection_on_grid():
+    """
+    Wherever the bisection lands on a feasible q, it is a lower bound within
+    tol of the exact root. Where it does not (H^2 is not monotone in q, so for
+    small alpha the first midpoint can fall outside the feasible interval and
+    the search collapses towards 0), the closed form must be strictly better.
+    """
+    for p in P_GRID:
+        for alpha in ALPHA_GRID:
+            exact = find_hellinger_ucb_closed_form(p, alpha)
+            bisect = find_hellinger_ucb(p, alpha, tol=TOL)
+            if hellinger_squared(p, bisect) <= alpha:
+                assert -1e-9 <= exact - bisect <= TOL + 1e-9, (p, alpha)
+            else:
+                assert exact > bisect, (p, alpha)
+
+
+def test_closed_form_is_feasible_and_tight_on_grid():
+    """The closed-form q satisfies H^2 <= alpha, and nothing above it does."""
+    for p in P_GRID:
+        for alpha in ALPHA_GRID:
+            q = find_hellinger_ucb_closed_form(p, alpha)
+            assert 0.0 <= q <= 1.0
+            assert q >= p - 1e-12
+            assert hellinger_squared(p, q) <= alpha + 1e-9
+            if q < 1.0 - 1e-6:
+                assert hellinger_squared(p, q + 1e-6) > alpha
+
+
+def test_closed_form_batch_matches_scalar_on_grid():
+    p, alpha = np.meshgrid(P_GRID, ALPHA_GRID)
+    batch = find_hellinger_ucb_closed_form_batch(p, alpha)
+    scalar = np.vectorize(find_hellinger_ucb_closed_form)(p, alpha)
+    assert np.allclose(batch, scalar, rtol=0, atol=1e-12)
+
+
+def test_get_hellinger_ucb_methods_agree():
+    for N in range(1, 40):
+        for S in range(0, N + 1):
+            alpha = 1.0 - math.exp(-C_PARAM * (math.log(100 + 1) / N))
+            exact = get_hellinger_ucb(N, S, 100, C_PARAM, method="closed_form")
+            bisect = get_hellinger_ucb(N, S, 100, C_PARAM, method="bisection")
+            if hellinger_squared(S / N, bisect) <= alpha:
+                assert abs(exact - bisect) <= TOL
+
+
+def test_closed_form_ucb_never_below_p_hat():
+    """High-CTR arms keep a UCB >= p_hat (bisection could return ~0 here)."""
+    assert get_hellinger_ucb(20, 19, 100, C_PARAM) >= 19 / 20
+
+
+def test_get_hellinger_ucb_unknown_method():
+    with pytest.raises(ValueError):
+        get_hellinger_ucb(1, 0, 1, C_PARAM, method="newton")
+
+
+# --- UCB lookup cache ---
+
+def test_cache_matches_direct_computation_at_bucket_t():
+    cache = HellingerUCBCache(max_n=32)
+    stats = make_stats(300)
+    N = [n for n, _ in stats.values()]
+    S = [s for _, s in stats.values()]
+    t = 1234
+    bucket_t = cache.bucket_t(cache.t_bucket(t))
+    assert bucket_t <= t
+    assert np.allclose(cache.lookup(N, S, t, C_PARAM), get_hellinger_ucb_batch(N, S, bucket_t, C_PARAM))
+
+
+def test_cache_reports_hits_and_misses():
+    cache = HellingerUCBCache(max_n=10)
+    cache.lookup([1, 2, 50], [0, 1, 3], 100, C_PARAM)
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["hit_ratio"] == round(2 / 3, 4)
+    assert stats["table_builds"] == 1
+
+
+def test_cache_reuses_table_within_bucket_and_invalidates_on_new_c():
+    cache = HellingerUCBCache(max_n=10, t_resolution=4)
+    cache.get(3, 1, 100, C_PARAM)
+    cache.get(3, 1, 101, C_PARAM)  # same t-bucket
+    assert cache.stats()["table_builds"] == 1
+    cache.get(3, 1, 10_000, C_PARAM)  # new t-bucket
+    assert cache.stats()["table_builds"] == 2
+    assert cache.stats()["tables_cached"] == 2
+    cache.get(3, 1, 100, 0.5)  # new c clears every table
+    assert cache.stats()["tables_cached"] == 1
+    assert cache.stats()["c"] == 0.5
+
+
+def test_rank_batch_with_cache_orders_by_cached_ucb():
+    cache = HellingerUCBCache(max_n=16)
+    ids, ucbs = rank_articles_hellinger_ucb_batch([1, 2, 3], [5, 0, 5], [0, 0, 5], 20, C_PARAM, cache=cache)
+    assert ids.tolist() == [2, 3, 1]
+    assert np.all(np.diff(ucbs) <= 0)
+
+
+# --- Top-K partial ranking ---
+
+@pytest.mark.parametrize("k", [0, 1, 5, 20, 499, 500, 800])
+def test_top_k_matches_full_ranking_prefix(k):
+    stats = make_stats(500)
+    article_ids = list(stats.keys())
+    N = [stats[a][0] for a in article_ids]
+    S = [stats[a][1] for a in article_ids]
+    t = max(sum(N), 1)
+
+    full_ids, full_ucbs = rank_articles_hellinger_ucb_batch(article_ids, N, S, t, C_PARAM)
+    top_ids, top_ucbs = top_k_hellinger_ucb_batch(article_ids, N, S, t, C_PARAM, k=k)
+    assert top_ids.tolist() == full_ids[:k].tolist()
+    assert np.array_equal(top_ucbs, full_ucbs[:k])
+
+
+def test_top_k_indices_breaks_ties_by_input_order():
+    ucbs = [0.5, 1.0, 0.7, 1.0, 1.0, 0.7]
+    assert top_k_indices(ucbs, 2).tolist() == [1, 3]
+    assert top_k_indices(ucbs, 4).tolist() == [1, 3, 4, 2]
@@ -0,0 +1,38 @@
+import sys
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from reference_cache import ReferenceCache
+
+
+def test_lists_are_served_from_memory_until_the_version_changes():
+    cache = ReferenceCache(check_interval=30)
+    fetch_version = MagicMock(return_value=1)
+    load = MagicMock(return_value=["a"])
+
+    for _ in range(3):
+        version = cache.version(fetch_version)
+        assert cache.get("topics", version, load) == ["a"]
+    assert fetch_version.call_count == 1
+    assert load.call_count == 1
+
+    fetch_version.return_value = 2
+    with patch("reference_cache.time.monotonic", return_value=10**9):
+        version = cache.version(fetch_version)
+    assert version == 2
+    cache.get("topics", version, load)
+    assert load.call_count == 2
+    assert cache.stats()["hits"] == 2
+
+
+def test_list_loaded_under_an_outdated_version_is_not_cached():
+    cache = ReferenceCache(check_interval=0)
+    cache.version(lambda: 1)
+    cache.version(lambda: 2)
+    load = MagicMock(return_value=["old"])
+    cache.get("topics", 1, load)
+    cache.get("topics", 1, load)
+    assert load.call_count == 2
+    assert cache.stats()["lists"] == []
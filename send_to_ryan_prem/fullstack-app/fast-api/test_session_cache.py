@@ -0,0 +1,39 @@
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from session_cache import SessionCache
+
+
+def test_get_returns_cached_value_until_ttl():
+    cache = SessionCache(ttl=60)
+    cache.put("tok", (1, "s", 2))
+    assert cache.get("tok") == (1, "s", 2)
+    with patch("session_cache.time.monotonic", return_value=10**9):
+        assert cache.get("tok") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_entry_never_outlives_session_expiry():
+    cache = SessionCache(ttl=3600)
+    cache.put("expired", (1, "s", 2), datetime.now() - timedelta(seconds=1))
+    assert cache.get("expired") is None
+    cache.put("aware", (1, "s", 2), datetime.now(timezone.utc) + timedelta(minutes=5))
+    assert cache.get("aware") == (1, "s", 2)
+
+
+def test_invalidate_and_lru_eviction():
+    cache = SessionCache(ttl=60, max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)  # evicts b, the least recently used
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    cache.invalidate("a")
+    assert cache.get("a") is None
+    assert cache.get("c") == 3
@@ -0,0 +1,41 @@
+import sys
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import MagicMock
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from title_index import TitleIndex
+
+ROWS = [
+    (1, "Navy awards F-35 engine contract", datetime(2024, 1, 1)),
+    (2, "F-35 engine upgrade clears review", datetime(2024, 1, 2)),
+    (3, "Army tests new engineering vehicle", datetime(2024, 1, 3)),
+]
+
+
+def test_every_query_word_must_prefix_a_title_word():
+    index = TitleIndex()
+    index.update(ROWS)
+    assert index.search("f-35 eng") == ["F-35 engine upgrade clears review", "Navy awards F-35 engine contract"]
+    assert index.search("engine") == [
+        "Army tests new engineering vehicle", "F-35 engine upgrade clears review", "Navy awards F-35 engine contract",
+    ]
+    assert index.search("navy") == ["Navy awards F-35 engine contract"]
+    assert index.search("eng", limit=1) == ["Army tests new engineering vehicle"]
+    assert index.search("gine") == []
+
+
+def test_refresh_only_loads_rows_scraped_since_the_watermark():
+    index = TitleIndex()
+    fetch_rows = MagicMock(return_value=ROWS)
+    index.refresh(1, fetch_rows)
+    index.refresh(1, fetch_rows)
+    fetch_rows.assert_called_once_with(None)
+
+    fetch_rows.return_value = [(3, "Army fields new drone", datetime(2024, 2, 1))]
+    index.refresh(2, fetch_rows)
+    fetch_rows.assert_called_with(datetime(2024, 1, 3))
+    assert index.search("army") == ["Army fields new drone"]
+    assert index.search("engineering") == []
+    assert index.stats()["titles"] == 3
@@ -0,0 +1,121 @@
+"""
+In-memory word-prefix index over urls_content.title for
+/api/article_titles/search.
+
+Every title is split into lowercase words, and each (word, -url_id) pair is
+kept in one sorted list. A query word then maps to a contiguous slice found
+with bisect, newest articles first within each word, so a lookup costs
+O(log n + scanned) whatever the corpus size. A title matches when every
+query word is a prefix of one of its words ("f-35 eng" finds
+"F-35 engine upgrade ...").
+
+The index is refreshed incrementally: `refresh` is given the catalog version
+(bumped by the scraper, see reference_cache.py) and only asks for rows
+scraped after the newest one it already holds.
+"""
+
+import bisect
+import re
+import threading
+
+_WORD = re.compile(r"\w+")
+
+
+def words(text):
+    return _WORD.findall(text.lower())
+
+
+class TitleIndex:
+    def __init__(self, max_scan=5000):
+        self.max_scan = max_scan  # entries examined per query word before giving up on completeness
+        self.version = None
+        self.watermark = None  # newest datetime_content_scrape loaded so far
+        self._titles = {}  # url_id -> title
+        self._entries = []  # sorted (word, -url_id)
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def refresh(self, version, fetch_rows):
+        """
+        Bring the index up to `version`. fetch_rows(since) returns
+        (url_id, title, scraped_at) rows scraped after `since` (all rows when None).
+        """
+        if version == self.version:
+            return
+        with self._refresh_lock:
+            if version == self.version:
+                return
+            self.update(fetch_rows(self.watermark))
+            self.version = version
+
+    def update(self, rows):
+        """Add or replace titles from (url_id, title, scraped_at) rows."""
+        with self._lock:
+            added = []
+            for url_id, title, scraped_at in rows:
+                if scraped_at is not None and (self.watermark is None or scraped_at > self.watermark):
+                    self.watermark = scraped_at
+                if url_id in self._titles:
+                    self._remove(url_id)
+                if title:
+                    self._titles[url_id] = title
+                    added.extend((word, -url_id) for word in set(words(title)))
+            if len(added) > len(self._entries) // 8:
+                self._entries.extend(added)
+                self._entries.sort()
+            else:
+                for entry in added:
+                    bisect.insort(self._entries, entry)
+
+    def _remove(self, url_id):
+        for word in set(words(self._titles.pop(url_id))):
+            i = bisect.bisect_left(self._entries, (word, -url_id))
+            if i < len(self._entries) and self._entries[i] == (word, -url_id):
+                del self._entries[i]
+
+    def search(self, query, limit=10):
+        """Up to `limit` distinct titles matching every word of query; titles starting with it first, then newest."""
+        query_words = words(query)
+        if not query_words or limit <= 0:
+            return []
+        # Drive the scan with the longest (usually most selective) word
+        lead = max(query_words, key=len)
+        others = [w for w in query_words if w != lead]
+        phrase = " ".join(query_words)
+        with self._lock:
+            candidates = []
+            i = bisect.bisect_left(self._entries, (lead,))
+            for word, neg_id in self._entries[i : i + self.max_scan]:
+                if not word.startswith(lead):
+                    break
+                title = self._titles[-neg_id]
+                if others:
+                    title_words = words(title)
+                    if not all(any(tw.startswith(w) for tw in title_words) for w in others):
+                        continue
+                starts = " ".join(words(title)).startswith(phrase)
+                candidates.append((0 if starts else 1, neg_id, title))
+        titles, seen = [], set()
+        for _, _, title in sorted(candidates):
+            if title not in seen:
+                seen.add(title)
+                titles.append(title)
+                if len(titles) == limit:
+                    break
+        return titles
+
+    def clear(self):
+        with self._lock:
+            self._titles.clear()
+            self._entries.clear()
+            self.version = None
+            self.watermark = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "titles": len(self._titles),
+                "entries": len(self._entries),
+                "version": self.version,
+                "watermark": self.watermark.isoformat() if self.watermark else None,
+            }
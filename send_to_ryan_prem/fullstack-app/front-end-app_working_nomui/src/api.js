@@ -76,6 +76,22 @@ export function fetchArticleTitles() {
 }
 
 
+/**
+ * searchArticleTitles
+ * GET /api/article_titles/search
+ *
+ * Server-side title autocomplete: titles in which every word of the query
+ * prefixes a title word, titles starting with the query first.
+ *
+ * @param {string} q - The text typed so far.
+ * @param {number} limit - Maximum number of titles to return.
+ * @returns {Promise} - Axios promise resolving to { titles }.
+ */
+export function searchArticleTitles(q, limit = 10) {
+  return axios.get('/api/article_titles/search', { params: { q, limit } });
+}
+
+
 /**
  * fetchUserNames
  * GET /api/user_names
@@ -189,14 +205,16 @@ export async function logImpressions(sessionToken, articleIds) {
  * fetchArticles
  * GET /articles
  *
- * @param {object} query - { offset, limit, topics (array), date_min }
+ * @param {object} query - { offset, limit, topics (array), date_min, cursor }
  *   e.g. { offset: 0, limit: 20, topics: ["Science", "Politics"], date_min: "2023-01-01" }
+ *   For deep scrolling pass the previous response's next_cursor as `cursor` instead of an offset.
  */
 export async function fetchArticles(query = {}) {
   console.log("[DEBUG] Fetching articles with query:", query);
 
   const params = new URLSearchParams();
 
+  if (query.cursor) params.append("cursor", query.cursor);
   if (query.offset) params.append("offset", query.offset);
   if (query.limit) params.append("limit", query.limit);
   if (query.date_min) params.append("date_min", query.date_min);
@@ -712,3 +730,19 @@ export function fetchOfficeUserInteractions(sessionToken) {
     headers: { Authorization: sessionToken }
   });
 }
+
+/**
+ * fetchDashboardStreamTicket
+ * POST /api/dashboard/stream_ticket
+ *
+ * Issues a short-lived, single-use ticket for opening /api/dashboard/stream,
+ * so the session token never appears in the EventSource URL.
+ *
+ * @param {string} sessionToken - The current session token.
+ * @returns {Promise} - Axios promise resolving to { ticket, expires_in }.
+ */
+export function fetchDashboardStreamTicket(sessionToken) {
+  return axios.post('/api/dashboard/stream_ticket', null, {
+    headers: { Authorization: sessionToken }
+  });
+}
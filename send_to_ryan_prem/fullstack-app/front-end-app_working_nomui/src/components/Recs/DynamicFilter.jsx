@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { fetchTopics, fetchPublicationDates, fetchArticleTitles } from '../../api.js';
+import { fetchTopics, fetchPublicationDates, searchArticleTitles } from '../../api.js';
 
 // Removed Material UI components and replaced them with self-contained equivalents
 
@@ -73,12 +73,13 @@ function AnimatedChip({ label, onDelete }) {
 
 // AutocompleteInput is a custom component to replace MUI's Autocomplete.
 // It renders an input field and shows suggestion options filtered from provided options.
-function AutocompleteInput({ options, inputValue, onInputChange, onSelect, placeholder, selectedValues }) {
+// Pass filterLocally={false} when the options already come matched from the server.
+function AutocompleteInput({ options, inputValue, onInputChange, onSelect, placeholder, selectedValues, filterLocally = true }) {
   // Filter out already selected options and those that do not match the current input (case-insensitive)
   const filteredOptions = options.filter(
     (option) =>
       !selectedValues.includes(option) &&
-      option.toLowerCase().includes(inputValue.toLowerCase())
+      (!filterLocally || option.toLowerCase().includes(inputValue.toLowerCase()))
   );
 
   const containerStyle = { position: 'relative' };
@@ -199,17 +200,14 @@ function DynamicFilter({ finalTopics = [], finalDates = [], finalArticles = [],
   useEffect(() => {
     async function fetchFilters() {
       try {
-        const [topicsRes, datesRes, articlesRes] = await Promise.all([
+        const [topicsRes, datesRes] = await Promise.all([
           fetchTopics(),
           fetchPublicationDates(),
-          fetchArticleTitles(),
         ]);
         console.log('[DEBUG] DynamicFilter: Fetched topics:', topicsRes.topics);
         console.log('[DEBUG] DynamicFilter: Fetched dates:', datesRes.dates);
-        console.log('[DEBUG] DynamicFilter: Fetched articles:', articlesRes.data.titles);
         setAllTopics(topicsRes.topics || []);
         setAllDates(datesRes.dates || []);
-        setAllArticleTitles(articlesRes.data.titles || []);
       } catch (err) {
         console.error('[ERROR] DynamicFilter: Failed to load filters:', err);
         setError('Failed to load filters.');
@@ -220,6 +218,28 @@ function DynamicFilter({ finalTopics = [], finalDates = [], finalArticles = [],
     fetchFilters();
   }, []);
 
+  // Article titles are matched server-side as the user types (debounced)
+  useEffect(() => {
+    const q = articlesInputValue.trim();
+    if (!q) {
+      setAllArticleTitles([]);
+      return;
+    }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const res = await searchArticleTitles(q, 20);
+        if (!cancelled) setAllArticleTitles(res.data.titles || []);
+      } catch (err) {
+        console.error('[ERROR] DynamicFilter: Title search failed:', err);
+      }
+    }, 150);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [articlesInputValue]);
+
   // Clear selected filters
   const handleClearSession = () => {
     console.log('[DEBUG] DynamicFilter: Clear Filter button clicked. Resetting local filter state.');
@@ -404,6 +424,7 @@ function DynamicFilter({ finalTopics = [], finalDates = [], finalArticles = [],
           onSelect={handleArticlesSelect}
           placeholder="Search Articles..."
           selectedValues={sessionArticles}
+          filterLocally={false}
         />
         <div style={chipContainerStyle}>
           {sessionArticles.map((article) => (
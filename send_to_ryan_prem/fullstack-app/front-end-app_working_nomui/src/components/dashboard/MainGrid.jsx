@@ -1,5 +1,6 @@
 import React, { useEffect, useState } from "react";
-import axios from "axios";
+
+import { fetchDashboardStreamTicket } from "../../api";
 
 import CustomizedDataGridModel from "./CustomizedDataGridModel";
 import CustomizedDataGrid_OfficeMabStats from "./CustomizedDataGrid_OfficeMabStats";
@@ -9,42 +10,68 @@ export default function MainGrid() {
   const [mabRankLogs, setMabRankLogs] = useState([]);
   const [officeMabStats, setOfficeMabStats] = useState([]);
 
-  // Poll MAB Rank Logs every 10 seconds.
+  // Live office stats and rank logs pushed by /api/dashboard/stream (one shared
+  // server-side producer per office, so open tabs add no database load).
   useEffect(() => {
-    const token = localStorage.getItem("session_token") || "";
-    const headers = { Authorization: token };
-
-    const fetchMabRankLogs = () => {
-      axios
-        .get(`/api/mab_rank_logs?cb=${new Date().getTime()}`, { headers })
-        .then((response) => {
-          setMabRankLogs(response.data.mab_rank_logs || []);
+    let source = null;
+    let retryTimer = null;
+    let closed = false;
+
+    const retry = () => {
+      if (!closed) retryTimer = setTimeout(connect, 3000);
+    };
+
+    // Tickets are single-use, so every (re)connect asks for a fresh one
+    // instead of relying on EventSource's built-in reconnect.
+    const connect = () => {
+      const token = localStorage.getItem("session_token") || "";
+      fetchDashboardStreamTicket(token)
+        .then(({ data }) => {
+          if (closed) return;
+          source = new EventSource(`/api/dashboard/stream?ticket=${encodeURIComponent(data.ticket)}`);
+          listen(source);
         })
-        .catch((error) => console.error("Error fetching MAB Rank Logs:", error));
+        .catch((error) => {
+          console.error("Dashboard stream ticket error:", error);
+          retry();
+        });
     };
 
-    fetchMabRankLogs(); // Initial fetch
-    const rankLogsInterval = setInterval(fetchMabRankLogs, 10000); // 10-second polling
-    return () => clearInterval(rankLogsInterval);
-  }, []);
+    const listen = (source) => {
+      source.addEventListener("snapshot", (event) => {
+        const data = JSON.parse(event.data);
+        setOfficeMabStats(data.office_mab_stats || []);
+        setMabRankLogs(data.mab_rank_logs || []);
+      });
 
-  // Poll Office MAB Stats every 10 seconds.
-  useEffect(() => {
-    const token = localStorage.getItem("session_token") || "";
-    const headers = { Authorization: token };
-
-    const fetchOfficeStats = () => {
-      axios
-        .get(`/api/office_mab_stats?cb=${new Date().getTime()}`, { headers })
-        .then((response) => {
-          setOfficeMabStats(response.data.office_mab_stats || []);
-        })
-        .catch((error) => console.error("Error fetching Office MAB Stats:", error));
+      source.addEventListener("delta", (event) => {
+        const data = JSON.parse(event.data);
+        if (data.office_mab_stats) {
+          setOfficeMabStats((rows) => {
+            const byUrl = new Map(rows.map((row) => [row.url_id, row]));
+            data.office_mab_stats.forEach((row) => byUrl.set(row.url_id, row));
+            return [...byUrl.values()].sort((a, b) => b.office_ctr - a.office_ctr);
+          });
+        }
+        if (data.mab_rank_logs) {
+          setMabRankLogs(data.mab_rank_logs);
+        }
+      });
+
+      // Reconnects with a new ticket and receives a fresh snapshot
+      source.onerror = (error) => {
+        console.error("Dashboard stream error:", error);
+        source.close();
+        retry();
+      };
     };
 
-    fetchOfficeStats(); // Initial fetch
-    const officeStatsInterval = setInterval(fetchOfficeStats, 10000); // 10-second polling
-    return () => clearInterval(officeStatsInterval);
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      if (source) source.close();
+    };
   }, []);
 
   // Define a fixed width for the tables and chart container.
@@ -95,7 +122,7 @@ export default function MainGrid() {
       <div style={sectionStyle}>
         <div style={headerStyle}>CTR by URL (Ordered by Rank Position)</div>
         <div style={boxWithPaddingStyle}>
-          <PageViewsBarChart />
+          <PageViewsBarChart mabRankLogs={mabRankLogs} officeMabStats={officeMabStats} />
         </div>
       </div>
 
@@ -1,5 +1,4 @@
 import * as React from 'react';
-import axios from 'axios';
 
 // A custom bar chart component built with SVG to mimic the Material UI x-charts bar chart.
 function CustomBarChart({ width, height, margin, xAxisData, redData, greenData, yDomain }) {
@@ -111,91 +110,47 @@ function CustomBarChart({ width, height, margin, xAxisData, redData, greenData,
   );
 }
 
-export default function PageViewsBarChart() {
-  const [xAxisUrls, setXAxisUrls] = React.useState([]);  // Array of url_id, sorted by rank
-  const [redData, setRedData] = React.useState([]);       // For CTR=0 (red bars)
-  const [greenData, setGreenData] = React.useState([]);     // For CTR>0 (green bars)
-  const [totalViews, setTotalViews] = React.useState(0);    // Total CTR value (for display)
-
-  // Memoized fetchData; stable between renders.
-  const fetchData = React.useCallback(() => {
-    const token = localStorage.getItem("session_token") || "";
-    const headers = { Authorization: token };
-
-    Promise.all([
-      axios.get("/api/mab_rank_logs", { headers }),
-      axios.get("/api/user_mab_stats", { headers }), //switch to office_mab_stats for office-wide visualization
-    ]) // replace all user stats related variables wtih office for office-wide visualization
-      .then(([logsResp, statsResp]) => {
-        const mabLogs = logsResp.data.mab_rank_logs || [];
-        const userStats = statsResp.data.user_mab_stats || [];
-
-        // Map from url_id to its lowest rank_position.
-        const rankMap = {};
-        mabLogs.forEach((row) => {
-          const { url_id, rank_position } = row;
-          if (!(url_id in rankMap) || rank_position < rankMap[url_id]) {
-            rankMap[url_id] = rank_position;
-          }
-        });
-
-        // Map from url_id to its maximum CTR (converted to number).
-        const ctrMap = {};
-        userStats.forEach((row) => {
-          const { url_id, user_ctr } = row;
-          const ctrValue = Number(user_ctr);
-          if (!(url_id in ctrMap)) {
-            ctrMap[url_id] = ctrValue;
-          } else {
-            ctrMap[url_id] = Math.max(ctrMap[url_id], ctrValue);
-          }
-        });
-
-        // Sort url_ids based on rank.
-        const sortedUrls = Object.keys(rankMap).sort(
-          (a, b) => rankMap[a] - rankMap[b]
-        );
-
-        // Prepare data arrays for the custom bar chart.
-        // For articles with 0 CTR, use a minimal value for redData.
-        const redSeries = [];
-        const greenSeries = [];
-        let total = 0;
-        sortedUrls.forEach((u) => {
-          const val = Number(ctrMap[u]) || 0;
-          if (val === 0) {
-            redSeries.push(0.01);
-            greenSeries.push(null);
-          } else {
-            redSeries.push(null);
-            greenSeries.push(val);
-          }
-          total += val;
-        });
-
-        setXAxisUrls(sortedUrls);
-        setRedData(redSeries);
-        setGreenData(greenSeries);
-        setTotalViews(total.toFixed(1));
-      })
-      .catch((err) => {
-        console.error("Error fetching data for bar chart:", err);
-      });
-  }, []); // No dependencies
-
-  // Polling every 1 second.
-  React.useEffect(() => {
-    console.log("Setting interval for fetchData");
-    fetchData(); // Initial fetch
-    const interval = setInterval(() => {
-      console.log("Polling fetchData");
-      fetchData();
-    }, 1000);
-    return () => {
-      console.log("Clearing interval for fetchData");
-      clearInterval(interval);
-    };
-  }, [fetchData]);
+// Rank logs and office stats come from MainGrid's dashboard stream, so the
+// chart no longer polls the API itself.
+export default function PageViewsBarChart({ mabRankLogs = [], officeMabStats = [] }) {
+  const { xAxisUrls, redData, greenData } = React.useMemo(() => {
+    // Map from url_id to its lowest rank_position.
+    const rankMap = {};
+    mabRankLogs.forEach((row) => {
+      const { url_id, rank_position } = row;
+      if (!(url_id in rankMap) || rank_position < rankMap[url_id]) {
+        rankMap[url_id] = rank_position;
+      }
+    });
+
+    // Map from url_id to its office-wide CTR (converted to number).
+    const ctrMap = {};
+    officeMabStats.forEach((row) => {
+      ctrMap[row.url_id] = Number(row.office_ctr);
+    });
+
+    // Sort url_ids based on rank.
+    const sortedUrls = Object.keys(rankMap).sort(
+      (a, b) => rankMap[a] - rankMap[b]
+    );
+
+    // Prepare data arrays for the custom bar chart.
+    // For articles with 0 CTR, use a minimal value for redData.
+    const redSeries = [];
+    const greenSeries = [];
+    sortedUrls.forEach((u) => {
+      const val = Number(ctrMap[u]) || 0;
+      if (val === 0) {
+        redSeries.push(0.01);
+        greenSeries.push(null);
+      } else {
+        redSeries.push(null);
+        greenSeries.push(val);
+      }
+    });
+
+    return { xAxisUrls: sortedUrls, redData: redSeries, greenData: greenSeries };
+  }, [mabRankLogs, officeMabStats]);
 
   // Determine dynamic width based on the number of x-axis items.
   const barWidth = 20;
@@ -5,14 +5,22 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 import psycopg2
+import psycopg2.extras
 from psycopg2 import sql, errors
+from fuzzywuzzy import fuzz
 from bs4 import BeautifulSoup
 import re
+import sys
 from tqdm import tqdm
 from dateutil.parser import parse as parse_date
 import os
 from db_utils import connect_db
 
+# Bookmark candidates: pg_trgm similarity a title pair needs to be scored at all,
+# then the fuzz.ratio it needs to be stored (same rule as the API)
+BOOKMARK_CANDIDATE_TRGM_THRESHOLD = float(os.environ.get("BOOKMARK_CANDIDATE_TRGM_THRESHOLD", 0.5))
+BOOKMARK_CANDIDATE_SIMILARITY = 85
+
 
 conn = connect_db()
 
@@ -78,6 +86,29 @@ def create_unique_topics_table_if_not_exists(conn):
         print(f"[ERROR] Failed to create table: {e}")
         conn.rollback()
 
+def create_catalog_version_table_if_not_exists(conn):
+    """
+    Creates the single-row catalog_version table. The API caches its topic,
+    title and date lists per version, so bump_catalog_version() after a run
+    makes it reload them.
+    """
+    create_table_query = """
+    CREATE TABLE IF NOT EXISTS catalog_version (
+        id INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+        version BIGINT NOT NULL DEFAULT 1,
+        updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+    );
+    """
+    try:
+        with conn.cursor() as cur:
+            cur.execute(create_table_query)
+            conn.commit()
+            print("[INFO] Table 'catalog_version' is ready.")
+    except psycopg2.DatabaseError as e:
+        print(f"[ERROR] Failed to create table: {e}")
+        conn.rollback()
+
+
 def create_urls_table_if_not_exists(conn):
     """
     Creates the defensenews_urls table if it doesn't exist.
@@ -612,6 +643,89 @@ def fix_url_part_1(conn):
         conn.rollback()
 
 
+def bump_catalog_version(conn):
+    """
+    Increment catalog_version so the API's reference-list caches (and the
+    ETags clients hold) are invalidated.
+    """
+    query = """
+    INSERT INTO catalog_version (id, version, updated_at)
+    VALUES (1, 1, NOW())
+    ON CONFLICT (id) DO UPDATE
+    SET version = catalog_version.version + 1, updated_at = NOW()
+    RETURNING version;
+    """
+    try:
+        with conn.cursor() as cur:
+            cur.execute(query)
+            version = cur.fetchone()[0]
+            conn.commit()
+            print(f"[INFO] Catalog version bumped to {version}.")
+    except psycopg2.DatabaseError as e:
+        print(f"[ERROR] Could not bump catalog version: {e}")
+        conn.rollback()
+
+
+###############################################################################
+#                      Bookmark candidates (near-duplicates)
+###############################################################################
+# Titles scraped in this run, paired with active bookmarks whose title is similar
+NEW_TITLE_BOOKMARK_PAIRS_QUERY = """
+SELECT b.user_id, b.url_id, o.title, n.url_id, n.title
+FROM urls_content n
+JOIN urls_content o ON o.title %% n.title AND o.url_id <> n.url_id
+JOIN bookmarks b ON b.url_id = o.url_id AND b.removed_at IS NULL
+WHERE n.datetime_content_scrape >= %s
+  AND n.title IS NOT NULL AND n.title <> '';
+"""
+
+# Every active bookmark against the whole corpus (one-time backfill)
+ALL_BOOKMARK_PAIRS_QUERY = """
+SELECT b.user_id, b.url_id, o.title, c.url_id, c.title
+FROM bookmarks b
+JOIN urls_content o ON o.url_id = b.url_id
+JOIN urls_content c ON c.title %% o.title AND c.url_id <> o.url_id
+WHERE b.removed_at IS NULL;
+"""
+
+
+def match_bookmark_candidates(conn, since=None):
+    """
+    Store near-duplicates of active bookmarks in bookmark_candidates, which
+    /api/bookmarks_candidates reads directly. Only titles scraped at or after
+    `since` are matched; since=None matches every bookmark against the whole
+    corpus. The pg_trgm `%` join keeps this to a few pairs per new title; each
+    pair is then scored with fuzz.ratio.
+    """
+    if since is None:
+        query, params = ALL_BOOKMARK_PAIRS_QUERY, ()
+    else:
+        query, params = NEW_TITLE_BOOKMARK_PAIRS_QUERY, (since,)
+    insert_query = """
+    INSERT INTO bookmark_candidates (user_id, original_url_id, candidate_url_id, similarity)
+    VALUES %s
+    ON CONFLICT (user_id, original_url_id, candidate_url_id)
+    DO UPDATE SET similarity = EXCLUDED.similarity;
+    """
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT set_config('pg_trgm.similarity_threshold', %s, true)",
+                        (str(BOOKMARK_CANDIDATE_TRGM_THRESHOLD),))
+            cur.execute(query, params)
+            rows = []
+            for user_id, original_url_id, original_title, candidate_url_id, candidate_title in cur.fetchall():
+                similarity = fuzz.ratio(original_title, candidate_title)
+                if similarity >= BOOKMARK_CANDIDATE_SIMILARITY:
+                    rows.append((user_id, original_url_id, candidate_url_id, similarity))
+            if rows:
+                psycopg2.extras.execute_values(cur, insert_query, rows)
+            conn.commit()
+            print(f"[INFO] {len(rows)} bookmark candidates stored.")
+    except psycopg2.DatabaseError as e:
+        print(f"[ERROR] Could not match bookmark candidates: {e}")
+        conn.rollback()
+
+
 ###############################################################################
 #                                  Main Flow
 ###############################################################################
@@ -619,9 +733,11 @@ def main():
     conn = connect_db()
     if not conn:
         return
+    run_started = datetime.now()
 
     # Create needed tables if they don't exist
     create_unique_topics_table_if_not_exists(conn)
+    create_catalog_version_table_if_not_exists(conn)
     create_urls_table_if_not_exists(conn)
     create_urls_content_table_if_not_exists(conn)
 
@@ -657,7 +773,13 @@ def main():
 
     # 8. (Optional) - If you want to do a final check or printing of incomplete rows, do it here
 
-    # 9. Send email if new URLs appeared
+    # 9. Match titles scraped in this run against users' bookmarks
+    match_bookmark_candidates(conn, since=run_started)
+
+    # 10. Tell the API its cached topics/titles/dates are out of date
+    bump_catalog_version(conn)
+
+    # 11. Send email if new URLs appeared
     if new_urls:
         print(f"[INFO] New URLs found:\n{new_urls}")
         send_email(new_urls)
@@ -666,4 +788,11 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    if "--backfill-bookmark-candidates" in sys.argv:
+        # One-time fill of bookmark_candidates for bookmarks that predate it
+        backfill_conn = connect_db()
+        if backfill_conn:
+            match_bookmark_candidates(backfill_conn)
+            backfill_conn.close()
+    else:
+        main()